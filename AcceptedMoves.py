@@ -0,0 +1,126 @@
+"""
+The moves accepted as solution of a puzzle, keyed by the position (Zobrist hash, see AnalysisCache.positionKey).
+A move is accepted if it is one of the variations of the PGN solution or, for positions analysed by the engine,
+if its score (multi-PV search) is within a margin of the score of the best move. If the best move mates, every
+mating move is accepted. Checking a move is a dictionary lookup, no engine search is needed.
+"""
+from AnalysisCache import AnalysisCache
+
+defaultMargin = 50 # centipawns
+mateValue = 100000 # score of a mate in 0, see scoreValue
+
+
+def scoreValue(scoreCp, scoreMate):
+    """
+    Converts an engine score into one number, bigger is better
+    :param scoreCp: centipawns from the point of view of the side to move (or None)
+    :param scoreMate: moves until mate (or None), negative if the side to move is mated
+    :return: number
+    """
+    if scoreMate is not None:
+        return mateValue-scoreMate if scoreMate > 0 else -mateValue-scoreMate
+    return scoreCp if scoreCp is not None else 0
+
+
+def withinMargin(best, score, margin=defaultMargin):
+    """
+    Checks if a move is as good as the best move
+    :param best: (scoreCp, scoreMate) of the best move
+    :param score: (scoreCp, scoreMate) of the move
+    :param margin: centipawns
+    :return: bool
+    """
+    (bestValue, value) = (scoreValue(*best), scoreValue(*score))
+    if bestValue > mateValue//2: # the best move mates, other mates are as good
+        return value > mateValue//2
+    return value >= bestValue-margin
+
+
+class AcceptedMoves:
+    """
+    For every known position the set of accepted moves and the expected move (the main line of the PGN solution or
+    the best move of the engine), which is played as answer or shown after a wrong move.
+    """
+    def __init__(self, margin=defaultMargin):
+        """
+        :param margin: engine moves whose score is at most this number of centipawns below the best one are accepted
+        :return:-
+        """
+        self.margin = margin
+        self.positions = {} # position key:(frozenset of accepted moves, expected move)
+        self.nodes = {} # position key:node of the PGN solution
+
+    @classmethod
+    def fromGame(cls, game, margin=defaultMargin):
+        """
+        Collects the moves of all variations of a PGN solution
+        :param game: instance of chess.pgn.Game or None
+        :return: instance of AcceptedMoves
+        """
+        acceptedMoves = cls(margin)
+        if game is not None:
+            acceptedMoves.addGame(game)
+        return acceptedMoves
+
+    def addGame(self, game):
+        """
+        Adds the positions of a solution tree. The board is updated move by move, so each position is computed once.
+        :param game: instance of chess.pgn.Game
+        :return:
+        """
+        board = game.board()
+        stack = [game] # nodes to visit, None: take back the last move
+        while stack != []:
+            node = stack.pop()
+            if node is None:
+                board.pop()
+                continue
+            if node is not game:
+                board.push(node.move)
+                stack.append(None)
+            key = AnalysisCache.positionKey(board)
+            self.nodes.setdefault(key, node)
+            if node.variations != []:
+                (accepted, expected) = self.positions.get(key, (frozenset(), node.variations[0].move))
+                self.positions[key] = (accepted | frozenset(variation.move for variation in node.variations),
+                                       expected)
+            stack.extend(reversed(node.variations))
+
+    def addAnalysis(self, board, lines):
+        """
+        Adds the moves of a multi-PV search, unless the position is part of the PGN solution
+        :param board: instance of chess.Board, the analysed position
+        :param lines: list of (move, scoreCp, scoreMate), the best move first
+        :return:
+        """
+        key = AnalysisCache.positionKey(board)
+        if key in self.positions or lines == []:
+            return
+        best = lines[0][1:]
+        self.positions[key] = (frozenset(move for (move, scoreCp, scoreMate) in lines
+                                         if withinMargin(best, (scoreCp, scoreMate), self.margin)), lines[0][0])
+
+    def __contains__(self, board):
+        return AnalysisCache.positionKey(board) in self.positions
+
+    def accepts(self, board, move):
+        """
+        :param board: instance of chess.Board
+        :param move: instance of chess.Move
+        :return: True or False, None if the position is unknown
+        """
+        entry = self.positions.get(AnalysisCache.positionKey(board))
+        return None if entry is None else move in entry[0]
+
+    def expectedMove(self, board):
+        """
+        :return: the expected move in the position or None if it is unknown
+        """
+        entry = self.positions.get(AnalysisCache.positionKey(board))
+        return None if entry is None else entry[1]
+
+    def gameNode(self, board):
+        """
+        :return: the node of the PGN solution with the position or None
+        """
+        return self.nodes.get(AnalysisCache.positionKey(board))
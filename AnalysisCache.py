@@ -0,0 +1,182 @@
+import os
+import json
+import threading
+import sqlite3
+import collections
+import chess
+import chess.polyglot
+import chess.uci
+
+
+class SearchResult(chess.uci.BestMove):
+    """
+    Result of an engine search (see EngineService) with the lines of a multi-PV search
+    """
+    def __new__(cls, bestmove, ponder, lines=()):
+        """
+        :param lines: list of (first move, scoreCp, scoreMate), the best line first, see CachedAnalysis
+        """
+        result = super().__new__(cls, bestmove, ponder)
+        result.lines = list(lines)
+        return result
+
+
+class CachedAnalysis:
+    """
+    Result of an engine search stored in the AnalysisCache
+    """
+    def __init__(self, bestmove, ponder, scoreCp, scoreMate, depth, lines=()):
+        self.bestmove = bestmove
+        self.ponder = ponder
+        self.scoreCp = scoreCp # centipawns from the point of view of the side to move (or None)
+        self.scoreMate = scoreMate # moves until mate (or None)
+        self.depth = depth
+        self.lines = list(lines) # (first move, scoreCp, scoreMate) of every line of a multi-PV search
+
+    def toBestMove(self):
+        return SearchResult(self.bestmove, self.ponder, self.lines)
+
+
+class AnalysisCache:
+    """
+    Persistent cache of engine results (best move, ponder move, score, depth, multi-PV lines) keyed by the Zobrist hash of the
+    position (see chess.polyglot.zobrist_hash, move counters are ignored). The results are stored in a SQLite
+    database which is shared by all series folders, by default ~/.chesspuzzletrainer/analysis.sqlite (or the
+    environment variable CHESS_ANALYSIS_CACHE). The recently used entries are kept in memory as well.
+    If the cache contains more than maxEntries positions, the least recently used ones are removed.
+    """
+    defaultFilename = os.path.join(os.path.expanduser("~"), ".chesspuzzletrainer", "analysis.sqlite")
+
+    def __init__(self, filename=None, maxEntries=1000000, maxEntriesInMemory=10000):
+        """
+        :param filename: SQLite database, created if necessary
+        :param maxEntries: size of the cache on disk
+        :param maxEntriesInMemory: size of the cache in memory
+        :return:-
+        """
+        self.filename = filename or os.environ.get("CHESS_ANALYSIS_CACHE", self.defaultFilename)
+        if os.path.dirname(self.filename) != "" and not os.path.exists(os.path.dirname(self.filename)):
+            os.makedirs(os.path.dirname(self.filename))
+        self.maxEntries = maxEntries
+        self.maxEntriesInMemory = maxEntriesInMemory
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock() # the cache is used by the GUI and by the worker of the EngineService
+        self.database = sqlite3.connect(self.filename, check_same_thread=False)
+        self.database.execute("PRAGMA journal_mode=WAL")
+        self.database.execute("PRAGMA synchronous=NORMAL")
+        self.database.execute("CREATE TABLE IF NOT EXISTS analysis (hash INTEGER PRIMARY KEY, bestmove TEXT, "
+                              "ponder TEXT, scoreCp INTEGER, scoreMate INTEGER, depth INTEGER, lastUsed INTEGER)")
+        self.database.execute("CREATE INDEX IF NOT EXISTS analysisLastUsed ON analysis (lastUsed)")
+        if "lines" not in [column[1] for column in self.database.execute("PRAGMA table_info(analysis)")]:
+            self.database.execute("ALTER TABLE analysis ADD COLUMN lines TEXT") # caches of older versions
+        self.database.commit()
+        self.clock = self.database.execute("SELECT COALESCE(MAX(lastUsed), 0) FROM analysis").fetchone()[0]
+        self.numberOfEntries = self.database.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+        self.recentlyUsed = collections.OrderedDict() # hash:CachedAnalysis
+        self.usedEntries = {} # hash:clock, written to the database by flush
+
+    @staticmethod
+    def positionKey(board):
+        """
+        Zobrist hash of the position as signed 64 bit integer (the type of SQLite)
+        :param board: instance of chess.Board
+        :return: int
+        """
+        key = chess.polyglot.zobrist_hash(board)
+        return key-(1 << 64) if key >= (1 << 63) else key
+
+    def lookup(self, board, depth=0):
+        """
+        Returns the cached analysis of a position
+        :param board: instance of chess.Board
+        :param depth: minimal depth of the analysis
+        :return: instance of CachedAnalysis or None
+        """
+        key = self.positionKey(board)
+        with self.lock:
+            analysis = self.recentlyUsed.get(key)
+            if analysis is None:
+                row = self.database.execute("SELECT bestmove, ponder, scoreCp, scoreMate, depth, lines FROM "
+                                            "analysis WHERE hash = ?", (key,)).fetchone()
+                if row is not None:
+                    lines = [(chess.Move.from_uci(move), scoreCp, scoreMate)
+                             for (move, scoreCp, scoreMate) in json.loads(row[5] or "[]")]
+                    analysis = CachedAnalysis(chess.Move.from_uci(row[0]) if row[0] else None,
+                                              chess.Move.from_uci(row[1]) if row[1] else None, row[2], row[3], row[4],
+                                              lines)
+            if analysis is None or analysis.depth < depth or \
+                    (analysis.bestmove is not None and analysis.bestmove not in board.legal_moves): # hash collision
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__remember(key, analysis)
+            self.clock += 1
+            self.usedEntries[key] = self.clock
+            if len(self.usedEntries) >= 1000:
+                self.__flush()
+            return analysis
+
+    def store(self, board, bestmove, ponder=None, scoreCp=None, scoreMate=None, depth=0, lines=()):
+        """
+        Stores the result of a search
+        :param board: instance of chess.Board
+        :param bestmove: instance of chess.Move
+        :param ponder: instance of chess.Move or None
+        :param scoreCp: centipawns from the point of view of the side to move (or None)
+        :param scoreMate: moves until mate (or None)
+        :param depth: depth of the search
+        :param lines: list of (first move, scoreCp, scoreMate) of a multi-PV search
+        :return:
+        """
+        key = self.positionKey(board)
+        with self.lock:
+            self.clock += 1
+            self.usedEntries.pop(key, None)
+            if self.database.execute("SELECT 1 FROM analysis WHERE hash = ?", (key,)).fetchone() is None:
+                self.numberOfEntries += 1
+            self.database.execute("INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                  (key, bestmove.uci() if bestmove else None, ponder.uci() if ponder else None,
+                                   scoreCp, scoreMate, depth, self.clock,
+                                   json.dumps([(move.uci(), cp, mate) for (move, cp, mate) in lines])
+                                   if lines else None))
+            if self.numberOfEntries > self.maxEntries:
+                self.__evict()
+            self.database.commit()
+            self.__remember(key, CachedAnalysis(bestmove, ponder, scoreCp, scoreMate, depth, lines))
+
+    def __remember(self, key, analysis):
+        self.recentlyUsed[key] = analysis
+        self.recentlyUsed.move_to_end(key)
+        if len(self.recentlyUsed) > self.maxEntriesInMemory:
+            self.recentlyUsed.popitem(last=False)
+
+    def __evict(self):
+        """
+        Removes the least recently used tenth of the entries
+        :return:
+        """
+        self.__flush()
+        numberToRemove = self.numberOfEntries-int(self.maxEntries*0.9)
+        self.database.execute("DELETE FROM analysis WHERE hash IN "
+                              "(SELECT hash FROM analysis ORDER BY lastUsed LIMIT ?)", (numberToRemove,))
+        self.numberOfEntries -= numberToRemove
+        self.recentlyUsed.clear()
+
+    def __flush(self):
+        """
+        Writes the times of use of the cache hits into the database
+        :return:
+        """
+        self.database.executemany("UPDATE analysis SET lastUsed = ? WHERE hash = ?",
+                                  [(clock, key) for (key, clock) in self.usedEntries.items()])
+        self.database.commit()
+        self.usedEntries = {}
+
+    def close(self):
+        with self.lock:
+            self.__flush()
+            self.database.close()
+
+    def __str__(self):
+        return "Analysis cache: "+str(self.hits)+" hits, "+str(self.misses)+" misses"
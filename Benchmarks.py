@@ -0,0 +1,595 @@
+"""
+Benchmark suite for the chess puzzle trainer. Usage:
+
+    python3 Benchmarks.py run [--sizes 10000,100000,1000000] [--cases load,schedule,...] [--output results.json]
+    python3 Benchmarks.py compare old.json new.json [--tolerance 0.1]
+
+"run" generates synthetic series files of the given sizes with realistic solving histories (kept in --data, so
+later runs, e.g. of other commits, measure the same collections) and times the hot paths:
+
+    load       open a collection and present the first puzzle (index built from scratch, lazy and eager PGN parsing)
+    schedule   build the queues of a ScheduledPuzzleCollection and iterate over all puzzles once (both passes)
+    level      ReviewSchedule.getLevel for the history of every puzzle
+    save       answer 1% of the puzzles and fold the journal into the series file (savePuzzlesIntoFile)
+    render     MyChessBoard.draw_board under the SDL dummy video driver, no window is opened
+    validate   moves checked by MyChessBoard against the solution of the puzzles with PGN data
+    engine     moves checked by MyChessBoard with the fake engine (FakeUciEngine.py), no Stockfish needed
+    memory     bytes per puzzle kept in memory (decoded json, ChessPuzzle, ChessPuzzle with parsed solution)
+    startup    time to first puzzle: ChessPuzzleTrainer.py is started (SDL dummy video driver) until it shows the
+               first puzzle, including the start of the interpreter, imports and loading the collection
+
+The results are written as json (to stdout by default, the progress goes to stderr). "compare" prints the ratio of
+the times (or bytes) of two runs and exits with status 1 if a case became worse by more than the tolerance.
+"""
+import sys
+import os
+import json
+import time
+import math
+import random
+import shutil
+import itertools
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import contextlib
+import chess
+import chess.pgn
+from PuzzleCollection import PuzzleCollection, ScheduledPuzzleCollection, ReviewSchedule
+from PuzzleImporter import gameToPGN, sideToMove
+
+defaultSizes = [10000, 100000, 1000000]
+allCases = ["load", "schedule", "level", "save", "render", "validate", "engine", "memory", "startup"]
+
+# runs the trainer and reports when the display is updated for the first time, then the trainer is closed
+startupScript = """
+import os, sys, time, runpy, pygame
+def firstUpdate(*arguments):
+    print("first puzzle shown at %.6f" % time.time(), flush=True)
+    pygame.display.update = lambda *arguments: None
+    pygame.event.get = lambda *arguments: [pygame.event.Event(pygame.QUIT)]
+pygame.display.update = firstUpdate
+sys.argv = [sys.argv[1]]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def timeIt(function, repetitions, setup=None, teardown=None):
+    """
+    Calls function repetitions times
+    :param setup: called before each call (not timed), its result is passed to function and teardown
+    :param teardown: called after each call (not timed)
+    :return: the best wall clock time in seconds
+    """
+    times = []
+    for i in range(repetitions):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        if setup is not None:
+            function(state)
+        else:
+            function()
+        times += [time.perf_counter()-start]
+        if teardown is not None:
+            teardown(state)
+    return min(times)
+
+
+def randomPosition(random):
+    """
+    A position of a random game and, for most positions, a random continuation as solution
+    :param random: instance of random.Random
+    :return: json data of a puzzle without history
+    """
+    board = chess.Board()
+    for ply in range(random.randint(8, 40)):
+        moves = list(board.legal_moves)
+        if moves == []:
+            break
+        board.push(random.choice(moves))
+    if board.is_game_over():
+        return randomPosition(random)
+    game = chess.pgn.Game()
+    game.setup(board.copy(stack=False))
+    if random.random() < 0.6:
+        node = game
+        for ply in range(random.randint(1, 5)):
+            moves = list(node.board().legal_moves)
+            if moves == []:
+                break
+            node = node.add_variation(random.choice(moves))
+    return {"FEN": board.fen(), "description": sideToMove(board), "PGN": gameToPGN(game) if game.variations else ""}
+
+
+def randomHistory(random, schedule, today):
+    """
+    The results of a user who reviewed a puzzle according to the schedule until today
+    :param random: instance of random.Random
+    :param schedule: instance of ReviewSchedule
+    :param today: date ordinal
+    :return: (previousSolvingTimes, level)
+    """
+    previousSolvingTimes = []
+    level = 1
+    date = today-random.randint(0, 400)
+    for i in range(random.randint(1, 12)):
+        if random.random() < 0.85:
+            solved = round(random.lognormvariate(math.log(50), 0.8), 1)
+        else:
+            solved = "not solved"
+        previousSolvingTimes += [[str(datetime.date.fromordinal(date)), solved]]
+        level = schedule.getNextLevel(level, i, solved)
+        date += schedule.schedule[min(level, max(schedule.schedule))] if level > 0 else 1
+        if date > today:
+            break
+    return (previousSolvingTimes, level)
+
+
+def generateSyntheticSeries(filename, numberOfPuzzles, seed=0, numberOfPositions=1000):
+    """
+    Writes a series file with random positions (repeated if numberOfPuzzles is larger than numberOfPositions).
+    70% of the puzzles were reviewed before, with level and date of the last review as saved by the trainer.
+    :param filename: series file, overwritten
+    :param numberOfPuzzles: size of the collection
+    :param seed: the same seed gives the same file
+    :return: filename
+    """
+    generator = random.Random(seed)
+    schedule = ReviewSchedule()
+    today = datetime.date.today().toordinal()
+    positions = [randomPosition(generator) for i in range(numberOfPositions)]
+    seriesFile = open(filename+".tmp", 'w')
+    for i in range(numberOfPuzzles):
+        puzzleDict = dict(generator.choice(positions))
+        if generator.random() < 0.7:
+            (puzzleDict['previousSolvingTimes'], puzzleDict['level']) = randomHistory(generator, schedule, today)
+            puzzleDict['lastReview'] = puzzleDict['previousSolvingTimes'][-1][0]
+        seriesFile.write(json.dumps(puzzleDict)+"\n")
+    seriesFile.close()
+    os.replace(filename+".tmp", filename)
+    return filename
+
+
+def syntheticSeries(folder, numberOfPuzzles):
+    """
+    The synthetic series file of the given size in folder, generated if it doesn't exist
+    :return: name of the file
+    """
+    filename = os.path.join(folder, "synthetic"+str(numberOfPuzzles))
+    if not os.path.exists(filename):
+        print("Generating "+filename+"...", file=sys.stderr)
+        generateSyntheticSeries(filename, numberOfPuzzles)
+    return filename
+
+
+def removeSidecarFiles(filename):
+    for extension in [".idx", ".schedule", ".journal", "_solvingtimes"]:
+        if os.path.exists(filename+extension):
+            os.remove(filename+extension)
+
+
+def closeCollection(puzzleCollection):
+    puzzleCollection.puzzleFile.close()
+    puzzleCollection.journal.close()
+
+
+def benchmarkLoading(filename, repetitions=3):
+    """
+    Time needed to load a collection and present the first puzzle with eager and with lazy PGN parsing, and with
+    an index which has to be built first
+    :param filename: series file
+    :param repetitions: the best of repetitions runs is reported
+    :return: dictionary variant:seconds
+    """
+    def loadFirstPuzzle(lazy):
+        puzzleCollection = PuzzleCollection(filename, lazy)
+        next(puzzleCollection).game
+        closeCollection(puzzleCollection)
+
+    results = {"new index": timeIt(lambda state: loadFirstPuzzle(True), repetitions,
+                                   setup=lambda: removeSidecarFiles(filename))}
+    for (variant, lazy) in [("eager", False), ("lazy", True)]:
+        results[variant] = timeIt(lambda: loadFirstPuzzle(lazy), repetitions)
+    return results
+
+
+def benchmarkScheduling(filename, repetitions=3):
+    """
+    Time needed to build the queues of a ScheduledPuzzleCollection and to iterate over all puzzles once
+    :param filename: series file
+    :return: dictionary variant:(seconds, number of presented puzzles)
+    """
+    presented = []
+
+    def iterate(puzzleCollection):
+        presented[:] = [sum(1 for puzzle in puzzleCollection)]
+        closeCollection(puzzleCollection)
+
+    build = timeIt(lambda: closeCollection(ScheduledPuzzleCollection(filename)), repetitions)
+    iteration = timeIt(iterate, repetitions, setup=lambda: ScheduledPuzzleCollection(filename))
+    return {"queues": (build, len(open(filename).readlines())), "pass": (iteration, presented[0])}
+
+
+def benchmarkLevels(filename, repetitions=3):
+    """
+    Time needed to compute the levels of all puzzles from their histories
+    :param filename: series file
+    :return: (seconds, number of histories)
+    """
+    histories = []
+    with open(filename) as seriesFile:
+        for line in seriesFile:
+            previousSolvingTimes = json.loads(line).get('previousSolvingTimes', [])
+            if previousSolvingTimes != []:
+                histories += [previousSolvingTimes]
+    schedule = ReviewSchedule()
+    return (timeIt(lambda: [schedule.getLevel(history) for history in histories], repetitions), len(histories))
+
+
+def benchmarkSaving(filename, repetitions=3, answered=0.01):
+    """
+    Time needed to save a collection after a part of the puzzles was answered: the journal is folded into a copy
+    of the series file
+    :param filename: series file
+    :param answered: fraction of the puzzles answered before saving
+    :return: (seconds, number of puzzles)
+    """
+    scratchFilename = filename+".save"
+
+    def setup():
+        shutil.copyfile(filename, scratchFilename)
+        puzzleCollection = ScheduledPuzzleCollection(scratchFilename, compactAfter=sys.maxsize)
+        for i in range(max(1, int(len(puzzleCollection)*answered))):
+            puzzle = next(puzzleCollection)
+            if i % 5 == 0:
+                puzzle.markPuzzleAsSolvedIncorrectly()
+            else:
+                puzzle.markPuzzleAsSolvedCorrectly()
+        puzzleCollection.compactAfter = 1
+        return puzzleCollection
+
+    def teardown(puzzleCollection):
+        closeCollection(puzzleCollection)
+        os.remove(scratchFilename)
+        removeSidecarFiles(scratchFilename)
+
+    seconds = timeIt(lambda puzzleCollection: puzzleCollection.savePuzzlesIntoFile(), repetitions, setup, teardown)
+    return (seconds, len(open(filename).readlines()))
+
+
+def benchmarkRendering(numberOfFrames=300, screenSize=500):
+    """
+    Measures the time per frame for redrawing the board after a move. Compared are
+    - loading and scaling the images of all figures for each frame and showing the complete screen (as done before
+      the sprites were cached),
+    - a complete redraw with cached sprites,
+    - redrawing only the squares changed by the move.
+    :param numberOfFrames: number of moves played on the board
+    :param screenSize: size of the board in pixels
+    :return: dictionary variant:seconds per frame
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from MyChessBoard import MyChessBoard, figure_pngs
+    pygame.init()
+    screen = pygame.display.set_mode((screenSize, screenSize))
+    boardGUI = MyChessBoard(screenSize, chess.Board(), screen)
+    random.seed(0)
+    sizeRect = screenSize/8
+
+    def playMove():
+        if boardGUI.board.is_game_over():
+            boardGUI.loadNewPosition(chess.Board())
+        boardGUI.board.push(random.choice(list(boardGUI.board.legal_moves)))
+
+    def uncachedFrame():
+        playMove()
+        screen.blit(boardGUI.emptyBoard, (0, 0))
+        for (square, piece) in boardGUI.board.piece_map().items():
+            figure = pygame.image.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chessPictures',
+                                                    figure_pngs[str(piece)]))
+            figure = pygame.transform.scale(figure, (int(sizeRect), int(sizeRect)))
+            screen.blit(figure, pygame.Rect((square%8)*sizeRect, (7-square//8)*sizeRect, sizeRect, sizeRect))
+        pygame.display.flip()
+
+    def fullFrame():
+        playMove()
+        boardGUI.invalidate()
+        boardGUI.draw_board()
+        boardGUI.updateDisplay()
+
+    def incrementalFrame():
+        playMove()
+        boardGUI.draw_board()
+        boardGUI.updateDisplay()
+
+    results = {}
+    for (variant, frame) in [("uncached", uncachedFrame), ("full redraw", fullFrame),
+                             ("dirty squares", incrementalFrame)]:
+        boardGUI.loadNewPosition(chess.Board())
+        results[variant] = timeIt(lambda: [frame() for i in range(numberOfFrames)], 1)/numberOfFrames
+    pygame.quit()
+    return results
+
+
+def solvePuzzles(boardGUI, puzzles):
+    """
+    Plays the moves of the user and the answers of the opponent as in the trainer, without reply delay
+    :param boardGUI: headless instance of MyChessBoard
+    :param puzzles: list of (chess.Board, list of the moves of the user, game or None)
+    :return: number of validated moves
+    """
+    validatedMoves = 0
+    for (board, moves, game) in puzzles:
+        boardGUI.loadNewPosition(board.copy(), game)
+        for move in moves:
+            boardGUI.submitMove(move)
+            boardGUI.requestSuggestion().result()
+            boardGUI.update() # validates and plays the move
+            validatedMoves += 1
+            if boardGUI.pendingMove is not None or boardGUI.replyTime is None:
+                break
+            boardGUI.requestSuggestion().result()
+            boardGUI.update() # the answer
+    return validatedMoves
+
+
+def benchmarkValidation(filename, numberOfPuzzles=500, repetitions=3):
+    """
+    Time needed to check the moves of the user against the PGN solutions (the main line is played)
+    :param filename: series file
+    :return: (seconds, number of validated moves)
+    """
+    from MyChessBoard import MyChessBoard
+    from PuzzleDeduplication import parseSolution
+    puzzles = []
+    with open(filename) as seriesFile:
+        for line in seriesFile:
+            puzzleDict = json.loads(line)
+            if puzzleDict.get('PGN', "") != "":
+                game = parseSolution(puzzleDict)
+                mainLine = list(game.main_line())
+                puzzles += [(game.board(), mainLine[::2], game)]
+            if len(puzzles) == numberOfPuzzles:
+                break
+    boardGUI = MyChessBoard(400, chess.Board(), None, replyDelay=0)
+    validatedMoves = []
+    seconds = timeIt(lambda: validatedMoves.append(solvePuzzles(boardGUI, puzzles)), repetitions)
+    return (seconds, validatedMoves[0])
+
+
+def benchmarkEngineValidation(filename, numberOfPuzzles=200, repetitions=3):
+    """
+    Time needed to check the moves of the user with an engine, i.e. the round trip through EngineService. The fake
+    engine answers immediately, so the overhead of the program is measured. Every puzzle without PGN data gets one
+    move (the first legal one), the results are not cached.
+    :param filename: series file
+    :return: (seconds, number of validated moves)
+    """
+    from MyChessBoard import MyChessBoard
+    from EngineService import EngineService
+    puzzles = []
+    with open(filename) as seriesFile:
+        for line in seriesFile:
+            puzzleDict = json.loads(line)
+            if puzzleDict.get('PGN', "") == "":
+                board = chess.Board(puzzleDict['FEN'])
+                puzzles += [(board, [next(iter(board.legal_moves))], None)]
+            if len(puzzles) == numberOfPuzzles:
+                break
+    engineService = EngineService(os.path.join(os.path.dirname(os.path.abspath(__file__)), "FakeUciEngine.py"))
+    boardGUI = MyChessBoard(400, chess.Board(), None, engineService=engineService, replyDelay=0)
+    boardGUI.requestSuggestion().result() # start the engine
+    validatedMoves = []
+    try:
+        seconds = timeIt(lambda: validatedMoves.append(solvePuzzles(boardGUI, puzzles)), repetitions)
+    finally:
+        engineService.quit()
+    return (seconds, validatedMoves[0])
+
+
+def benchmarkMemory(filename, maxPuzzles=100000, maxParsedPuzzles=10000):
+    """
+    Memory needed by the puzzles a collection keeps in memory (see PuzzleCollection.loadedPuzzles), measured with
+    tracemalloc. The decoded json data is the representation used by ChessPuzzle before it became compact.
+    :param filename: series file
+    :param maxPuzzles: number of puzzles read from the file
+    :param maxParsedPuzzles: number of puzzles whose solution tree is parsed
+    :return: dictionary variant:(bytes, number of puzzles)
+    """
+    import tracemalloc
+    from PuzzleCollection import ChessPuzzle
+    with open(filename) as seriesFile:
+        lines = list(itertools.islice(seriesFile, maxPuzzles))
+
+    def measure(create, lines):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        puzzles = [create(line) for line in lines]
+        used = tracemalloc.get_traced_memory()[0]-before
+        tracemalloc.stop()
+        return (used, len(puzzles))
+
+    def parsedPuzzle(line):
+        puzzle = ChessPuzzle(line)
+        puzzle.game
+        return puzzle
+
+    return {"json dict": measure(json.loads, lines), "ChessPuzzle": measure(ChessPuzzle, lines),
+            "parsed PGN": measure(parsedPuzzle, lines[:maxParsedPuzzles])}
+
+
+def benchmarkStartup(filename, repetitions=3):
+    """
+    Time from starting ChessPuzzleTrainer.py until the first puzzle is shown, measured in a new process each time.
+    The trainer reads a folder with a link to the series file, the index of the file is built by a first run which
+    isn't timed. The fake engine is used if the first puzzle has no PGN data.
+    :param filename: series file
+    :return: seconds
+    """
+    trainer = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ChessPuzzleTrainer.py")
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy",
+                       CHESS_ENGINE=os.path.join(os.path.dirname(trainer), "FakeUciEngine.py"))
+    environment.pop("CHESS_TRACE", None)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(filename))) as folder:
+        os.mkdir(os.path.join(folder, "startup"))
+        try:
+            os.link(filename, os.path.join(folder, "startup", "startup1"))
+        except OSError:
+            shutil.copyfile(filename, os.path.join(folder, "startup", "startup1"))
+        environment["CHESS_ANALYSIS_CACHE"] = os.path.join(folder, "analysis.sqlite")
+
+        def startTrainer():
+            start = time.time()
+            process = subprocess.run([sys.executable, "-c", startupScript, trainer], input="startup\n",
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=folder, env=environment,
+                                     universal_newlines=True)
+            shown = [line for line in process.stdout.splitlines() if line.startswith("first puzzle shown at ")]
+            if shown == []:
+                raise RuntimeError("the trainer didn't show a puzzle: "+(process.stdout+process.stderr)[-1000:])
+            return float(shown[0].split()[-1])-start
+
+        startTrainer() # builds the index
+        return min(startTrainer() for i in range(repetitions))
+
+
+def currentCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def runBenchmarks(sizes, cases, folder, repetitions=3):
+    """
+    Runs the selected cases for the collections of all sizes. Cases which don't depend on the size of the
+    collection use the smallest one.
+    :param sizes: list of numbers of puzzles
+    :param cases: list of names, see allCases
+    :param folder: where the synthetic series files are kept
+    :return: json data: information about the run and a list of results (case, variant, puzzles, seconds,
+    operations), seconds is the best time for all operations
+    """
+    results = []
+
+    def report(case, variant, puzzles, value, operations, unit="seconds"):
+        results.append({"case": case, "variant": variant, "puzzles": puzzles, unit: value,
+                        "operations": operations})
+        if unit == "bytes":
+            print("%-9s %-14s %9s  %10d B  %10.1f B/op" % (case, variant, puzzles or "-", value,
+                                                           value/max(1, operations)), file=sys.stderr)
+        else:
+            print("%-9s %-14s %9s  %10.4f s  %10.2f us/op" % (case, variant, puzzles or "-", value,
+                                                              value/max(1, operations)*1e6), file=sys.stderr)
+
+    output = open(os.devnull, 'w') # the collections report their progress on stdout
+    sizes = sorted(sizes)
+    filenames = {size: syntheticSeries(folder, size) for size in sizes}
+    for size in sizes:
+        filename = filenames[size]
+        with contextlib.redirect_stdout(output):
+            if "load" in cases:
+                for (variant, seconds) in benchmarkLoading(filename, repetitions).items():
+                    report("load", variant, size, seconds, 1)
+            if "schedule" in cases:
+                for (variant, (seconds, operations)) in benchmarkScheduling(filename, repetitions).items():
+                    report("schedule", variant, size, seconds, operations)
+            if "level" in cases:
+                report("level", "getLevel", size, *benchmarkLevels(filename, repetitions))
+            if "save" in cases:
+                report("save", "compact", size, *benchmarkSaving(filename, repetitions))
+            if "memory" in cases:
+                for (variant, (numberOfBytes, operations)) in benchmarkMemory(filename).items():
+                    report("memory", variant, size, numberOfBytes, operations, unit="bytes")
+            if "startup" in cases:
+                report("startup", "first puzzle", size, benchmarkStartup(filename, repetitions), 1)
+    with contextlib.redirect_stdout(output):
+        if "render" in cases:
+            for (variant, seconds) in benchmarkRendering().items():
+                report("render", variant, None, seconds, 1)
+        if "validate" in cases:
+            report("validate", "pgn", None, *benchmarkValidation(filenames[sizes[0]], repetitions=repetitions))
+        if "engine" in cases:
+            report("engine", "fake engine", None,
+                   *benchmarkEngineValidation(filenames[sizes[0]], repetitions=repetitions))
+    output.close()
+    return {"commit": currentCommit(), "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "repetitions": repetitions, "results": results}
+
+
+def compareResults(old, new, tolerance=0.1):
+    """
+    Prints the time (or memory) per operation of every case of two runs and their ratio
+    :param old: json data of runBenchmarks
+    :param new: json data of runBenchmarks
+    :param tolerance: a case with new/old > 1+tolerance is a regression
+    :return: number of regressions
+    """
+    def key(result):
+        return (result["case"], result["variant"], result["puzzles"])
+    oldResults = {key(result): result for result in old["results"]}
+    regressions = 0
+    print("%-9s %-14s %9s  %12s  %12s  %6s" % ("case", "variant", "puzzles", str(old.get("commit")),
+                                               str(new.get("commit")), "ratio"))
+    for result in new["results"]:
+        if key(result) not in oldResults:
+            continue
+        oldResult = oldResults[key(result)]
+        (unit, scale, suffix) = ("bytes", 1, "B ") if "bytes" in result else ("seconds", 1e6, "us")
+        if unit not in oldResult:
+            continue
+        oldValue = oldResult[unit]/max(1, oldResult["operations"])
+        newValue = result[unit]/max(1, result["operations"])
+        ratio = newValue/oldValue if oldValue > 0 else float("inf")
+        regression = ratio > 1+tolerance
+        regressions += regression
+        print("%-9s %-14s %9s  %10.2f%s  %10.2f%s  %6.2f%s" % (result["case"], result["variant"],
+                                                            result["puzzles"] or "-", oldValue*scale, suffix,
+                                                            newValue*scale, suffix, ratio,
+                                                            "  worse" if regression else ""))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the chess puzzle trainer")
+    commands = parser.add_subparsers(dest="command")
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument("--sizes", default=",".join(map(str, defaultSizes)), help="numbers of puzzles")
+    run.add_argument("--cases", default=",".join(allCases), help=",".join(allCases))
+    run.add_argument("--repetitions", type=int, default=3, help="the best time is reported")
+    run.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "chesspuzzletrainer-benchmarks"),
+                     help="folder of the synthetic collections")
+    run.add_argument("--output", default=None, help="json file, default: stdout")
+    compare = commands.add_parser("compare", help="compare two runs")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--tolerance", type=float, default=0.1)
+    options = parser.parse_args()
+
+    if options.command == "run":
+        cases = options.cases.split(",")
+        unknownCases = [case for case in cases if case not in allCases]
+        if unknownCases != []:
+            parser.error("unknown cases "+",".join(unknownCases))
+        os.makedirs(options.data, exist_ok=True)
+        benchmarkResults = runBenchmarks([int(size) for size in options.sizes.split(",")], cases, options.data,
+                                         options.repetitions)
+        if options.output is None:
+            json.dump(benchmarkResults, sys.stdout, indent=1)
+            print()
+        else:
+            with open(options.output, 'w') as outputFile:
+                json.dump(benchmarkResults, outputFile, indent=1)
+    elif options.command == "compare":
+        with open(options.old) as oldFile, open(options.new) as newFile:
+            if compareResults(json.load(oldFile), json.load(newFile), options.tolerance) > 0:
+                raise SystemExit(1)
+    else:
+        print(__doc__)
+        raise SystemExit(1)
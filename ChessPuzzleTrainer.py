@@ -1,7 +1,10 @@
 import pygame
 import chess
-from chess import uci
 from MyChessBoard import MyChessBoard
+from EngineService import EngineService
+from AnalysisCache import AnalysisCache
+from PuzzlePrefetcher import PuzzlePrefetcher
+import Instrumentation
 import time
 from PuzzleCollection import ScheduledPuzzleCollection
 import os.path
@@ -10,6 +13,7 @@ import datetime
 def returnCurrentFile(folder):
     """
     For a given folder it searches for the latest problem file
+    (older versions of the program saved the results of each session in a new file)
     :param folder:
     :return: None if no file found otherwise the name
     """
@@ -21,70 +25,94 @@ def returnCurrentFile(folder):
         else:
             break
         counter += 1
-    if current_filename == None:
-        return None
-    else:
-        return (current_filename, folder+str(counter))
+    return current_filename
 
 screenSize = 500
-pygame.init()
+pygame.display.init() # the other modules of pygame (e.g. audio) are not used
 screen = pygame.display.set_mode((screenSize, screenSize))
 pygame.display.set_caption("Chess Puzzles")
 done = False
 trainingTime = time.time()
 
-folder = input("Name of folder: ")
-infile, outfile = returnCurrentFile(folder+"/"+folder)
+folder = input("Name of folder (or of a .sqlite database): ")
+if folder.endswith(".sqlite"):
+    infile = folder
+    folder = os.path.dirname(infile) or "."
+    if not os.path.exists(infile):
+        print("No puzzle database "+infile)
+        raise SystemExit
+else:
+    infile = returnCurrentFile(folder+"/"+folder)
+    if infile == None:
+        print("No puzzle file found in "+folder)
+        raise SystemExit
 print("Loading file")
-time.sleep(10)
 
 try:
-    puzzleCollection = ScheduledPuzzleCollection(infile, outfile)
+    with Instrumentation.span("collection load"):
+        if infile.endswith(".sqlite"):
+            from SqlitePuzzleCollection import SqlitePuzzleCollection # only needed for databases
+            puzzleCollection = SqlitePuzzleCollection(infile)
+        else:
+            newPuzzleSelection = None
+            if os.environ.get("CHESS_NEW_PUZZLES"): # order and tags of the new puzzles, see PuzzleRating
+                from PuzzleRating import NewPuzzleSelection
+                newPuzzleSelection = NewPuzzleSelection.fromSpecification(infile, os.environ["CHESS_NEW_PUZZLES"])
+            puzzleCollection = ScheduledPuzzleCollection(infile, newPuzzleSelection=newPuzzleSelection)
     puzzleIterator = iter(puzzleCollection)
     currentChessPuzzle = next(puzzleIterator)
 except StopIteration:
     print("No puzzle_collection to solve")
     raise SystemExit
+except ValueError as error: # e.g. an unknown tag in CHESS_NEW_PUZZLES
+    print(error)
+    raise SystemExit
 
 pygame.display.set_caption(currentChessPuzzle.puzzleDict["description"])
-boardGUI = MyChessBoard(screenSize, chess.Board(currentChessPuzzle.FEN), screen, game=currentChessPuzzle.game)
-
-# Load chess engine
-engine = chess.uci.popen_engine("/usr/games/stockfish")
-engine.uci()
-engine.position(boardGUI.board)
+analysisCache = AnalysisCache() # engine results of all sessions
+engineService = EngineService(cache=analysisCache, multiPV=3) # one engine for the whole program
+boardGUI = MyChessBoard(screenSize, chess.Board(currentChessPuzzle.FEN), screen, game=currentChessPuzzle.game,
+                        engineService=engineService)
+boardGUI.updateDisplay() # show the first puzzle before the next one is prepared (which may start the engine)
+clock = pygame.time.Clock()
+prefetcher = PuzzlePrefetcher(puzzleCollection, boardGUI, engineService) # prepares the next puzzle in the background
+prefetcher.prefetch()
 
 def loadNextPuzzle():
     try:
+        start = time.perf_counter()
         currentChessPuzzle = next(puzzleIterator)
         #print("NächstesPuzzle")
         #print(currentChessPuzzle.game)
-        boardGUI.loadNewPosition(chess.Board(currentChessPuzzle.FEN), currentChessPuzzle.game)
+        preparedPuzzle = prefetcher.take(currentChessPuzzle)
+        if preparedPuzzle is not None:
+            boardGUI.loadNewPosition(preparedPuzzle.board, currentChessPuzzle.game, preparedPuzzle.surface,
+                                     preparedPuzzle.suggestion)
+        else:
+            boardGUI.loadNewPosition(chess.Board(currentChessPuzzle.FEN), currentChessPuzzle.game)
         boardGUI.draw_board()
         if 'description' in currentChessPuzzle.puzzleDict:
             pygame.display.set_caption(currentChessPuzzle.puzzleDict["description"])
         else:
             pygame.display.set_caption("No description")
+        prefetcher.prefetch()
+        Instrumentation.record("next puzzle", start, time.perf_counter()-start)
         return (False, currentChessPuzzle)
     except StopIteration:
         return (True, None)
 
 while not done:
+        frameStart = time.perf_counter()
         for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                         done = True
                         puzzleCollection.savePuzzlesIntoFile() # save results
+                if event.type == pygame.VIDEOEXPOSE:
+                    boardGUI.invalidate() # the window content was lost
+                    boardGUI.draw_board()
                 if event.type == pygame.MOUSEBUTTONUP:
                     pos = pygame.mouse.get_pos()
-                    is_moved = boardGUI.detectMove(pos)
-                    boardGUI.draw_board()
-
-                    if is_moved:
-                        pygame.display.flip()
-                        time.sleep(0.5)
-                        best = boardGUI.suggestMove() # returns the node with the move
-                        boardGUI.move_figure(best)
-                        boardGUI.draw_board()
+                    boardGUI.detectMove(pos) # the move is validated in boardGUI.update()
 
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
@@ -112,8 +140,17 @@ while not done:
                         print("d - delete the current puzzle")
                         print("w - wrongly solved")
 
-        pygame.display.flip()
+        if boardGUI.update(): # a move was played
+            boardGUI.draw_board()
+        boardGUI.updateDisplay()
+        Instrumentation.record("frame", frameStart, time.perf_counter()-frameStart)
+        clock.tick(60) # don't take the cpu away from the engine
 
+prefetcher.close()
+engineService.quit()
+print(analysisCache)
+analysisCache.close()
+Instrumentation.tracer.finish()
 file_for_trainingTimes = open(folder+"/"+"trainingTimes", 'a')
 print(folder+"/"+"trainingTimes")
 trainingTime = time.time()-trainingTime
@@ -0,0 +1,260 @@
+import os
+import time
+import threading
+import queue
+import concurrent.futures
+import chess
+import chess.uci
+import Instrumentation
+from AnalysisCache import SearchResult
+
+
+class EngineService:
+    """
+    One chess engine shared by the whole program. Searches are queued and run on a worker thread, so the GUI keeps
+    handling events while the engine is thinking. Each search is represented by a concurrent.futures.Future whose
+    result is a SearchResult (a chess.uci.BestMove with the lines of a multi-PV search, the best line first, see
+    AcceptedMoves). Searches which are no longer needed can be cancelled, a running search is
+    stopped. Background searches (e.g. for prefetched puzzles) only run if no other search is waiting.
+    If an AnalysisCache is given, it is consulted before each search and the results of the searches are stored.
+    The engine is started with the first search. Its path can be given by the environment variable CHESS_ENGINE.
+    """
+    defaultEnginePath = "/usr/games/stockfish"
+
+    def __init__(self, enginePath=None, depth=15, cache=None, multiPV=1):
+        """
+        :param enginePath: executable of an UCI engine
+        :param depth: default search depth
+        :param cache: instance of AnalysisCache or None
+        :param multiPV: number of lines searched (UCI option MultiPV, ignored if the engine doesn't support it)
+        :return:-
+        """
+        self.enginePath = enginePath or os.environ.get("CHESS_ENGINE", self.defaultEnginePath)
+        self.depth = depth
+        self.multiPV = multiPV
+        self.cache = cache
+        self.engine = None
+        self.infoHandler = chess.uci.InfoHandler() # score and depth of the searches
+        # (priority, number, future, board, depth, time of the request), future None stops the worker
+        self.requests = queue.PriorityQueue()
+        self.numberOfRequests = 0 # searches with the same priority run in the order of their requests
+        self.lock = threading.Lock()
+        self.currentSearch = None # future of the running search
+        self.currentPriority = None
+        self.stopRequested = False # the running search is cancelled
+        self.interrupted = False # the running background search is repeated later
+        self.searching = False # the engine received the go command of the running search
+        self.cancelledSearches = set() # interrupted searches cancelled while waiting for their repetition
+        self.worker = threading.Thread(target=self.__work, daemon=True)
+        self.worker.start()
+
+    def analyse(self, board, depth=None, background=False):
+        """
+        Queues a search for the best move in a position
+        :param board: instance of chess.Board, it is copied
+        :param depth: search depth, default see constructor
+        :param background: if True, the search waits for all other searches. A running background search is
+        interrupted by a new search and repeated afterwards.
+        :return: concurrent.futures.Future with a SearchResult
+        """
+        future = concurrent.futures.Future()
+        if self.cache is not None:
+            analysis = self.cache.lookup(board, depth or self.depth)
+            if analysis is not None:
+                future.set_result(analysis.toBestMove())
+                return future
+        priority = 1 if background else 0
+        with self.lock:
+            self.numberOfRequests += 1
+            self.requests.put((priority, self.numberOfRequests, future, board.copy(), depth or self.depth,
+                               time.perf_counter()))
+            if self.currentSearch is not None and self.currentPriority > priority and not self.stopRequested \
+                    and not self.interrupted:
+                self.interrupted = True
+                if self.searching:
+                    self.engine.stop(async_callback=True)
+        return future
+
+    def cancel(self, future):
+        """
+        Cancels a search. A queued search is dropped, a running one is stopped.
+        :param future: as returned by analyse
+        :return:
+        """
+        with self.lock:
+            if future.cancel():
+                return
+            if future is self.currentSearch:
+                self.__stopCurrentSearch()
+            elif future.running(): # interrupted, waiting for its repetition
+                self.cancelledSearches.add(future)
+
+    def quit(self):
+        """
+        Stops the worker and the engine
+        :return:
+        """
+        with self.lock:
+            if self.currentSearch is not None:
+                self.__stopCurrentSearch()
+        self.requests.put((2, 0, None, None, None, None))
+        self.worker.join()
+        if self.engine is not None:
+            self.engine.quit()
+
+    def __stopCurrentSearch(self):
+        """
+        The result of the running search is discarded. Has to be called with self.lock acquired.
+        :return:
+        """
+        if not self.stopRequested:
+            self.stopRequested = True
+            if self.searching and not self.interrupted:
+                self.engine.stop(async_callback=True) # don't wait for the engine
+
+    def __startEngine(self):
+        self.engine = chess.uci.popen_engine(self.enginePath)
+        self.engine.uci()
+        if self.multiPV > 1 and "MultiPV" in self.engine.options:
+            self.engine.setoption({"MultiPV": self.multiPV})
+        self.engine.info_handlers.append(self.infoHandler)
+
+    def __searchResult(self, result):
+        """
+        Adds the first moves and scores of the lines of the last search to its result
+        :param result: chess.uci.BestMove
+        :return: SearchResult
+        """
+        with self.infoHandler as info:
+            pvs = info.get("pv", {})
+            scores = info.get("score", {})
+            lines = [(pvs[number][0], scores[number].cp, scores[number].mate) for number in sorted(pvs)
+                     if pvs[number] and number in scores]
+        if lines == [] or lines[0][0] != result.bestmove: # e.g. a stopped search
+            lines = []
+        return SearchResult(result.bestmove, result.ponder, lines)
+
+    def __storeInCache(self, board, result):
+        with self.infoHandler as info:
+            score = info.get("score", {}).get(1)
+            depth = info.get("depth", 0)
+        self.cache.store(board, result.bestmove, result.ponder, score.cp if score else None,
+                         score.mate if score else None, depth, result.lines)
+
+    def __recordSearch(self, requestTime, searchStart, depth, background):
+        """
+        Records the latency of a search, from the request until the result, for the trace of the session
+        """
+        with self.infoHandler as info:
+            depthReached = info.get("depth", 0)
+        now = time.perf_counter()
+        Instrumentation.record("engine search", requestTime, now-requestTime, depth=depthReached,
+                               requestedDepth=depth, background=background, search=now-searchStart)
+
+    def __work(self):
+        """
+        Runs the queued searches one after another
+        :return:
+        """
+        while True:
+            request = self.requests.get()
+            (priority, number, future, board, depth, requestTime) = request
+            if future is None:
+                break
+            with self.lock:
+                if future in self.cancelledSearches:
+                    self.cancelledSearches.remove(future)
+                    future.set_exception(concurrent.futures.CancelledError())
+                    continue
+                if not future.running() and not future.set_running_or_notify_cancel():
+                    continue # cancelled while queued
+                self.currentSearch = future
+                self.currentPriority = priority
+                self.stopRequested = False
+                self.interrupted = False
+            try:
+                if self.engine is None:
+                    self.__startEngine()
+                self.engine.position(board)
+                searchStart = time.perf_counter()
+                search = self.engine.go(depth=depth, async_callback=True)
+                # chess.uci deadlocks if stop is queued before the go command was sent, so stop requests which
+                # arrive earlier are sent here
+                while not search.done() and not self.engine.search_started.wait(0.05):
+                    pass
+                with self.lock:
+                    self.searching = True
+                    if self.stopRequested or self.interrupted:
+                        self.engine.stop(async_callback=True)
+                result = search.result()
+            except Exception as exception:
+                with self.lock:
+                    self.currentSearch = None
+                    self.searching = False
+                future.set_exception(exception)
+                continue
+            with self.lock:
+                self.currentSearch = None
+                self.searching = False
+                stopped = self.stopRequested
+                if self.interrupted and not stopped:
+                    self.requests.put(request) # repeat the background search later
+                    continue
+            if stopped:
+                future.set_exception(concurrent.futures.CancelledError())
+            else:
+                result = self.__searchResult(result)
+                if self.cache is not None and result.bestmove is not None:
+                    self.__storeInCache(board, result)
+                if Instrumentation.tracer.enabled:
+                    self.__recordSearch(requestTime, searchStart, depth, priority > 0)
+                future.set_result(result)
+
+
+class EnginePool:
+    """
+    Several engines with the interface of EngineService, for many concurrent users. A search is run by the engine
+    with the fewest unfinished searches. The engines share the analysis cache.
+    """
+    def __init__(self, numberOfEngines, enginePath=None, depth=15, cache=None, multiPV=1):
+        """
+        :param numberOfEngines: number of engine processes, they are started with their first search
+        :param enginePath: see EngineService
+        :param depth: default search depth
+        :param cache: instance of AnalysisCache or None
+        :param multiPV: see EngineService
+        :return:-
+        """
+        self.services = [EngineService(enginePath, depth, cache, multiPV) for i in range(numberOfEngines)]
+        self.lock = threading.Lock()
+        self.searches = {} # future:EngineService of the unfinished searches
+
+    def analyse(self, board, depth=None, background=False):
+        """
+        Queues a search on the least busy engine, see EngineService.analyse
+        :return: concurrent.futures.Future with a SearchResult
+        """
+        with self.lock:
+            load = dict((service, 0) for service in self.services)
+            for service in self.searches.values():
+                load[service] += 1
+            service = min(self.services, key=lambda service: load[service])
+            future = service.analyse(board, depth, background)
+            if not future.done(): # not found in the cache
+                self.searches[future] = service
+        future.add_done_callback(self.__searchFinished)
+        return future
+
+    def __searchFinished(self, future):
+        with self.lock:
+            self.searches.pop(future, None)
+
+    def cancel(self, future):
+        with self.lock:
+            service = self.searches.get(future)
+        if service is not None:
+            service.cancel(future)
+
+    def quit(self):
+        for service in self.services:
+            service.quit()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+A minimal UCI engine for testing the program without Stockfish. It doesn't search, it prefers mates, then captures
+of valuable pieces, then checks. Usage:
+
+    CHESS_ENGINE=./FakeUciEngine.py python3 ChessPuzzleTrainer.py
+
+The environment variable FAKE_UCI_ENGINE_DELAY (seconds, default 0) simulates the thinking time of a real engine.
+A search can be interrupted with "stop".
+"""
+import os
+import sys
+import threading
+import chess
+
+pieceValues = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9, chess.KING: 0}
+
+
+def rateMove(board, move):
+    """
+    A simple rating of a move, bigger is better
+    :param board: instance of chess.Board
+    :param move: legal move
+    :return: tuple, compared lexicographically
+    """
+    captured = board.piece_at(move.to_square)
+    board.push(move)
+    rating = (board.is_checkmate(), pieceValues[captured.piece_type] if captured is not None else 0, board.is_check())
+    board.pop()
+    return rating
+
+
+def rankedMoves(board):
+    """
+    All legal moves, the best first. Ties are broken by the uci string to be deterministic.
+    """
+    moves = sorted(board.legal_moves, key=lambda move: move.uci())
+    return sorted(moves, key=lambda move: rateMove(board, move), reverse=True)
+
+
+class FakeUciEngine:
+    def __init__(self):
+        self.board = chess.Board()
+        self.multiPV = 1
+        self.delay = float(os.environ.get("FAKE_UCI_ENGINE_DELAY", "0"))
+        self.search = None # timer of the running search
+        self.lock = threading.Lock()
+
+    def send(self, line):
+        with self.lock:
+            sys.stdout.write(line+"\n")
+            sys.stdout.flush()
+
+    def position(self, arguments):
+        if arguments[0] == "startpos":
+            self.board = chess.Board()
+            arguments = arguments[1:]
+        elif arguments[0] == "fen":
+            end = arguments.index("moves") if "moves" in arguments else len(arguments)
+            self.board = chess.Board(" ".join(arguments[1:end]))
+            arguments = arguments[end:]
+        if arguments != [] and arguments[0] == "moves":
+            for move in arguments[1:]:
+                self.board.push_uci(move)
+
+    def go(self, arguments):
+        board = self.board.copy()
+        depth = int(arguments[arguments.index("depth")+1]) if "depth" in arguments else 1
+        self.search = threading.Timer(self.delay, self.finishSearch, [board, depth])
+        self.search.start()
+
+    def finishSearch(self, board, depth):
+        with self.lock:
+            if self.search is None: # already answered because of "stop"
+                return
+            self.search = None
+        moves = rankedMoves(board)
+        for (i, move) in enumerate(moves[:self.multiPV]):
+            # the score is the material gain of the move, from the point of view of the side to move
+            captured = board.piece_at(move.to_square)
+            score = 100*pieceValues[captured.piece_type] if captured is not None else 0
+            self.send("info depth "+str(depth)+" multipv "+str(i+1)+" score cp "+str(score)+" pv "+move.uci())
+        if moves == []:
+            self.send("bestmove (none)")
+        else:
+            self.send("bestmove "+moves[0].uci())
+
+    def stop(self):
+        with self.lock:
+            search = self.search
+        if search is not None:
+            search.cancel()
+            search.function(*search.args)
+
+    def run(self):
+        for line in sys.stdin:
+            tokens = line.split()
+            if tokens == []:
+                continue
+            command = tokens[0]
+            if command == "uci":
+                self.send("id name FakeUciEngine")
+                self.send("id author ChessPuzzleTrainer")
+                self.send("option name MultiPV type spin default 1 min 1 max 500")
+                self.send("uciok")
+            elif command == "isready":
+                self.send("readyok")
+            elif command == "setoption" and "name" in tokens and "value" in tokens:
+                name = " ".join(tokens[tokens.index("name")+1:tokens.index("value")])
+                if name.lower() == "multipv":
+                    self.multiPV = int(tokens[tokens.index("value")+1])
+            elif command == "position":
+                self.position(tokens[1:])
+            elif command == "go":
+                self.go(tokens[1:])
+            elif command == "stop":
+                self.stop()
+            elif command == "quit":
+                self.stop()
+                break
+
+
+if __name__ == "__main__":
+    FakeUciEngine().run()
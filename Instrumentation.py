@@ -0,0 +1,186 @@
+"""
+Timing spans of the hot paths (puzzle load, PGN parse, board render, engine search, frames of the event loop,
+saving). Tracing is off unless the environment variable CHESS_TRACE names a folder, e.g.
+
+    CHESS_TRACE=traces python3 ChessPuzzleTrainer.py
+
+Then every session writes a trace file (traces/trace-<date>-<time>.json) which can be opened with chrome://tracing
+or https://ui.perfetto.dev, and prints the median and 95th percentile of the duration of every span.
+Usage in the code:
+
+    with Instrumentation.span("pgn parse"):
+        ...
+    Instrumentation.record("engine search", start, duration, depth=12) # start from time.perf_counter()
+
+If tracing is off, span returns a shared object which does nothing.
+"""
+import os
+import sys
+import json
+import math
+import time
+import datetime
+import threading
+
+
+class NullSpan:
+    """
+    Returned by Tracer.span if tracing is off
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        return False
+
+
+class Span:
+    """
+    Measures the time between entering and leaving a with block
+    """
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self.tracer.record(self.name, self.start, time.perf_counter()-self.start, **self.args)
+        return False
+
+
+nullSpan = NullSpan()
+
+
+class Tracer:
+    """
+    Collects spans in memory, they are written when the session ends. A span is a tuple (name, start, duration,
+    thread, arguments), appending to a list is safe without a lock, so the worker threads (engine, prefetcher)
+    record their spans as well.
+    """
+    def __init__(self, maxSpans=1000000):
+        """
+        :param maxSpans: further spans are counted but not kept, this limits the memory of long sessions
+        :return:-
+        """
+        self.enabled = False
+        self.folder = None
+        self.maxSpans = maxSpans
+        self.spans = []
+        self.droppedSpans = 0
+        self.origin = time.perf_counter()
+        self.sessionStart = datetime.datetime.now()
+        self.threadNames = {} # thread id:name, shown by the trace viewer
+
+    def start(self, folder):
+        """
+        Turns tracing on
+        :param folder: where the trace file is written at the end of the session
+        :return:
+        """
+        self.enabled = True
+        self.folder = folder
+        self.origin = time.perf_counter()
+        self.sessionStart = datetime.datetime.now()
+
+    def span(self, name, **args):
+        """
+        :param name: name of the span, spans with the same name are summarized together
+        :param args: shown with the span in the trace viewer
+        :return: context manager
+        """
+        if not self.enabled:
+            return nullSpan
+        return Span(self, name, args)
+
+    def record(self, name, start, duration, **args):
+        """
+        Adds a span measured by the caller
+        :param start: time.perf_counter() at the start
+        :param duration: seconds
+        :return:
+        """
+        if not self.enabled:
+            return
+        if len(self.spans) >= self.maxSpans:
+            self.droppedSpans += 1
+            return
+        thread = threading.current_thread()
+        if thread.ident not in self.threadNames:
+            self.threadNames[thread.ident] = thread.name
+        self.spans.append((name, start, duration, thread.ident, args))
+
+    def summary(self):
+        """
+        :return: dictionary name:{"count", "total", "p50", "p95", "max"} with the durations in seconds
+        """
+        durations = {}
+        for (name, start, duration, thread, args) in list(self.spans):
+            durations.setdefault(name, []).append(duration)
+        statistics = {}
+        for (name, values) in durations.items():
+            values.sort()
+            statistics[name] = {"count": len(values), "total": sum(values), "p50": percentile(values, 50),
+                                "p95": percentile(values, 95), "max": values[-1]}
+        return statistics
+
+    def writeSummary(self, output=sys.stdout):
+        output.write("%-16s %7s %10s %10s %10s %10s\n" % ("span", "count", "total s", "p50 ms", "p95 ms", "max ms"))
+        for (name, statistics) in sorted(self.summary().items(), key=lambda item: -item[1]["total"]):
+            output.write("%-16s %7d %10.3f %10.3f %10.3f %10.3f\n" % (
+                name, statistics["count"], statistics["total"], statistics["p50"]*1000, statistics["p95"]*1000,
+                statistics["max"]*1000))
+        if self.droppedSpans > 0:
+            output.write(str(self.droppedSpans)+" spans dropped\n")
+
+    def chromeTrace(self):
+        """
+        The spans in the Trace Event Format of Chrome ("X" events, times in microseconds)
+        :return: json data
+        """
+        processId = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": processId, "tid": thread, "args": {"name": name}}
+                  for (thread, name) in self.threadNames.items()]
+        for (name, start, duration, thread, args) in list(self.spans):
+            events.append({"name": name, "ph": "X", "pid": processId, "tid": thread,
+                           "ts": round((start-self.origin)*1e6, 1), "dur": round(duration*1e6, 1),
+                           "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"sessionStart": self.sessionStart.isoformat(timespec="seconds"),
+                              "droppedSpans": self.droppedSpans, "summary": self.summary()}}
+
+    def finish(self):
+        """
+        Writes the trace file of the session and prints the summary, if tracing is on
+        :return: name of the trace file or None
+        """
+        if not self.enabled:
+            return None
+        os.makedirs(self.folder, exist_ok=True)
+        filename = os.path.join(self.folder, "trace-"+self.sessionStart.strftime("%Y%m%d-%H%M%S")+".json")
+        with open(filename, 'w') as traceFile:
+            json.dump(self.chromeTrace(), traceFile, default=str)
+        self.writeSummary()
+        print("Trace written to "+filename)
+        return filename
+
+
+def percentile(sortedValues, p):
+    """
+    :param sortedValues: non-empty sorted list
+    :param p: in [0, 100]
+    :return: the value below which p percent of the values are (nearest rank)
+    """
+    return sortedValues[max(0, math.ceil(p/100*len(sortedValues))-1)]
+
+
+tracer = Tracer() # shared by the whole program
+span = tracer.span
+record = tracer.record
+if os.environ.get("CHESS_TRACE"):
+    tracer.start(os.environ["CHESS_TRACE"])
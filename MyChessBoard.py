@@ -1,18 +1,64 @@
 import pygame
 import os
 import chess
+import chess.uci
 import math
+import time
+import concurrent.futures
+import Instrumentation
+from AcceptedMoves import AcceptedMoves
+
+
+figure_pngs = {"n": 'SpringerSchwarz.png', "N": "SpringerWeiß.png", "r": "TurmSchwarz.png", "R": "TurmWeiß.png",
+        "k": "KönigSchwarz.png", "K": "KönigWeiß.png", "b": "LäuferSchwarz.png", "B": "LäuferWeiß.png", "p":
+        "BauerSchwarz.png", "P": "BauerWeiß.png", "q": "KöniginSchwarz.png", "Q": "KöniginWeiß.png"}
+
+
+class SpriteAtlas:
+    """
+    The images of all figures scaled to the size of a square. The images are loaded once per size and shared
+    by all boards.
+    """
+    atlases = {} # size of a square:SpriteAtlas
+
+    @staticmethod
+    def forSize(sizeRect):
+        """
+        Returns the (cached) atlas for the given size
+        :param sizeRect: size of a square
+        :return: instance of SpriteAtlas
+        """
+        if int(sizeRect) not in SpriteAtlas.atlases:
+            SpriteAtlas.atlases[int(sizeRect)] = SpriteAtlas(int(sizeRect))
+        return SpriteAtlas.atlases[int(sizeRect)]
+
+    def __init__(self, sizeRect):
+        self.sprites = {}
+        for (whichFigure, filename) in figure_pngs.items():
+            figure = pygame.image.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chessPictures', filename))
+            figure = pygame.transform.scale(figure, (sizeRect, sizeRect))
+            if pygame.display.get_surface() is not None:
+                figure = figure.convert_alpha() # blitting is faster in the pixel format of the display
+            self.sprites[whichFigure] = figure
+
+    def __getitem__(self, whichFigure):
+        return self.sprites[whichFigure]
 
 
 class MyChessBoard:
     """
     Gui for the chess.board
     """
-    def __init__(self, sizeX, cryptic_board, screen, moveValidation=None, game=None):
+    def __init__(self, sizeX, cryptic_board, screen, moveValidation=None, game=None, engineService=None, replyDelay=0.5):
         self.sizeRect = sizeX/8 # init size of square
         self.White = (255, 255, 255)
         self.Black = (0, 120, 0)
-        self.screen = screen # some pyGame stuff
+        self.screen = screen # some pyGame stuff, None for a board without display (e.g. in the training server)
+        self.sizeX = int(sizeX)
+        self.__sprites = None
+        self.__emptyBoard = None
+        self.drawnPieces = None # square:figure currently shown on the screen, None forces a complete redraw
+        self.dirtyRects = [] # parts of the screen changed since the last call of updateDisplay
 
         # store the squares where the user clicked
         self.firstClick = None
@@ -21,62 +67,131 @@ class MyChessBoard:
         self.board = cryptic_board # the chess.board =)
         self.draw_board()
         self.game = game # optional variable for storing solutions or games
+        self.acceptedMoves = AcceptedMoves.fromGame(game) # moves accepted as solution, by position
 
         self.moveCount = 0 # count moves
         self.moveList = []
 
-        # Load chess engine
-        self.engine = chess.uci.popen_engine("/usr/games/stockfish")
-        self.engine.uci()
-        self.engine.position(self.board)
+        self.engineService = engineService # chess engine shared by the program, see EngineService
+        self.replyDelay = replyDelay # seconds between a move of the user and the answer
+        self.suggestion = None # future of the move expected in the current position
+        self.pendingMove = None # move of the user waiting for its validation
+        self.replyTime = None # when the answer to the move of the user is played
+        self.requestSuggestion()
 
-    def suggestMove(self):
+    @property
+    def sprites(self):
         """
-        Suggests a move based on a PGN description.
-        :return:
+        The images of the figures, loaded on first use
+        :return: instance of SpriteAtlas
+        """
+        if self.__sprites is None:
+            self.__sprites = SpriteAtlas.forSize(self.sizeRect)
+        return self.__sprites
+
+    @property
+    def emptyBoard(self):
+        """
+        The empty board is rendered once (on first use), squares are restored from it
+        :return: pygame.Surface
+        """
+        if self.__emptyBoard is None:
+            self.__emptyBoard = pygame.Surface((self.sizeX, self.sizeX))
+            self.__drawEmptyBoard(self.__emptyBoard)
+        return self.__emptyBoard
+
+    def requestSuggestion(self):
         """
-        if self.game != None: # if there is PGN data available
-            if not self.game.is_end():
-                self.next_node = self.game.variation(0) # choose always the main line.
-                return self.next_node.move
+        Starts looking for the move expected in the current position, unless this already happened.
+        Moves from the PGN description are available immediately, the engine searches in the background.
+        :return: concurrent.futures.Future with a chess.uci.BestMove
+        """
+        if self.suggestion is None:
+            if self.game != None or self.engineService is None: # if there is PGN data available
+                self.suggestion = concurrent.futures.Future()
+                self.suggestion.set_result(chess.uci.BestMove(self.__suggestMoveFromPGN(), None))
             else:
-                print("No more moves in PGN description")
-                return None
+                self.suggestion = self.engineService.analyse(self.board)
+        return self.suggestion
+
+    def __suggestMoveFromPGN(self):
+        if self.game == None:
+            return None
+        if not self.game.is_end():
+            self.next_node = self.game.variation(0) # choose always the main line.
+            return self.next_node.move
         else:
-            self.engine.position(self.board)
-            best, ponder = self.engine.go(depth=15)
-            return best
-        return None
+            print("No more moves in PGN description")
+            return None
+
+    def __cancelSuggestion(self):
+        if self.suggestion is not None and self.engineService is not None:
+            self.engineService.cancel(self.suggestion)
+        self.suggestion = None
+
+    def __suggestionResult(self):
+        """
+        Waits until the engine found the move expected in the current position
+        :return: chess.uci.BestMove (SearchResult if it comes from the engine) or None
+        """
+        try:
+            return self.requestSuggestion().result()
+        except concurrent.futures.CancelledError:
+            return None
+        except Exception as exception:
+            print("Engine error: "+str(exception))
+            return None
+
+    def suggestMove(self):
+        """
+        Suggests a move based on a PGN description or, if there is none, on the chess engine.
+        Waits until the engine found the move.
+        :return:
+        """
+        result = self.__suggestionResult()
+        return result.bestmove if result is not None else None
 
     def __moveValidation(self, move):
         """
-        If moves were specified in a pgn string include that into the move validation process.
+        The move is correct if it is one of the accepted moves of the position: a variation of the PGN solution or,
+        if there is none, a move of the engine search whose score is close to the best one (see AcceptedMoves).
+        The moves of a position without PGN solution are taken from the search started in advance by
+        requestSuggestion, so no further search is needed.
         :param move:
         :return:
         """
-        if True: # if there is PGN data available
-            suggested_move = self.suggestMove() # suggest a move based on the PGN Data
-            if suggested_move == None:
-                print("No more moves. Puzzle solved.")
-                return False
-            if suggested_move != move: # User makes a different move
-                print("Wrong move")
-                print("Play instead "+str(suggested_move))
-                return False
+        if self.board not in self.acceptedMoves:
+            result = self.__suggestionResult()
+            if result is not None and result.bestmove is not None:
+                self.acceptedMoves.addAnalysis(self.board, getattr(result, "lines", None)
+                                               or [(result.bestmove, None, None)])
+        suggested_move = self.acceptedMoves.expectedMove(self.board)
+        if suggested_move == None:
+            print("No more moves. Puzzle solved.")
+            return False
+        if not self.acceptedMoves.accepts(self.board, move): # User makes a different move
+            print("Wrong move")
+            print("Play instead "+str(suggested_move))
+            return False
+        if self.game != None: # traverse to the next node, the positions of other lines are found by transposition
+            if self.game.has_variation(move):
+                self.game = self.game.variation(move)
             else:
-                #print("Correct move")
-                if self.game != None:
-                    self.game = self.next_node # traverse to the next node
-                return True
+                self.board.push(move)
+                self.game = self.acceptedMoves.gameNode(self.board)
+                self.board.pop()
         return True
 
-    def loadNewPosition(self, board, game=None):
+    def loadNewPosition(self, board, game=None, surface=None, suggestion=None):
         """
         Loads a new position with an optional move tree
         :param board: instance of chess.format
         :param game: PGN data stored in a py-chess specific format
+        :param surface: the position rendered by renderBoard (optional)
+        :param suggestion: future of an engine search already started for the position (optional)
         :return:
         """
+        self.__cancelSuggestion() # the search for the old position is not needed anymore
         self.board = board
         # reset moves
         self.firstClick = None
@@ -84,20 +199,86 @@ class MyChessBoard:
         self.moveCount = 0
         self.moveList = []
         self.game = game
+        self.acceptedMoves = AcceptedMoves.fromGame(game)
+        self.pendingMove = None
+        self.replyTime = None
+        self.suggestion = suggestion
+        self.requestSuggestion()
+        if surface is not None and self.screen is not None:
+            self.screen.blit(surface, (0, 0))
+            self.dirtyRects += [surface.get_rect()]
+            self.drawnPieces = {}
+            for i in range(64):
+                piece = board.piece_at(i)
+                self.drawnPieces[i] = str(piece) if piece is not None else None
 
     def draw_board(self):
         """
-        Draws the chess board saved in self.board
+        Draws the chess board saved in self.board. Only the squares which changed since the last call are drawn.
+        The changed parts of the screen are shown by updateDisplay. Nothing happens without a screen.
         :return:
         """
-        self.__drawEmptyBoard()
-        for i in range(64):
-            # There is some mess with different chess notations
-            (letter, number) = self.__convertArrayNotationToChessHuman(i)
-            piece = self.board.piece_at(i) # check if in chess.board is a piece at the specified coordinate
-            if piece is not None:
-                coordinate = str(letter)+str(number)
-                self.__drawFigure(coordinate, str(piece))
+        if self.screen is None:
+            return
+        with Instrumentation.span("render"):
+            if self.drawnPieces is None:
+                self.screen.blit(self.emptyBoard, (0, 0))
+                self.dirtyRects += [self.emptyBoard.get_rect()]
+                self.drawnPieces = {}
+            for i in range(64):
+                piece = self.board.piece_at(i) # check if in chess.board is a piece at the specified coordinate
+                whichFigure = str(piece) if piece is not None else None
+                if self.drawnPieces.get(i) != whichFigure:
+                    self.__drawSquare(i, whichFigure)
+                    self.drawnPieces[i] = whichFigure
+
+    def renderBoard(self, board):
+        """
+        Renders a position into a new surface, e.g. to prepare the next puzzle. Doesn't touch the screen.
+        :param board: instance of chess.Board
+        :return: pygame.Surface of the size of the board
+        """
+        with Instrumentation.span("render offscreen"):
+            surface = self.emptyBoard.copy()
+            for i in range(64):
+                piece = board.piece_at(i)
+                if piece is not None:
+                    (letter, number) = self.__convertArrayNotationToChessHuman(i)
+                    (y, x) = self.__convertHumanReadableTo2DCoordinates(str(letter)+str(number))
+                    surface.blit(self.sprites[str(piece)], self.__squareRect(y, x))
+        return surface
+
+    def invalidate(self):
+        """
+        Forces a complete redraw by the next call of draw_board, e.g. if the window content was lost
+        :return:
+        """
+        self.drawnPieces = None
+
+    def updateDisplay(self):
+        """
+        Shows the parts of the screen changed by draw_board
+        :return:
+        """
+        if self.dirtyRects != []:
+            pygame.display.update(self.dirtyRects)
+            self.dirtyRects = []
+
+    def __drawSquare(self, number, whichFigure):
+        """
+        Restores the empty square and draws the figure on it
+        :param number: in [0,...,64]
+        :param whichFigure: see figure_pngs or None for an empty square
+        :return:
+        """
+        # There is some mess with different chess notations
+        (letter, number) = self.__convertArrayNotationToChessHuman(number)
+        coordinate = str(letter)+str(number)
+        rect = self.__squareRect(*self.__convertHumanReadableTo2DCoordinates(coordinate))
+        self.screen.blit(self.emptyBoard, rect, rect)
+        if whichFigure is not None:
+            self.__drawFigure(coordinate, whichFigure)
+        self.dirtyRects += [rect]
 
     def __convertArrayNotationToChessHuman(self, number):
         """
@@ -110,46 +291,60 @@ class MyChessBoard:
         num  = (number-letter)/8+1
         return (dict[letter],int(num))
 
-    def __drawEmptyBoard(self):
+    def __squareRect(self, y, x):
+        """
+        The part of the screen covered by a square. The borders are rounded such that there are no gaps between squares.
+        :param y: square coordinates
+        :param x: square coordinates
+        :return: instance of pygame.Rect
+        """
+        left = int(y*self.sizeRect)
+        top = int(x*self.sizeRect)
+        return pygame.Rect(left, top, int((y+1)*self.sizeRect)-left, int((x+1)*self.sizeRect)-top)
+
+    def __drawEmptyBoard(self, surface):
         """
         Just an empty board
+        :param surface: where to draw the board
         :return: None
         """
         for j in range(8):
             for i in range(8):
                 if (i+j)%2==0:
-                    pygame.draw.rect(self.screen, self.White, pygame.Rect(i*self.sizeRect, j*self.sizeRect, self.sizeRect, self.sizeRect))
+                    pygame.draw.rect(surface, self.White, self.__squareRect(i, j))
                 else:
-                    pygame.draw.rect(self.screen, self.Black, pygame.Rect(i*self.sizeRect, j*self.sizeRect, self.sizeRect, self.sizeRect))
+                    pygame.draw.rect(surface, self.Black, self.__squareRect(i, j))
 
     def __drawFigureIn2DCoordinates(self, y, x, whichFigure):
         """
         Inserts the figures
         :param y: square coordinates
         :param x: square coordinates
-        :param whichFigure: see dictionary in function
+        :param whichFigure: see dictionary figure_pngs
         :return:
         """
-        figure_pngs = {"n": 'SpringerSchwarz.png', "N": "SpringerWeiß.png", "r": "TurmSchwarz.png", "R": "TurmWeiß.png",
-                "k": "KönigSchwarz.png", "K": "KönigWeiß.png", "b": "LäuferSchwarz.png", "B": "LäuferWeiß.png", "p":
-                "BauerSchwarz.png", "P": "BauerWeiß.png", "q": "KöniginSchwarz.png", "Q": "KöniginWeiß.png"}
-        figure = pygame.image.load(os.path.join('chessPictures', figure_pngs[whichFigure]))
-
-        figure = pygame.transform.scale(figure, (int(self.sizeRect), int(self.sizeRect)) )
-
         #some pyGame stuff
-        self.screen.blit(figure, pygame.Rect(y*self.sizeRect, x*self.sizeRect, self.sizeRect, self.sizeRect))
+        self.screen.blit(self.sprites[whichFigure], self.__squareRect(y, x))
+
+    def __convertHumanReadableTo2DCoordinates(self, coordinate):
+        """
+        Converts a human chess coordinate into square coordinates of the screen
+        :param coordinate: in human chess format (e.g. "a8")
+        :return: tuple (y, x)
+        """
+        dictLetter = {'a': 0, 'b': 1, 'c':2, 'd':3, 'e':4, 'f':5, 'g':6, 'h':7}
+        dictNumber = {'1': 7, '2': 6, '3':5, '4':4, '5':3, '6':2, '7':1, '8':0}
+        return (dictLetter[coordinate[0]], dictNumber[coordinate[1]])
 
     def __drawFigure(self, coordinate, whichFigure):
         """
         Convenience method for __drawFigureIn2DCoordinates
         :param coordinate: in human chess format (e.g. "a8")
-        :param whichFigure: see dictionary in __drawFigureIn2DCoordinates
+        :param whichFigure: see dictionary figure_pngs
         :return:
         """
-        dictLetter = {'a': 0, 'b': 1, 'c':2, 'd':3, 'e':4, 'f':5, 'g':6, 'h':7}
-        dictNumber = {'1': 7, '2': 6, '3':5, '4':4, '5':3, '6':2, '7':1, '8':0}
-        self.__drawFigureIn2DCoordinates(dictLetter[coordinate[0]],dictNumber[coordinate[1]], whichFigure)
+        (y, x) = self.__convertHumanReadableTo2DCoordinates(coordinate)
+        self.__drawFigureIn2DCoordinates(y, x, whichFigure)
 
     def __selectField(self, position):
         """
@@ -177,10 +372,41 @@ class MyChessBoard:
             self.secondClick = self.__selectField(position)
             move = chess.Move.from_uci(self.firstClick+self.secondClick)
             # print(self.board.legal_moves)
-            self.move_figure(move)
             self.firstClick = None
             self.secondClick = None
+            return self.submitMove(move)
+
+    def submitMove(self, move):
+        """
+        The move of the user is played as soon as the expected move is known (see update). Afterwards the
+        expected move of the opponent is played.
+        :param move: chess.board specific command
+        :return: False if the previous move is not finished yet
+        """
+        if self.pendingMove is not None or self.replyTime is not None:
+            return False
+        self.pendingMove = move
+        self.requestSuggestion()
+        return True
+
+    def update(self):
+        """
+        Has to be called regularly by the event loop. Validates the move of the user when the engine is ready and
+        plays the answer replyDelay seconds later.
+        :return: True if the board changed
+        """
+        if self.pendingMove is not None and self.suggestion.done():
+            self.move_figure(self.pendingMove)
+            self.pendingMove = None
+            self.replyTime = time.time()+self.replyDelay
+            self.requestSuggestion() # look for the answer while waiting
+            return True
+        if self.replyTime is not None and time.time() >= self.replyTime and self.requestSuggestion().done():
+            self.replyTime = None
+            self.move_figure(self.suggestMove())
+            self.requestSuggestion() # prepare the validation of the next move of the user
             return True
+        return False
 
     def move_figure(self, move):
         """
@@ -188,8 +414,9 @@ class MyChessBoard:
         :param move: chess.board specific command
         :return:
         """
-        if move in self.board.legal_moves and self.__moveValidation(move):
+        if move is not None and move in self.board.legal_moves and self.__moveValidation(move):
                 self.board.push(move) # here the "movement" happens.
+                self.suggestion = None # the position changed
                 self.moveCount += 1
                 self.moveList += [move]
                 # print(move)
@@ -0,0 +1,180 @@
+"""
+Computes solutions for all puzzles of a series file without PGN data, so no chess engine is needed while training.
+The puzzles are analysed in parallel by a pool of engine processes. The main line found by the engine and the
+alternatives of the first move (multi-PV) which are as good as the best move (see AcceptedMoves.withinMargin) are
+written into the field "PGN", the trainer accepts all of them. Usage:
+
+    python3 PrecomputeSolutions.py <series file> [depth] [multiPV] [plies] [processes]
+
+Defaults: depth 15, multiPV 3, plies 7 (length of the main line), one process per core.
+The results are collected in <series file>.precomputed. If the program is interrupted, it continues from there
+the next time. Don't train with the series file while the solutions are computed.
+"""
+import os
+import sys
+import json
+import time
+import multiprocessing
+import chess
+import chess.pgn
+import chess.uci
+from EngineService import EngineService
+from AcceptedMoves import withinMargin
+from PuzzleCollection import ScheduledPuzzleCollection
+from ResultJournal import ResultJournal, fileFingerprint
+
+engine = None # engine of a worker process
+
+
+def startEngine(enginePath, multiPV):
+    """
+    Initializer of the worker processes
+    :return:
+    """
+    global engine
+    engine = chess.uci.popen_engine(enginePath)
+    engine.uci()
+    if "MultiPV" in engine.options:
+        engine.setoption({"MultiPV": multiPV})
+    engine.info_handlers.append(chess.uci.InfoHandler())
+
+
+def solvePuzzle(arguments):
+    """
+    Analyses a puzzle if it doesn't contain PGN data
+    :param arguments: (line, depth, plies), line is the json string of the puzzle
+    :return: (json string with PGN data, True if the puzzle was analysed)
+    """
+    (line, depth, plies) = arguments
+    puzzleDict = json.loads(line)
+    if puzzleDict.get('PGN', "") != "":
+        return (line, False)
+    board = chess.Board(puzzleDict['FEN'])
+    engine.ucinewgame()
+    engine.position(board)
+    engine.go(depth=depth)
+    with engine.info_handlers[0] as info:
+        scores = info.get("score", {})
+        lines = [(info["pv"][i], (scores[i].cp, scores[i].mate) if i in scores else (None, None))
+                 for i in sorted(info.get("pv", {})) if info["pv"][i] != []]
+    lines = [moves for (moves, score) in lines if withinMargin(lines[0][1], score)]
+    if lines == []:
+        return (line, True) # e.g. mate or stalemate
+    puzzleDict['PGN'] = movesToPGN(board, lines, plies)
+    return (json.dumps(puzzleDict), True)
+
+
+def movesToPGN(board, lines, plies):
+    """
+    Writes engine lines as PGN move text
+    :param board: starting position
+    :param lines: list of move lists, the first one is the main line, the others are alternatives
+    :param plies: maximal length of the main line
+    :return: string, e.g. "1. Rxd5 Qxd5 (1... Nxd5 2. Bf3) 2. Bf3"
+    """
+    game = chess.pgn.Game()
+    game.setup(board)
+    node = game
+    for move in lines[0][:plies]:
+        node = node.add_variation(move)
+    for alternative in lines[1:]:
+        if game.has_variation(alternative[0]):
+            continue
+        node = game.add_variation(alternative[0])
+        for move in alternative[1:plies]:
+            node = node.add_variation(move)
+    exporter = chess.pgn.StringExporter(headers=False, comments=False, columns=None)
+    moveText = game.accept(exporter)
+    return moveText[:-len(" *")] if moveText.endswith(" *") else moveText
+
+
+def precomputeSolutions(filename, depth=15, multiPV=3, plies=7, processes=None, enginePath=None):
+    """
+    Adds solutions to all puzzles of the series file without PGN data
+    :param filename: series file
+    :param depth: search depth
+    :param multiPV: number of alternatives searched
+    :param plies: maximal length of the main line
+    :param processes: number of engine processes, default: number of cores
+    :param enginePath: default see EngineService
+    :return: number of analysed puzzles
+    """
+    enginePath = enginePath or os.environ.get("CHESS_ENGINE", EngineService.defaultEnginePath)
+    processes = processes or os.cpu_count()
+    # fold the results of the training sessions into the series file first
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    if puzzleCollection.journal.numberOfRecords > 0:
+        puzzleCollection.compact()
+    puzzleCollection.journal.close()
+    puzzleCollection.puzzleFile.close()
+
+    # continue an interrupted run
+    progressFilename = filename+".precomputed"
+    size = os.path.getsize(filename)
+    header = json.dumps({"seriesSize": size, "seriesDigest": fileFingerprint(filename, size)})
+    done = 0
+    completeSize = 0 # without an incomplete last line
+    if os.path.exists(progressFilename):
+        progressFile = open(progressFilename, 'rb')
+        if progressFile.readline().decode("utf-8").strip() == header:
+            completeSize = progressFile.tell()
+            for line in progressFile:
+                if not line.endswith(b"\n"):
+                    break
+                done += 1
+                completeSize += len(line)
+        progressFile.close()
+    if completeSize == 0:
+        progressFile = open(progressFilename, 'w')
+        progressFile.write(header+"\n")
+    else:
+        print("Continuing after "+str(done)+" puzzles")
+        progressFile = open(progressFilename, 'a')
+        progressFile.truncate(completeSize)
+
+    seriesFile = open(filename)
+    lines = (line.rstrip("\n") for line in seriesFile if line.strip() != "")
+    puzzles = ((line, depth, plies) for (i, line) in enumerate(lines) if i >= done)
+    pool = multiprocessing.Pool(processes, startEngine, (enginePath, multiPV))
+    analysed = 0
+    start = time.time()
+    try:
+        for (line, isAnalysed) in pool.imap(solvePuzzle, puzzles, chunksize=4):
+            progressFile.write(line+"\n")
+            if isAnalysed:
+                analysed += 1
+                if analysed % 100 == 0:
+                    progressFile.flush()
+                    print(str(analysed)+" positions, "+"%.1f" % (analysed/(time.time()-start))+" positions per second")
+    finally:
+        pool.terminate()
+        seriesFile.close()
+        progressFile.close()
+    seconds = time.time()-start
+    print(str(analysed)+" positions analysed in "+"%.1f" % seconds+" seconds ("+
+          "%.1f" % (analysed/seconds if seconds > 0 else 0.0)+" positions per second)")
+
+    # replace the series file, unless somebody trained in the meantime
+    journal = ResultJournal(filename)
+    journal.close()
+    if journal.numberOfRecords > 0:
+        print("The series file was used for training in the meantime. Please run the program again.")
+        return analysed
+    progressFile = open(progressFilename)
+    progressFile.readline() # header
+    temporaryFilename = filename+".tmp"
+    solvedFile = open(temporaryFilename, 'w')
+    for line in progressFile:
+        solvedFile.write(line)
+    solvedFile.close()
+    progressFile.close()
+    os.replace(temporaryFilename, filename)
+    os.remove(progressFilename)
+    return analysed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        raise SystemExit(1)
+    precomputeSolutions(sys.argv[1], *[int(argument) for argument in sys.argv[2:6]])
@@ -2,63 +2,366 @@ import json
 import random
 import datetime
 import time
+import os
+import sys
+import math
+import zlib
+import functools
 import chess.pgn
+import Instrumentation
 from io import StringIO
+from array import array
+from collections.abc import MutableMapping
+from PuzzleStore import IndexedPuzzleFile
+from ResultJournal import ResultJournal
+from PuzzleScheduler import CalendarQueue
+
+notSolved = float("nan") # stored in the packed history instead of "not solved"
+
+
+@functools.lru_cache(maxsize=4096)
+def dayOrdinal(date):
+    """
+    Converts a date of the history into a date ordinal (see datetime.date.toordinal)
+    :param date: string, e.g. "2017-03-01"
+    :return: ordinal or None if the string isn't reproduced exactly by dayString
+    """
+    try:
+        day = datetime.date.fromisoformat(date).toordinal()
+    except ValueError:
+        return None
+    return day if dayString(day) == date else None
+
+
+@functools.lru_cache(maxsize=4096)
+def parseDay(date):
+    """
+    Converts a date of the history into a date ordinal, like the schedule reads it
+    :param date: string, e.g. "2017-03-01" or "2017-3-1"
+    :return: ordinal
+    """
+    day = dayOrdinal(date)
+    if day is None: # e.g. written without leading zeros
+        day = datetime.datetime.strptime(date, "%Y-%m-%d").date().toordinal()
+    return day
+
+
+def puzzleChecksum(fen, pgn):
+    """
+    :return: checksum of the position and the solution of a puzzle
+    """
+    return zlib.crc32((fen+"\n"+(pgn or "")).encode("utf-8"))
+
+
+@functools.lru_cache(maxsize=4096)
+def dayString(day):
+    return str(datetime.date.fromordinal(day))
+
+
+def packHistory(previousSolvingTimes):
+    """
+    Converts a history into two arrays: the days of the results and the solving times (NaN if not solved)
+    :param previousSolvingTimes: list of [date, solving time or "not solved"]
+    :return: (array of date ordinals, array of seconds) or None if the history can't be packed without changing its
+    json representation (e.g. other date formats or integer solving times)
+    """
+    days = array('i')
+    times = array('d')
+    for result in previousSolvingTimes:
+        if type(result) is not list or len(result) != 2 or type(result[0]) is not str:
+            return None
+        (date, solved) = result
+        day = dayOrdinal(date)
+        if day is None:
+            return None
+        if type(solved) is float and not math.isnan(solved):
+            times.append(solved)
+        elif solved == "not solved":
+            times.append(notSolved)
+        else:
+            return None
+        days.append(day)
+    return (days, times)
+
 
 class ChessPuzzle:
     """
     This class represents one chess puzzle. It mainly is just a json string with additional information about the
-    solving time
+    solving time.
+    Large collections keep many puzzles in memory, so the json data is stored compactly: FEN and PGN as bytes (the
+    PGN string is only parsed when the attribute 'game' is accessed), the history as arrays of date ordinals and
+    solving times and the other fields in slots. The json data is available as the mapping 'puzzleDict', str(puzzle)
+    gives the json string with the fields in their original order.
     """
-    def __init__(self, puzzleAsString):
+    __slots__ = ("fields", "packedFEN", "packedPGN", "description", "reviewDays", "solvingTimes", "irregularHistory",
+                 "level", "lastReview", "otherFields", "__game", "__gameIsParsed", "start_time", "time_for_solving",
+                 "index", "resultListener")
+    fieldOrders = {} # names of the fields in json order:the same tuple, shared by the puzzles with the same fields
+
+    def __init__(self, puzzleAsString, lazy=True):
         """
         Reads the string containing the chess puzzle and additional information.
         :param puzzleAsString: string
+        :param lazy: if True the PGN string is only parsed when the attribute 'game' is accessed the first time
         :return:-
         """
-        self.puzzleDict = json.loads(puzzleAsString) # each line of the file represents a puzzle represented in json format
-        self.FEN = self.puzzleDict["FEN"] # see WIKI for informations of the chess FEN format
+        puzzleDict = json.loads(puzzleAsString) # each line of the file represents a puzzle represented in json format
         # Create a list of solving times if necessary
-        if 'previousSolvingTimes' not in self.puzzleDict:
-            self.puzzleDict['previousSolvingTimes'] = []
+        if 'previousSolvingTimes' not in puzzleDict:
+            puzzleDict['previousSolvingTimes'] = []
+        if 'PGN' not in puzzleDict:
+            puzzleDict['PGN'] = ""
+        self.fields = ()
+        self.packedFEN = b"" # see WIKI for informations of the chess FEN format
+        self.packedPGN = b""
+        self.description = None
+        self.reviewDays = None # array of date ordinals, None if the history is empty
+        self.solvingTimes = None # array of seconds, NaN if the puzzle was not solved
+        self.irregularHistory = None # the history as list, if it can't be packed
+        self.level = None
+        self.lastReview = None # date ordinal
+        self.otherFields = None # fields without slot (or with unusual values) as dictionary
+        for (key, value) in puzzleDict.items():
+            if not self.__packField(key, value):
+                if self.otherFields is None:
+                    self.otherFields = {}
+                self.otherFields[key] = value
+        fields = tuple(puzzleDict)
+        self.fields = self.fieldOrders.setdefault(fields, fields)
+        self.field('FEN')
+
+        # The solution tree is parsed on demand, see the property 'game'
+        self.__game = None
+        self.__gameIsParsed = False
+        if not lazy:
+            self.__parseGame()
+
+        # measure the time needed to solve the puzzle
+        self.start_time = time.time()
+        self.time_for_solving = -1
+        self.index = None # line of the puzzle in the series file
+        self.resultListener = None # called with (puzzle, result) after the puzzle was marked as solved or unsolved
+
+    def field(self, key):
+        """
+        Returns a field of the json data
+        :param key: name of the field
+        :return: the value, lists are new objects
+        """
+        if self.otherFields is not None and key in self.otherFields:
+            return self.otherFields[key]
+        if key not in self.fields:
+            raise KeyError(key)
+        if key == 'FEN':
+            return self.packedFEN.decode("utf-8")
+        if key == 'PGN':
+            return self.packedPGN.decode("utf-8")
+        if key == 'description':
+            return self.description
+        if key == 'previousSolvingTimes':
+            return self.previousSolvingTimes
+        if key == 'level':
+            return self.level
+        return dayString(self.lastReview)
+
+    def setField(self, key, value):
+        """
+        Changes or adds a field of the json data
+        :param key: name of the field
+        :param value: json value
+        :return:
+        """
+        if self.otherFields is not None:
+            self.otherFields.pop(key, None)
+        if not self.__packField(key, value):
+            if self.otherFields is None:
+                self.otherFields = {}
+            self.otherFields[key] = value
+        if key not in self.fields:
+            self.fields = self.fieldOrders.setdefault(self.fields+(key,), self.fields+(key,))
+
+    def removeField(self, key):
+        """
+        Removes a field of the json data
+        :param key: name of the field
+        :return:
+        """
+        if key not in self.fields:
+            raise KeyError(key)
+        if self.otherFields is not None and key in self.otherFields:
+            del self.otherFields[key]
+        if key == 'PGN':
+            self.__packField('PGN', "")
+        fields = tuple(name for name in self.fields if name != key)
+        self.fields = self.fieldOrders.setdefault(fields, fields)
+
+    def __packField(self, key, value):
+        """
+        Stores a field in its slot
+        :return: False if the field has no slot or its value can't be stored there exactly
+        """
+        if key in ['FEN', 'PGN'] and type(value) is str:
+            if key == 'FEN':
+                self.packedFEN = value.encode("utf-8")
+            else:
+                self.packedPGN = value.encode("utf-8")
+            self.__game = None # the position or the solution changed
+            self.__gameIsParsed = False
+            return True
+        if key == 'description' and type(value) is str:
+            self.description = sys.intern(value) # most puzzles share the same description
+            return True
+        if key == 'previousSolvingTimes' and type(value) is list:
+            packedHistory = packHistory(value) if value != [] else (None, None)
+            if packedHistory is None:
+                (self.reviewDays, self.solvingTimes, self.irregularHistory) = (None, None, list(value))
+            else:
+                (self.reviewDays, self.solvingTimes) = packedHistory
+                self.irregularHistory = None
+            return True
+        if key == 'level' and type(value) is int:
+            self.level = value
+            return True
+        if key == 'lastReview' and type(value) is str and dayOrdinal(value) is not None:
+            self.lastReview = dayOrdinal(value)
+            return True
+        return False
+
+    @property
+    def FEN(self):
+        return self.field('FEN')
+
+    @property
+    def puzzleDict(self):
+        """
+        The json data of the puzzle. Changes are stored in the puzzle.
+        :return: instance of PuzzleDictView
+        """
+        return PuzzleDictView(self)
+
+    @property
+    def previousSolvingTimes(self):
+        """
+        :return: new list of [date, solving time or "not solved"]
+        """
+        if self.irregularHistory is not None:
+            return list(self.irregularHistory)
+        if self.reviewDays is None:
+            return []
+        return [[dayString(day), "not solved" if math.isnan(seconds) else seconds]
+                for (day, seconds) in zip(self.reviewDays, self.solvingTimes)]
+
+    def appendResult(self, result):
+        """
+        Adds a result to the history
+        :param result: [date, solving time or "not solved"]
+        :return:
+        """
+        packedResult = packHistory([result])
+        if packedResult is not None and self.irregularHistory is None and \
+                (self.otherFields is None or 'previousSolvingTimes' not in self.otherFields):
+            if self.reviewDays is None:
+                (self.reviewDays, self.solvingTimes) = packedResult
+            else:
+                self.reviewDays.extend(packedResult[0])
+                self.solvingTimes.extend(packedResult[1])
+        else:
+            self.setField('previousSolvingTimes', self.field('previousSolvingTimes')+[result])
+
+    def toDict(self):
+        """
+        :return: the json data as a new dictionary
+        """
+        return dict((key, self.field(key)) for key in self.fields)
 
+    def __parseGame(self):
+        """
+        Parses the PGN string of the puzzle (if there is one) and caches the result.
+        :return: instance of chess.pgn.Game or None
+        """
         # Check if there is some information about solutions given
-        if 'PGN' in self.puzzleDict and self.puzzleDict['PGN'] != "":
+        if self.packedPGN != b"":
             pgnString = "[FEN \""+self.FEN+"\"]\n"
-            pgnString += self.puzzleDict['PGN']
+            pgnString += self.packedPGN.decode("utf-8")
             #print(pgnString)
-            self.PGN = StringIO(pgnString)
-            self.game = chess.pgn.read_game(self.PGN)
+            with Instrumentation.span("pgn parse"):
+                self.__game = chess.pgn.read_game(StringIO(pgnString))
             # print(self.game)
         else:
-            self.puzzleDict['PGN'] = ""
-            self.game = None
+            self.__game = None
+        self.__gameIsParsed = True
+        return self.__game
 
-        # measure the time needed to solve the puzzle
-        self.start_time = time.time()
-        self.time_for_solving = -1
+    @property
+    def game(self):
+        """
+        The solution tree of the puzzle (None if no PGN string is given). It is built on first access and then cached.
+        :return: instance of chess.pgn.Game or None
+        """
+        if not self.__gameIsParsed:
+            return self.__parseGame()
+        return self.__game
 
     def __str__(self):
-        return json.dumps(self.puzzleDict)
+        return json.dumps(self.toDict())
 
     def markPuzzleAsSolvedCorrectly(self):
         """
         Save the time necessary to solve the puzzle.
         :return:
         """
-        self.puzzleDict['previousSolvingTimes'] += [[str(datetime.date.today()), time.time()-self.start_time]]
+        result = [str(datetime.date.today()), time.time()-self.start_time]
+        self.appendResult(result)
         print(str(time.time()-self.start_time))
         self.start_time = time.time() # reset time, if the puzzle gets asked again in this round due to much time
         self.time_for_solving = -1
+        if self.resultListener is not None:
+            self.resultListener(self, result)
 
     def markPuzzleAsSolvedIncorrectly(self):
         """
         Mark the puzzle as unsolved
         :return:
         """
-        self.puzzleDict['previousSolvingTimes'] += [[str(datetime.date.today()), "not solved"]]
+        result = [str(datetime.date.today()), "not solved"]
+        self.appendResult(result)
         self.start_time = time.time() # reset time, if the puzzle gets asked again in this round due to much time
         self.time_for_solving = -1
+        if self.resultListener is not None:
+            self.resultListener(self, result)
+
+
+class PuzzleDictView(MutableMapping):
+    """
+    The json data of a ChessPuzzle as a dictionary. Reading and writing goes to the compact fields of the puzzle,
+    so values are created on access: changing a returned list (e.g. the history) doesn't change the puzzle, the
+    list has to be assigned again.
+    """
+    __slots__ = ("puzzle",)
+
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+
+    def __getitem__(self, key):
+        return self.puzzle.field(key)
+
+    def __setitem__(self, key, value):
+        self.puzzle.setField(key, value)
+
+    def __delitem__(self, key):
+        self.puzzle.removeField(key)
+
+    def __contains__(self, key):
+        return key in self.puzzle.fields
+
+    def __iter__(self):
+        return iter(self.puzzle.fields)
+
+    def __len__(self):
+        return len(self.puzzle.fields)
+
+    def __repr__(self):
+        return repr(self.puzzle.toDict())
 
 #############################################################################################################
 
@@ -66,24 +369,107 @@ class PuzzleCollection:
     """
     Essentially a list of ChessPuzzle instances. This list can be loaded from a file and saved to a file. Is afterwards shuffled.
     The class also provides an iterator.
+    The puzzles are read on demand from an indexed series file (see PuzzleStore.IndexedPuzzleFile), only the puzzles
+    presented to the user are kept in memory.
+    Results and removed puzzles are appended to a journal (see ResultJournal) which is replayed when the collection
+    is loaded. From time to time the journal is folded into the series file.
     """
-    def __init__(self, filename_in, filename_out):
-        self.listOfPuzzles = self.__readFileIntoPuzzleList(filename_in) # the puzzle_collection.
-        random.shuffle(self.listOfPuzzles)
-        self.puzzleIterator = iter(self.listOfPuzzles) # Provides some way to iterate over the collection
-        self.saveInFile = filename_out
+    def __init__(self, filename, lazy=True, compactAfter=1000):
+        """
+        :param filename: series file
+        :param lazy: parse the PGN strings of the puzzles only on demand
+        :param compactAfter: the journal is folded into the series file if it contains at least this number of records
+        """
+        self.lazy = lazy
+        self.filename = filename
+        self.compactAfter = compactAfter
+        self.puzzleFile = IndexedPuzzleFile(filename) # the puzzle_collection.
+        self.loadedPuzzles = {} # line in the file:ChessPuzzle, contains the puzzles which were presented or changed
+        self.removedPuzzles = set() # lines of the puzzles which are not saved later
+        self.journal = ResultJournal(filename)
+        self.__replayJournal()
+        if self.journal.numberOfRecords >= self.compactAfter:
+            self.compact()
+        self.puzzleIterator = self.shuffledIndices() # Provides some way to iterate over the collection
+        self.nextIndex = None # line of the next puzzle, if it was already taken from the iterator by peekNextIndex
         self.currentPuzzle = None
 
-    def __readFileIntoPuzzleList(self, filename):
+    def __replayJournal(self):
+        """
+        Applies the records of the journal to the puzzles
+        :return:
+        """
+        for record in self.journal.records():
+            index = record["line"]
+            if index >= len(self.puzzleFile) or index in self.removedPuzzles:
+                continue
+            if record.get("removed", False):
+                self.removedPuzzles.add(index)
+                self.loadedPuzzles.pop(index, None)
+            else:
+                self.replayResult(self.getPuzzle(index), record["result"])
+
+    def replayResult(self, puzzle, result):
+        """
+        Applies a result read from the journal to a puzzle
+        :param puzzle: instance of ChessPuzzle
+        :param result: [date, solving time or "not solved"]
+        :return:
+        """
+        puzzle.appendResult(result)
+
+    def completePuzzleDict(self, puzzleDict):
         """
-        Reads the puzzle list from a file
-        :param filename:
-        :return: list of puzzle_collection
+        Adds fields which are missing in puzzles saved by older versions. Nothing to do here, see subclasses.
+        :param puzzleDict: json data of a puzzle
+        :return: True if the dictionary was changed
         """
-        puzzlesFile = open(filename)
-        puzzles = [ChessPuzzle(line) for line in puzzlesFile]
-        puzzlesFile.close()
-        return puzzles
+        return False
+
+    def __len__(self):
+        return len(self.puzzleFile)-len(self.removedPuzzles)
+
+    def shuffledIndices(self):
+        """
+        Yields the lines of all puzzles in random order. The permutation is drawn lazily (Fisher-Yates shuffle
+        with a dictionary of swapped positions), so the memory needed only grows with the number of drawn puzzles.
+        :return: generator of indices
+        """
+        numberOfPuzzles = len(self.puzzleFile)
+        swapped = {}
+        for i in range(numberOfPuzzles):
+            j = random.randrange(i, numberOfPuzzles)
+            index = swapped.get(j, j)
+            if j != i:
+                swapped[j] = swapped.get(i, i)
+            swapped.pop(i, None)
+            if index not in self.removedPuzzles:
+                yield index
+
+    def getPuzzle(self, index):
+        """
+        Returns the puzzle in the given line of the file. It is read from the file on first access.
+        :param index: line in the file
+        :return: instance of ChessPuzzle
+        """
+        puzzle = self.loadedPuzzles.get(index)
+        if puzzle is None:
+            with Instrumentation.span("puzzle load", puzzle=index):
+                puzzle = ChessPuzzle(self.puzzleFile.readLine(index), self.lazy)
+            puzzle.index = index
+            puzzle.resultListener = self.puzzleAnswered
+            self.loadedPuzzles[index] = puzzle
+        return puzzle
+
+    def getPuzzleDict(self, index):
+        """
+        Returns the json data of a puzzle without keeping the puzzle in memory
+        :param index: line in the file
+        :return: dictionary
+        """
+        if index in self.loadedPuzzles:
+            return self.loadedPuzzles[index].puzzleDict
+        return json.loads(self.puzzleFile.readLine(index))
 
     def __iter__(self):
         return self
@@ -93,30 +479,91 @@ class PuzzleCollection:
         Iterate over all puzzle_collection without any criteria
         :return:
         """
-        try:
-            self.currentChessPuzzle = next(self.puzzleIterator)
-            self.currentChessPuzzle.start_time = time.time()
-            return self.currentChessPuzzle
-        except StopIteration:
+        index = self.peekNextIndex()
+        if index is None:
             self.closePuzzleCollection()
             raise StopIteration
+        self.nextIndex = None
+        self.currentChessPuzzle = self.getPuzzle(index)
+        self.currentChessPuzzle.start_time = time.time()
+        return self.currentChessPuzzle
+
+    def puzzleAnswered(self, puzzle, result):
+        """
+        Called after a puzzle was marked as solved or unsolved. Writes the result into the journal.
+        :param puzzle: instance of ChessPuzzle
+        :param result: [date, solving time or "not solved"]
+        :return:
+        """
+        self.journal.append({"line": puzzle.index, "result": result})
+
+    def peekNextIndex(self):
+        """
+        Returns the line of the puzzle which is returned by the next call of __next__
+        :return: line in the file or None if there are no more puzzles
+        """
+        if self.nextIndex is None:
+            self.nextIndex = next(self.puzzleIterator, None)
+        return self.nextIndex
 
     def savePuzzlesIntoFile(self):
         """
-        Saves the puzzle_collection and their attributes to a file
-        :param filename:
-        :param puzzle_collection: list of puzzle_collection
+        Makes sure that all results are written to disk. This only touches the journal, unless it became that long
+        that it is folded into the series file.
+        :return:
+        """
+        with Instrumentation.span("save"):
+            self.journal.sync()
+            if self.journal.numberOfRecords >= self.compactAfter:
+                self.compact()
+
+    def compact(self):
+        """
+        Folds the journal into the series file: the puzzle_collection and their attributes are written to a temporary
+        file which replaces the series file, afterwards the journal is emptied. If the program crashes in between,
+        the old journal doesn't belong to the new series file and is ignored.
+        Puzzles which were never presented are copied from the series file without parsing them.
         :return:
         """
         print("Saving results...")
-        file_for_saving = open(self.saveInFile, 'w')
-        file_for_saving_solvingtimes = open(self.saveInFile+"_solvingtimes", 'w')
-        for puzzle in self.listOfPuzzles:
-            file_for_saving.write(str(puzzle)+"\n")
-            file_for_saving_solvingtimes.write(str(puzzle.puzzleDict['previousSolvingTimes'])+"\n")
+        compactionStart = time.perf_counter()
+        temporaryFilename = self.filename+".tmp"
+        file_for_saving = open(temporaryFilename, 'w')
+        file_for_saving_solvingtimes = open(self.filename+"_solvingtimes", 'w')
+        renumberedPuzzles = {} # the lines of the puzzles change if puzzles are removed
+        newIndex = 0
+        for index in range(len(self.puzzleFile)):
+            if index in self.removedPuzzles:
+                continue
+            if index in self.loadedPuzzles:
+                puzzle = self.loadedPuzzles[index]
+                line = str(puzzle)
+                previousSolvingTimes = puzzle.puzzleDict['previousSolvingTimes']
+                puzzle.index = newIndex
+                renumberedPuzzles[newIndex] = puzzle
+            else:
+                line = self.puzzleFile.readLine(index)
+                puzzleDict = json.loads(line)
+                if self.completePuzzleDict(puzzleDict):
+                    line = json.dumps(puzzleDict)
+                previousSolvingTimes = puzzleDict.get('previousSolvingTimes', [])
+            file_for_saving.write(line+"\n")
+            file_for_saving_solvingtimes.write(str(previousSolvingTimes)+"\n")
+            newIndex += 1
 
+        file_for_saving.flush()
+        os.fsync(file_for_saving.fileno())
         file_for_saving.close()
         file_for_saving_solvingtimes.close()
+        self.puzzleFile.close()
+        os.replace(temporaryFilename, self.filename)
+        self.journal.reset()
+        self.puzzleFile.open()
+        self.loadedPuzzles = renumberedPuzzles
+        self.removedPuzzles = set()
+        self.puzzleIterator = self.shuffledIndices()
+        self.nextIndex = None
+        Instrumentation.record("compact", compactionStart, time.perf_counter()-compactionStart, puzzles=newIndex)
 
     def closePuzzleCollection(self):
         """
@@ -125,59 +572,53 @@ class PuzzleCollection:
         print("No more puzzle_collection.")
         self.savePuzzlesIntoFile()
 
+    def removeCurrentPuzzleFromCollection(self):
+        """
+        Don't save the current puzzle later
+        :return:
+        """
+        self.removedPuzzles.add(self.currentChessPuzzle.index)
+        del self.loadedPuzzles[self.currentChessPuzzle.index]
+        self.journal.append({"line": self.currentChessPuzzle.index, "removed": True})
+        print("Puzzle removed")
+
 ##############################################################################################################
 
-class ScheduledPuzzleCollection(PuzzleCollection):
+class ReviewSchedule:
     """
-    This class is a refinement of 'PuzzleCollection'. The main diffrence is that it provides an iterator for
-    puzzle_collection which should be learned according to a schedule specified in the constructor,
-    The puzzle_collection are iterated in such a way that puzzle_collection solved previously are presented to the user first.
-    Only afterwards new puzzle_collection are (randomly) chosen for the user.
+    The rules of the schedule: the level of a puzzle is derived from its history of solving times and determines
+    when the puzzle is presented again. Used by the puzzle collections of all storage backends.
     """
-    def __init__(self, filename_in, filename_out):
-        PuzzleCollection.__init__(self, filename_in, filename_out)
-        self.schedule = {1:1, 2:2, 3:10, 4:30, 5:90, 6:300} # level:days between two repetitions
-        self.treshold = 120.0 # after 3 min the problem is more frequently shown in future
+    schedule = {1:1, 2:2, 3:10, 4:30, 5:90, 6:300} # level:days between two repetitions
+    treshold = 120.0 # after 3 min the problem is more frequently shown in future
 
-    def __next__(self):
+    def completePuzzleDict(self, puzzleDict):
         """
-        Iterate first over all problems which are due and solved before and then over all problems which are due
-        :return:
+        Derives the fields 'level' and 'lastReview' from the history of a puzzle which doesn't have them yet
+        :param puzzleDict: json data of a puzzle
+        :return: True if the fields were added
         """
-        # First we iterate over all problems which are due and solved previously
-        # Afterwards we iterate over all problems which were not solved previously
-        # The method '__problemIsCurrent' indicates if a problem should be solved
-        # After the fist 'StopIteration' we replace this method by '__problemIsDue' and reset the iterator
-        # The second time 'StopIteration' occurs we stop the iteration
-        try:
-            self.currentChessPuzzle = next(self.puzzleIterator)
-            self.currentChessPuzzle.start_time = time.time()
-        except StopIteration:
-            if self.__problemIsCurrent != self.__problemIsDue:
-                self.puzzleIterator = iter(self.listOfPuzzles)
-                self.__problemIsCurrent = self.__problemIsDue
-                print("You solved all previously presented puzzles.")
-                return self.__next__()
-            else:
-                self.closePuzzleCollection()
-                raise StopIteration
-        previousSolvingTimes = self.currentChessPuzzle.puzzleDict['previousSolvingTimes']
-
-        if self.__problemIsCurrent(previousSolvingTimes):
-            return self.currentChessPuzzle
-        else:
-            return self.__next__()
+        if 'level' in puzzleDict:
+            return False
+        previousSolvingTimes = puzzleDict.get('previousSolvingTimes', [])
+        if previousSolvingTimes == []:
+            return False
+        puzzleDict['level'] = self.getLevel(previousSolvingTimes)
+        puzzleDict['lastReview'] = previousSolvingTimes[-1][0]
+        return True
 
-    def __problemWasSolvedBefore(self, previousSolvingTimes):
+    def updateLevel(self, puzzleDict, result):
         """
-        Checks if the problem was solved before
-        :param previousSolvingTimes:
+        Updates the fields 'level' and 'lastReview' after a new result was appended to the history
+        :param puzzleDict: json data of a puzzle
+        :param result: [date, solving time or "not solved"]
         :return:
         """
-        if previousSolvingTimes == []:
-           return False
-        else:
-           return True
+        (date, solved) = result
+        # a level stored without history (e.g. by hand) is ignored, like in getLevel
+        level = puzzleDict.get('level', 1) if len(puzzleDict['previousSolvingTimes']) > 1 else 1
+        puzzleDict['level'] = self.getNextLevel(level, len(puzzleDict['previousSolvingTimes'])-1, solved)
+        puzzleDict['lastReview'] = date
 
     def getLevel(self, previousSolvingTimes):
         """
@@ -190,63 +631,273 @@ class ScheduledPuzzleCollection(PuzzleCollection):
         level = 1
         for i in range(len(previousSolvingTimes)):
             (date, solved) = previousSolvingTimes[i]
-            if solved == "not solved":
-                level = 0
-            else:
-                # if the puzzle was solved before, the level is bigger than 1 but the solving time is higher
-                # than the treshold then reduce the level by one
-                if i>1 and solved >= self.treshold and level > 1:
-                    level -= 1
-                # if the puzzle was solved fast enough increase the level by one
-                elif solved <= self.treshold:
-                    level += 1
-                # if the puzzle the level is zero and the time for solving is higher than the treshold
-                # increase the level nevertheless by one
-                elif solved >= self.treshold and level == 0:
-                    level += 1
-                # if the solving time is longer than the treshold time and the level is 1, don't change the level
-                elif solved >= self.treshold and level == 1:
-                    pass
+            level = self.getNextLevel(level, i, solved)
         # print("level "+str(level)+"  "+str((date,solved)))
         return level
 
-    def __problemIsDue(self, previousSolvingTimes):
-        if previousSolvingTimes == None or previousSolvingTimes == []:
-            return True
+    def getNextLevel(self, level, i, solved):
+        """
+        Returns the level after one more result
+        :param level: level before the result
+        :param i: position of the result in previousSolvingTimes
+        :param solved: solving time or "not solved"
+        :return:
+        """
+        if solved == "not solved":
+            level = 0
+        else:
+            # if the puzzle was solved before, the level is bigger than 1 but the solving time is higher
+            # than the treshold then reduce the level by one
+            if i>1 and solved >= self.treshold and level > 1:
+                level -= 1
+            # if the puzzle was solved fast enough increase the level by one
+            elif solved <= self.treshold:
+                level += 1
+            # if the puzzle the level is zero and the time for solving is higher than the treshold
+            # increase the level nevertheless by one
+            elif solved >= self.treshold and level == 0:
+                level += 1
+            # if the solving time is longer than the treshold time and the level is 1, don't change the level
+            elif solved >= self.treshold and level == 1:
+                pass
+        return level
 
-        level = self.getLevel(previousSolvingTimes)
-        #print(previousSolvingTimes)
-        #print(level)
-        (date, solved) = previousSolvingTimes[-1]
-        previousDate = datetime.datetime.strptime(date, "%Y-%m-%d") # parse next date
-        temp = datetime.date.today()-previousDate.date() # how long was it since the problem was solved the last time
-        # checks if it is time to present the
-        # puzzle again according to schedule
+    def getDueDate(self, puzzleDict):
+        """
+        Returns the date from which on the puzzle should be presented again according to the schedule
+        :param puzzleDict: json data of the puzzle
+        :return: date ordinal (see datetime.date.toordinal), 0 if the puzzle was never solved
+        """
+        if puzzleDict.get('previousSolvingTimes', []) == []:
+            return 0
 
+        self.completePuzzleDict(puzzleDict) # files of older versions don't contain the level
+        level = puzzleDict['level']
+        previousDate = parseDay(puzzleDict['lastReview'])
         if level == 0:
-            return True
-        if self.schedule[level]<=temp.days:
-            return True
-        else:
-            return False
+            return previousDate
+        # levels above the highest level of the schedule use the longest interval
+        return previousDate+self.schedule[min(level, max(self.schedule))]
 
+##############################################################################################################
 
-    def __problemIsCurrent(self, previousSolvingTimes):
+class ScheduledPuzzleCollection(ReviewSchedule, PuzzleCollection):
+    """
+    This class is a refinement of 'PuzzleCollection'. The main diffrence is that it provides an iterator for
+    puzzle_collection which should be learned according to a schedule specified in the constructor,
+    The puzzle_collection are iterated in such a way that puzzle_collection solved previously are presented to the user first.
+    Only afterwards new puzzle_collection are (randomly) chosen for the user.
+    The due date (0 for new puzzles) and the checksum (see puzzleChecksum) of every line are kept in the sidecar
+    file <series file>.schedule, so the queues are built without parsing the puzzles. The sidecar belongs to one
+    version of the series file. It is rewritten by compaction and rebuilt from the series file if it is outdated.
+    The puzzles changed by the journal are loaded anyway, their values are taken from the puzzles.
+    """
+    scheduleMagic = b"PZS1"
+    def __init__(self, filename, lazy=True, compactAfter=1000, newPuzzleSelection=None):
         """
-        Convenience method.
-        :param previousSolvingTimes:
+        :param newPuzzleSelection: chooses and orders the new puzzles, e.g. by difficulty (see
+        PuzzleRating.NewPuzzleSelection), default: all new puzzles in random order
+        """
+        self.newPuzzleSelection = newPuzzleSelection
+        PuzzleCollection.__init__(self, filename, lazy, compactAfter)
+        self.__buildQueues()
+
+    def __scheduleIndex(self):
+        """
+        Reads the sidecar file, it is rebuilt if it doesn't belong to the current series file
+        :return: (array of due dates, array of checksums), one entry per line
+        """
+        numberOfLines = len(self.puzzleFile)
+        try:
+            with open(self.filename+".schedule", 'rb') as scheduleFile:
+                if scheduleFile.read(len(self.scheduleMagic)+len(self.puzzleFile.fileHeader)) == \
+                        self.scheduleMagic+self.puzzleFile.fileHeader:
+                    dueDates = array('i')
+                    dueDates.fromfile(scheduleFile, numberOfLines)
+                    checksums = array('I')
+                    checksums.fromfile(scheduleFile, numberOfLines)
+                    return (dueDates, checksums)
+        except (OSError, EOFError):
+            pass
+        dueDates = array('i')
+        checksums = array('I')
+        for line in self.puzzleFile:
+            puzzleDict = json.loads(line)
+            dueDates.append(self.getDueDate(puzzleDict))
+            checksums.append(puzzleChecksum(puzzleDict['FEN'], puzzleDict.get('PGN')))
+        self.__saveScheduleIndex(dueDates, checksums)
+        return (dueDates, checksums)
+
+    def __saveScheduleIndex(self, dueDates, checksums):
+        temporaryFilename = self.filename+".schedule.tmp"
+        with open(temporaryFilename, 'wb') as scheduleFile:
+            scheduleFile.write(self.scheduleMagic+self.puzzleFile.fileHeader)
+            dueDates.tofile(scheduleFile)
+            checksums.tofile(scheduleFile)
+        os.replace(temporaryFilename, self.filename+".schedule")
+
+    def __currentSchedule(self, index, dueDates, checksums):
+        """
+        :return: (due date, checksum) of a line, from the loaded puzzle if the journal or the user changed it
+        """
+        puzzle = self.loadedPuzzles.get(index)
+        if puzzle is None:
+            return (dueDates[index], checksums[index])
+        return (self.getDueDate(puzzle.puzzleDict), puzzleChecksum(puzzle.FEN, puzzle.field('PGN')))
+
+    def __buildQueues(self):
+        """
+        Sorts the puzzles into two calendar queues by the due dates of the sidecar file
         :return:
         """
-        if self.__problemIsDue(previousSolvingTimes) and self.__problemWasSolvedBefore(previousSolvingTimes):
-            return True
-        else:
-            False
+        self.today = datetime.date.today().toordinal()
+        self.reviewQueue = CalendarQueue() # puzzles solved before, keyed by their due date
+        self.newQueue = CalendarQueue() # puzzles which were never solved, keyed by newPuzzleSelection
+        self.answeredPuzzles = [] # (due date, line) of the puzzles answered during the current pass
+        self.secondPass = False
+        (dueDates, checksums) = self.__scheduleIndex()
+        for index in range(len(self.puzzleFile)):
+            if index in self.removedPuzzles:
+                continue
+            (dueDate, checksum) = self.__currentSchedule(index, dueDates, checksums)
+            if dueDate != 0: # solved before
+                self.reviewQueue.push(dueDate, index)
+            elif self.newPuzzleSelection is None:
+                self.newQueue.push(0, index)
+            else:
+                key = self.newPuzzleSelection.key(index, checksum) # None: the puzzle is not presented
+                if key is not None:
+                    self.newQueue.push(key, index)
 
-    def removeCurrentPuzzleFromCollection(self):
+    def __next__(self):
         """
-        Don't save the current puzzle later
+        Iterate first over all problems which are due and solved before and then over all problems which are due
+        :return:
+        """
+        # First we iterate over all problems which are due and solved previously
+        # Afterwards we iterate over all problems which are due, including the ones not solved previously
+        # Puzzles answered during a pass are rescheduled only when the next pass starts, so they are not
+        # presented twice in a row. After the second pass we stop the iteration
+        self.today = datetime.date.today().toordinal()
+        index = self.reviewQueue.popDue(self.today)
+        if index is None and not self.secondPass:
+            self.secondPass = True
+            self.__rescheduleAnsweredPuzzles()
+            print("You solved all previously presented puzzles.")
+            index = self.reviewQueue.popDue(self.today)
+        if index is None and self.secondPass:
+            index = self.newQueue.popDue(self.today)
+        if index is None:
+            self.closePuzzleCollection()
+            raise StopIteration
+        self.currentChessPuzzle = self.getPuzzle(index)
+        self.currentChessPuzzle.start_time = time.time()
+        return self.currentChessPuzzle
+
+    def peekNextIndex(self):
+        """
+        Returns the line of the puzzle which is returned by the next call of __next__, without changing the queues
+        :return: line in the file or None if it is not known yet (at the end of the first pass the answered puzzles
+        are rescheduled first) or there are no more puzzles
+        """
+        today = datetime.date.today().toordinal()
+        index = self.reviewQueue.peek(today)
+        if index is None and self.secondPass:
+            index = self.newQueue.peek(today)
+        return index
+
+    def duePuzzles(self):
+        """
+        The puzzles solved before which are due today, in the order in which they are presented
+        :return: list of lines in the file
+        """
+        return self.reviewQueue.due(datetime.date.today().toordinal())
+
+    def __rescheduleAnsweredPuzzles(self):
+        for (dueDate, index) in self.answeredPuzzles:
+            if index not in self.removedPuzzles:
+                self.reviewQueue.push(dueDate, index)
+        self.answeredPuzzles = []
+
+    def getPuzzle(self, index):
+        puzzle = PuzzleCollection.getPuzzle(self, index)
+        self.completePuzzleDict(puzzle.puzzleDict)
+        return puzzle
+
+    def puzzleAnswered(self, puzzle, result):
+        """
+        Updates the level of the answered puzzle and computes its new due date. It is put back into the queue when
+        the next pass starts.
+        :param puzzle: instance of ChessPuzzle
+        :param result: [date, solving time or "not solved"]
+        :return:
+        """
+        PuzzleCollection.puzzleAnswered(self, puzzle, result)
+        self.updateLevel(puzzle.puzzleDict, result)
+        self.answeredPuzzles += [(self.getDueDate(puzzle.puzzleDict), puzzle.index)]
+
+    def replayResult(self, puzzle, result):
+        PuzzleCollection.replayResult(self, puzzle, result)
+        self.updateLevel(puzzle.puzzleDict, result)
+
+    def migrateLevels(self):
+        """
+        Stores level and date of the last review in all puzzles of the series file. Only necessary once for
+        files saved by older versions, since the fields are updated incrementally afterwards.
         :return:
         """
-        self.listOfPuzzles.remove(self.currentChessPuzzle)
-        self.puzzleIterator =  iter(self.listOfPuzzles) # reset iterator to circumvent problems
-        print("Puzzle removed")
\ No newline at end of file
+        self.compact() # compaction completes the json data of every puzzle
+
+    def validateLevels(self):
+        """
+        Checks if the stored levels and review dates agree with the levels computed from the complete history
+        :return: list of lines with wrong values
+        """
+        wrongLines = []
+        for index in range(len(self.puzzleFile)):
+            if index in self.removedPuzzles:
+                continue
+            puzzleDict = self.getPuzzleDict(index)
+            previousSolvingTimes = puzzleDict.get('previousSolvingTimes', [])
+            if previousSolvingTimes == [] or 'level' not in puzzleDict:
+                continue
+            if puzzleDict['level'] != self.getLevel(previousSolvingTimes) or \
+                    puzzleDict['lastReview'] != previousSolvingTimes[-1][0]:
+                wrongLines += [index]
+        return wrongLines
+
+    def compact(self):
+        """
+        The lines of the puzzles change during compaction, hence the sidecar file is written for the new lines and
+        the queues are rebuilt afterwards
+        :return:
+        """
+        (dueDates, checksums) = self.__scheduleIndex()
+        (newDueDates, newChecksums) = (array('i'), array('I'))
+        for index in range(len(self.puzzleFile)):
+            if index not in self.removedPuzzles:
+                (dueDate, checksum) = self.__currentSchedule(index, dueDates, checksums)
+                newDueDates.append(dueDate)
+                newChecksums.append(checksum)
+        PuzzleCollection.compact(self)
+        self.__saveScheduleIndex(newDueDates, newChecksums)
+        if hasattr(self, "reviewQueue"):
+            secondPass = self.secondPass
+            self.__buildQueues()
+            self.secondPass = secondPass
+
+
+if __name__ == "__main__":
+    # python3 PuzzleCollection.py migrate|validate <series file>
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] not in ["migrate", "validate"]:
+        print("Usage: python3 PuzzleCollection.py migrate|validate <series file>")
+        raise SystemExit(1)
+    puzzleCollection = ScheduledPuzzleCollection(sys.argv[2])
+    if sys.argv[1] == "migrate":
+        puzzleCollection.migrateLevels()
+    else:
+        wrongLines = puzzleCollection.validateLevels()
+        print(str(len(wrongLines))+" puzzles with wrong levels: "+str(wrongLines))
+        if wrongLines != []:
+            raise SystemExit(1)
@@ -0,0 +1,246 @@
+"""
+Finds puzzles with the same position in the series files of a folder. Usage:
+
+    python3 PuzzleDeduplication.py flag <folder>
+    python3 PuzzleDeduplication.py merge <folder>
+
+Positions are compared by their Zobrist hash (see chess.polyglot.zobrist_hash), so move counters are ignored.
+The hashes of all puzzles are kept in an index next to the series files (<folder>/<folder>.positions, a SQLite
+database). The index is updated incrementally, only new or changed series files are read.
+"flag" lists the duplicates. "merge" keeps the first puzzle of each position and removes the others, their solution
+variations and solving times are added to the kept puzzle. Don't train with the folder while merging.
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import itertools
+import chess
+import chess.pgn
+from io import StringIO
+from AnalysisCache import AnalysisCache
+from PuzzleStore import IndexedPuzzleFile
+from PuzzleImporter import gameToPGN
+from PuzzleCollection import ScheduledPuzzleCollection
+from ResultJournal import ResultJournal, fileFingerprint
+
+
+def seriesFiles(folder):
+    """
+    All series files of a folder (folder/folder1, folder/folder2, ...)
+    :param folder: name of the folder
+    :return: list of file names, ordered by their number
+    """
+    name = os.path.basename(os.path.normpath(folder))
+    pattern = re.compile(re.escape(name)+"([0-9]+)$")
+    numbered = [(int(match.group(1)), os.path.join(folder, filename)) for (filename, match) in
+                ((filename, pattern.match(filename)) for filename in os.listdir(folder)) if match is not None]
+    return [filename for (number, filename) in sorted(numbered)]
+
+
+def parseSolution(puzzleDict):
+    """
+    :param puzzleDict: json data of a puzzle
+    :return: instance of chess.pgn.Game, without moves if the puzzle has no PGN data
+    """
+    if puzzleDict.get('PGN', "") != "":
+        game = chess.pgn.read_game(StringIO("[FEN \""+puzzleDict['FEN']+"\"]\n"+puzzleDict['PGN']))
+        if game is not None:
+            return game
+    game = chess.pgn.Game()
+    game.setup(chess.Board(puzzleDict['FEN']))
+    return game
+
+
+def mergeVariations(target, source):
+    """
+    Adds the moves of a solution tree which are missing in another one
+    :param target: node of the tree which is extended
+    :param source: node of the same position in the other tree
+    :return:
+    """
+    for variation in source.variations:
+        if target.has_variation(variation.move):
+            mergeVariations(target.variation(variation.move), variation)
+        else:
+            mergeVariations(target.add_variation(variation.move), variation)
+
+
+class PositionIndex:
+    """
+    On-disk index of the positions of all puzzles in a folder: one row (hash, file, line) per puzzle. For every
+    series file the size and fingerprint at indexing time are stored, so puzzles appended to a file are indexed
+    without reading the file again, while rewritten files are indexed from scratch.
+    """
+    def __init__(self, folder):
+        """
+        Opens the index of a folder, created if necessary
+        :param folder: name of the folder
+        :return:-
+        """
+        self.folder = folder
+        self.filename = os.path.join(folder, os.path.basename(os.path.normpath(folder))+".positions")
+        self.database = sqlite3.connect(self.filename)
+        self.database.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT UNIQUE, "
+                              "size INTEGER, digest TEXT, lines INTEGER)")
+        self.database.execute("CREATE TABLE IF NOT EXISTS positions (hash INTEGER, file INTEGER, line INTEGER)")
+        self.database.execute("CREATE INDEX IF NOT EXISTS positionsHash ON positions (hash)")
+        self.database.commit()
+
+    def update(self):
+        """
+        Indexes the puzzles added since the last update. Series files with results in their journal are compacted
+        first, since removed puzzles change the lines of the others.
+        :return: number of indexed puzzles
+        """
+        indexed = 0
+        filenames = seriesFiles(self.folder)
+        for filename in filenames:
+            journal = ResultJournal(filename)
+            journal.close()
+            if journal.numberOfRecords > 0:
+                puzzleCollection = ScheduledPuzzleCollection(filename)
+                puzzleCollection.compact()
+                puzzleCollection.journal.close()
+                puzzleCollection.puzzleFile.close()
+            indexed += self.__updateFile(filename)
+        # series files which were deleted
+        for (fileId, name) in self.database.execute("SELECT id, name FROM files").fetchall():
+            if name not in filenames:
+                self.database.execute("DELETE FROM positions WHERE file = ?", (fileId,))
+                self.database.execute("DELETE FROM files WHERE id = ?", (fileId,))
+        self.database.commit()
+        return indexed
+
+    def __updateFile(self, filename):
+        size = os.path.getsize(filename)
+        row = self.database.execute("SELECT id, size, digest, lines FROM files WHERE name = ?",
+                                    (filename,)).fetchone()
+        if row is not None and row[1] == size and row[2] == fileFingerprint(filename, size):
+            return 0
+        if row is not None and row[1] < size and row[2] == fileFingerprint(filename, row[1]):
+            (fileId, firstLine) = (row[0], row[3]) # puzzles were appended
+        else:
+            if row is not None:
+                self.database.execute("DELETE FROM positions WHERE file = ?", (row[0],))
+                self.database.execute("DELETE FROM files WHERE id = ?", (row[0],))
+            fileId = self.database.execute("INSERT INTO files (name) VALUES (?)", (filename,)).lastrowid
+            firstLine = 0
+        puzzleFile = IndexedPuzzleFile(filename)
+        numberOfLines = len(puzzleFile)
+        rows = ((key, fileId, index) for (index, key) in
+                ((index, self.__positionKey(puzzleFile.readLine(index))) for index in range(firstLine, numberOfLines))
+                if key is not None)
+        while True:
+            batch = list(itertools.islice(rows, 10000))
+            if batch == []:
+                break
+            self.database.executemany("INSERT INTO positions VALUES (?, ?, ?)", batch)
+        puzzleFile.close()
+        self.database.execute("UPDATE files SET size = ?, digest = ?, lines = ? WHERE id = ?",
+                              (size, fileFingerprint(filename, size), numberOfLines, fileId))
+        self.database.commit()
+        return numberOfLines-firstLine
+
+    @staticmethod
+    def __positionKey(line):
+        try:
+            return AnalysisCache.positionKey(chess.Board(json.loads(line)['FEN']))
+        except (ValueError, KeyError): # not a puzzle
+            return None
+
+    def duplicates(self):
+        """
+        Groups of puzzles with the same position, read from the index without loading the puzzles
+        :return: generator of lists of (file name, line), ordered by the number of the file and the line
+        """
+        query = "SELECT positions.hash, files.name, positions.line FROM positions JOIN files ON files.id = " \
+                "positions.file WHERE positions.hash IN (SELECT hash FROM positions GROUP BY hash " \
+                "HAVING COUNT(*) > 1) ORDER BY positions.hash"
+        filenames = seriesFiles(self.folder)
+        for (key, rows) in itertools.groupby(self.database.execute(query), lambda row: row[0]):
+            yield sorted(((name, line) for (key, name, line) in rows),
+                         key=lambda puzzle: (filenames.index(puzzle[0]), puzzle[1]))
+
+    def close(self):
+        self.database.close()
+
+
+def flagDuplicates(folder):
+    """
+    Prints the duplicates of the folder
+    :param folder: name of the folder
+    :return: number of puzzles which are duplicates of another one
+    """
+    index = PositionIndex(folder)
+    index.update()
+    numberOfDuplicates = 0
+    for group in index.duplicates():
+        print(" ".join(name+":"+str(line+1) for (name, line) in group))
+        numberOfDuplicates += len(group)-1
+    index.close()
+    print(str(numberOfDuplicates)+" duplicates")
+    return numberOfDuplicates
+
+
+def mergeDuplicates(folder):
+    """
+    Merges the duplicates of the folder into the first puzzle with the same position
+    :param folder: name of the folder
+    :return: number of removed puzzles
+    """
+    index = PositionIndex(folder)
+    index.update()
+    mergedPuzzles = {} # file name:{line:list of json strings of the duplicates}
+    removedPuzzles = {} # file name:set of lines
+    puzzleFiles = {}
+    for group in index.duplicates():
+        ((name, line), others) = (group[0], group[1:])
+        for (otherName, otherLine) in others:
+            if otherName not in puzzleFiles:
+                puzzleFiles[otherName] = IndexedPuzzleFile(otherName)
+            mergedPuzzles.setdefault(name, {}).setdefault(line, []).append(
+                puzzleFiles[otherName].readLine(otherLine))
+            removedPuzzles.setdefault(otherName, set()).add(otherLine)
+    for puzzleFile in puzzleFiles.values():
+        puzzleFile.close()
+
+    for filename in seriesFiles(folder):
+        if filename not in mergedPuzzles and filename not in removedPuzzles:
+            continue
+        puzzleCollection = ScheduledPuzzleCollection(filename)
+        for (line, duplicates) in mergedPuzzles.get(filename, {}).items():
+            puzzleDict = puzzleCollection.getPuzzle(line).puzzleDict
+            game = parseSolution(puzzleDict)
+            for duplicate in duplicates:
+                duplicateDict = json.loads(duplicate)
+                mergeVariations(game, parseSolution(duplicateDict))
+                puzzleDict['previousSolvingTimes'] += duplicateDict.get('previousSolvingTimes', [])
+            puzzleDict['PGN'] = gameToPGN(game) if game.variations else "" # "*" would be an empty solution
+            if puzzleDict['previousSolvingTimes'] != []:
+                puzzleDict['previousSolvingTimes'] = sorted(puzzleDict['previousSolvingTimes'],
+                                                            key=lambda result: result[0])
+                puzzleDict['level'] = puzzleCollection.getLevel(puzzleDict['previousSolvingTimes'])
+                puzzleDict['lastReview'] = puzzleDict['previousSolvingTimes'][-1][0]
+        for line in removedPuzzles.get(filename, set()):
+            puzzleCollection.removedPuzzles.add(line)
+            puzzleCollection.loadedPuzzles.pop(line, None)
+        puzzleCollection.compact()
+        puzzleCollection.journal.close()
+        puzzleCollection.puzzleFile.close()
+    index.update()
+    index.close()
+    numberOfRemovedPuzzles = sum(len(lines) for lines in removedPuzzles.values())
+    print(str(numberOfRemovedPuzzles)+" duplicates merged")
+    return numberOfRemovedPuzzles
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ["flag", "merge"]:
+        print(__doc__)
+        raise SystemExit(1)
+    if sys.argv[1] == "flag":
+        flagDuplicates(sys.argv[2])
+    else:
+        mergeDuplicates(sys.argv[2])
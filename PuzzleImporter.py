@@ -0,0 +1,252 @@
+"""
+Imports puzzles from large PGN databases or CSV puzzle dumps into a series file. Usage:
+
+    python3 PuzzleImporter.py <dump.pgn|dump.csv> <series file> [processes]
+
+The dump may be compressed (.gz, .bz2, .xz). A PGN game becomes a puzzle starting at its FEN header (or the initial
+position), its moves and variations become the solution. A CSV file is expected in the format of the Lichess puzzle
+database (PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,...): the FEN is the position before
+the move of the opponent, which is the first of the moves. A header row naming the columns FEN and Moves is optional.
+
+The puzzles are read, validated and written as a stream, so the memory needed doesn't depend on the size of the
+dump. Invalid puzzles are skipped. The puzzles are appended to the series file, the results of previous training
+sessions stay valid.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import gzip
+import bz2
+import lzma
+import itertools
+import collections
+import resource
+import logging
+import multiprocessing
+import chess
+import chess.pgn
+from io import StringIO
+
+
+def openDump(filename):
+    """
+    Opens a text file, which may be compressed
+    :param filename: name of the file, the extension decides about the compression
+    :return: file object
+    """
+    openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+    opener = openers.get(os.path.splitext(filename)[1], open)
+    return opener(filename, 'rt', encoding="utf-8", errors="replace", newline="")
+
+
+def readPgnGames(dumpFile):
+    """
+    Splits a PGN file into games without parsing them
+    :param dumpFile: file object
+    :return: generator of PGN strings
+    """
+    lines = []
+    inMoves = False
+    for line in dumpFile:
+        if line.startswith("[") and inMoves:
+            yield "".join(lines)
+            lines = []
+            inMoves = False
+        elif line.strip() != "" and not line.startswith("["):
+            inMoves = True
+        lines.append(line)
+    if inMoves:
+        yield "".join(lines)
+
+
+def readCsvPuzzles(dumpFile):
+    """
+    Reads the rows of a CSV puzzle dump
+    :param dumpFile: file object
+    :return: generator of (FEN, moves, rating, themes)
+    """
+    columns = {"FEN": 1, "Moves": 2, "Rating": 3, "Themes": 7} # Lichess puzzle database
+    for row in csv.reader(dumpFile):
+        if "FEN" in row and "Moves" in row: # header
+            columns = dict((name, row.index(name)) for name in columns if name in row)
+            continue
+        if len(row) <= max(columns["FEN"], columns["Moves"]):
+            yield (None, None, None, None)
+            continue
+        yield tuple(row[columns[name]] if name in columns and columns[name] < len(row) else ""
+                    for name in ("FEN", "Moves", "Rating", "Themes"))
+
+
+def sideToMove(board):
+    return "White to move" if board.turn == chess.WHITE else "Black to move"
+
+
+def gameToPGN(game):
+    """
+    Writes the moves and variations of a game in the format of the field "PGN"
+    :param game: instance of chess.pgn.Game
+    :return: string, e.g. "1. Rxd5 Qxd5 (1... Nxd5 2. Bf3) 2. Bf3"
+    """
+    game.headers["Result"] = "*"
+    exporter = chess.pgn.StringExporter(headers=False, comments=False, columns=None)
+    moveText = game.accept(exporter)
+    return moveText[:-len(" *")] if moveText.endswith(" *") else moveText
+
+
+def convertPgnGame(pgnString):
+    """
+    Converts a PGN game into a puzzle
+    :param pgnString: one game
+    :return: json string of the puzzle or None if the game is invalid
+    """
+    try:
+        game = chess.pgn.read_game(StringIO(pgnString))
+        if game is None or game.errors != [] or game.variations == []:
+            return None
+        board = game.board()
+        if not board.is_valid():
+            return None
+        return json.dumps({"FEN": board.fen(), "description": sideToMove(board), "PGN": gameToPGN(game)})
+    except ValueError: # e.g. invalid FEN header
+        return None
+
+
+def convertCsvPuzzle(row):
+    """
+    Converts a row of a CSV puzzle dump into a puzzle. The first move is played by the opponent.
+    :param row: (FEN, moves, rating, themes)
+    :return: json string of the puzzle or None if the row is invalid
+    """
+    (fen, moves, rating, themes) = row
+    if fen is None:
+        return None
+    try:
+        board = chess.Board(fen)
+        moves = [chess.Move.from_uci(move) for move in moves.split()]
+    except ValueError:
+        return None
+    if len(moves) < 2 or not board.is_valid() or moves[0] not in board.legal_moves:
+        return None
+    board.push(moves[0])
+    game = chess.pgn.Game()
+    game.setup(board)
+    node = game
+    for move in moves[1:]:
+        if not board.is_legal(move):
+            return None
+        board.push(move)
+        node = node.add_variation(move)
+    board = game.board()
+    description = sideToMove(board)
+    details = [text for text in ("rating "+rating if rating else "", themes) if text != ""]
+    if details != []:
+        description += " ("+", ".join(details)+")"
+    return json.dumps({"FEN": board.fen(), "description": description, "PGN": gameToPGN(game)})
+
+
+def startWorker():
+    """
+    Initializer of the worker processes. Invalid games are counted, not logged.
+    :return:
+    """
+    logging.getLogger("chess.pgn").setLevel(logging.CRITICAL)
+
+
+def convertBatch(arguments):
+    """
+    Task of the worker processes
+    :param arguments: (conversion function, list of games or rows)
+    :return: list of json strings or None
+    """
+    (convert, batch) = arguments
+    return [convert(item) for item in batch]
+
+
+def convertInParallel(pool, convert, items, batchesInFlight, batchSize=500):
+    """
+    Converts a stream of items in a process pool. Unlike Pool.imap, the items are only read as fast as they are
+    converted, so at most batchesInFlight batches are in memory.
+    :return: generator of the results in the order of the items
+    """
+    pending = collections.deque()
+    while True:
+        while len(pending) < batchesInFlight:
+            batch = list(itertools.islice(items, batchSize))
+            if batch == []:
+                break
+            pending.append(pool.apply_async(convertBatch, ((convert, batch),)))
+        if len(pending) == 0:
+            return
+        for result in pending.popleft().get():
+            yield result
+
+
+def peakMemory():
+    """
+    :return: peak resident set size of this process and of its terminated child processes in MB
+    """
+    scale = 1024.0 if sys.platform != "darwin" else 1024.0*1024.0 # kilobytes on Linux, bytes on macOS
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/scale)
+
+
+def importPuzzles(dumpFilename, seriesFilename, processes=None, reportEvery=100000):
+    """
+    Appends the valid puzzles of a dump to a series file
+    :param dumpFilename: PGN or CSV file
+    :param seriesFilename: series file, created if necessary
+    :param processes: number of processes validating the puzzles, default: number of cores
+    :param reportEvery: print the progress after this number of puzzles
+    :return: (number of imported puzzles, number of skipped puzzles)
+    """
+    isCsv = ".csv" in os.path.basename(dumpFilename).lower()
+    dumpFile = openDump(dumpFilename)
+    (items, convert) = (readCsvPuzzles(dumpFile), convertCsvPuzzle) if isCsv else \
+        (readPgnGames(dumpFile), convertPgnGame)
+    # the series file has to end with a new line before appending
+    needsNewLine = False
+    if os.path.exists(seriesFilename) and os.path.getsize(seriesFilename) > 0:
+        seriesFile = open(seriesFilename, 'rb')
+        seriesFile.seek(-1, os.SEEK_END)
+        needsNewLine = seriesFile.read(1) != b"\n"
+        seriesFile.close()
+    seriesFile = open(seriesFilename, 'a')
+    if needsNewLine:
+        seriesFile.write("\n")
+
+    processes = processes or os.cpu_count()
+    pool = multiprocessing.Pool(processes, startWorker)
+    imported = 0
+    skipped = 0
+    start = time.time()
+    try:
+        for puzzle in convertInParallel(pool, convert, items, 4*processes):
+            if puzzle is None:
+                skipped += 1
+                continue
+            seriesFile.write(puzzle+"\n")
+            imported += 1
+            if imported % reportEvery == 0:
+                print(str(imported)+" puzzles, "+"%.0f" % (imported/(time.time()-start))+" puzzles per second, "
+                      "peak memory "+"%.1f" % peakMemory()[0]+" MB")
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        dumpFile.close()
+        seriesFile.close()
+    seconds = time.time()-start
+    (memory, childMemory) = peakMemory()
+    print(str(imported)+" puzzles imported, "+str(skipped)+" skipped in "+"%.1f" % seconds+" seconds ("+
+          "%.0f" % (imported/seconds if seconds > 0 else 0.0)+" puzzles per second)")
+    print("Peak memory: "+"%.1f" % memory+" MB (importer), "+"%.1f" % childMemory+" MB (largest worker)")
+    return (imported, skipped)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        raise SystemExit(1)
+    importPuzzles(sys.argv[1], sys.argv[2], *[int(argument) for argument in sys.argv[3:4]])
@@ -0,0 +1,93 @@
+import concurrent.futures
+import chess
+
+
+class PreparedPuzzle:
+    """
+    Everything needed to show a puzzle: the parsed solution tree (cached in the puzzle itself), the position,
+    the rendered board and, for puzzles without PGN data, the started engine search.
+    """
+    def __init__(self, puzzle, board, surface, suggestion):
+        self.puzzle = puzzle
+        self.board = board
+        self.surface = surface
+        self.suggestion = suggestion
+
+
+class PuzzlePrefetcher:
+    """
+    Prepares the next puzzle of a collection in the background while the current one is being solved.
+    The next puzzle is only peeked at (see peekNextIndex), so the collection and its schedule are not changed.
+    If the collection returns a different puzzle than the prepared one, the preparation is discarded.
+    """
+    def __init__(self, puzzleCollection, boardGUI, engineService=None):
+        self.puzzleCollection = puzzleCollection
+        self.boardGUI = boardGUI
+        self.engineService = engineService
+        self.worker = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.prefetchedIndex = None # line of the prepared puzzle
+        self.preparation = None # future of a PreparedPuzzle
+
+    def prefetch(self):
+        """
+        Starts preparing the puzzle which will be returned next by the collection
+        :return:
+        """
+        index = self.puzzleCollection.peekNextIndex()
+        if index == self.prefetchedIndex:
+            return
+        self.discard()
+        if index is None:
+            return
+        self.prefetchedIndex = index
+        self.preparation = self.worker.submit(self.__prepare, self.puzzleCollection.getPuzzle(index))
+
+    def __prepare(self, puzzle):
+        board = chess.Board(puzzle.FEN)
+        suggestion = None
+        if puzzle.game is None and self.engineService is not None:
+            suggestion = self.engineService.analyse(board, background=True)
+        return PreparedPuzzle(puzzle, board, self.boardGUI.renderBoard(board), suggestion)
+
+    def take(self, puzzle):
+        """
+        Returns the preparation of the puzzle if it was prefetched
+        :param puzzle: the puzzle returned by the collection
+        :return: instance of PreparedPuzzle or None
+        """
+        if self.preparation is None or puzzle.index != self.prefetchedIndex:
+            self.discard()
+            return None
+        preparation = self.preparation
+        self.prefetchedIndex = None
+        self.preparation = None
+        if preparation.exception() is not None:
+            return None # the puzzle is prepared again when it is loaded
+        preparedPuzzle = preparation.result()
+        if preparedPuzzle.puzzle is not puzzle: # e.g. renumbered by a compaction
+            self.__cancel(preparation)
+            return None
+        return preparedPuzzle
+
+    def discard(self):
+        """
+        Drops the prepared puzzle and stops its engine search
+        :return:
+        """
+        if self.preparation is not None:
+            self.preparation.add_done_callback(self.__cancel)
+        self.prefetchedIndex = None
+        self.preparation = None
+
+    def __cancel(self, preparation):
+        """
+        Stops the engine search of a finished preparation
+        :param preparation: future of a PreparedPuzzle
+        :return:
+        """
+        if preparation.exception() is None and preparation.result().suggestion is not None:
+            self.engineService.cancel(preparation.result().suggestion)
+
+    def close(self):
+        self.discard()
+        self.worker.shutdown()
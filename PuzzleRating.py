@@ -0,0 +1,448 @@
+"""
+Rates the difficulty of the puzzles of a series file and tags their motifs, so that new puzzles can be chosen by
+difficulty or motif. Usage:
+
+    python3 PuzzleRating.py <series file> [--depth 12] [--processes N] [--no-engine]
+
+The solution of every puzzle (the main line of the PGN data or, without PGN data, the line found by the engine) is
+analysed:
+
+    length      number of plies of the solution
+    gap         centipawns by which the best move beats the second-best one (engine search with 2 lines)
+    material    material balance from the point of view of the side to move, in pawns
+    tags        mate, check, capture, promotion, quiet, sacrifice, fork (see tagNames)
+    difficulty  a heuristic computed from the other values (see difficultyOf)
+
+The puzzles are analysed in parallel by a pool of processes, each with its own engine. The results are written
+into the index file <series file>.ratings (12 bytes per puzzle). A rating belongs to the FEN and PGN data of its
+puzzle (checksum), so after puzzles were added to, changed in or removed from the series file, only the puzzles
+without a rating are analysed again. Without engine (--no-engine) the gap is unknown and puzzles without PGN data
+have no solution, these ratings are replaced by the next run with engine.
+
+The trainer uses the ratings for the new puzzles if the environment variable CHESS_NEW_PUZZLES is set to an order
+(easy or hard) and/or tags, e.g.
+
+    CHESS_NEW_PUZZLES=easy python3 ChessPuzzleTrainer.py            easiest new puzzles first
+    CHESS_NEW_PUZZLES=hard,fork,mate python3 ChessPuzzleTrainer.py  only forks and mates, hardest first
+"""
+import os
+import json
+import time
+import bisect
+import struct
+import argparse
+import multiprocessing
+from array import array
+import chess
+import chess.uci
+from AcceptedMoves import scoreValue, mateValue
+from EngineService import EngineService
+from PuzzleCollection import ChessPuzzle, puzzleChecksum
+from PuzzleStore import IndexedPuzzleFile
+
+pieceValues = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9, chess.KING: 0}
+tagNames = ["mate", "check", "capture", "promotion", "quiet", "sacrifice", "fork"]
+tagBits = dict((name, 1 << i) for (i, name) in enumerate(tagNames))
+engineBit = 1 << 15 # in tags: the puzzle was analysed by the engine, not a motif
+unknownGap = -1
+maxGap = 32767 # e.g. the best move mates and the second-best one doesn't
+maxDifficulty = 1000
+
+engine = None # engine of a worker process
+
+
+def startWorker(enginePath):
+    """
+    Initializer of the worker processes
+    :param enginePath: None if no engine is used
+    :return:
+    """
+    global engine
+    if enginePath is None:
+        return
+    engine = chess.uci.popen_engine(enginePath)
+    engine.uci()
+    if "MultiPV" in engine.options:
+        engine.setoption({"MultiPV": 2})
+    engine.info_handlers.append(chess.uci.InfoHandler())
+
+
+def materialBalance(board):
+    """
+    :return: value of the own pieces minus value of the pieces of the opponent (side to move), in pawns
+    """
+    balance = 0
+    for piece in board.piece_map().values():
+        balance += pieceValues[piece.piece_type] if piece.color == board.turn else -pieceValues[piece.piece_type]
+    return balance
+
+
+def offersMaterial(board, move):
+    """
+    Checks if a move gives material away: the moved piece can be taken by a cheaper piece or isn't defended, and it
+    is worth more than what it captures
+    :param board: position before the move
+    :param move: legal move
+    :return: bool
+    """
+    piece = board.piece_at(move.from_square)
+    if piece.piece_type == chess.KING:
+        return False
+    captured = board.piece_at(move.to_square)
+    gain = 1 if board.is_en_passant(move) else pieceValues[captured.piece_type] if captured is not None else 0
+    value = pieceValues[move.promotion or piece.piece_type]
+    if value <= gain:
+        return False
+    board.push(move)
+    try:
+        if board.is_checkmate():
+            return False
+        attackers = [board.piece_type_at(square) for square in board.attackers(board.turn, move.to_square)]
+        defended = board.is_attacked_by(not board.turn, move.to_square)
+        return any(pieceValues[attacker] < value for attacker in attackers if attacker != chess.KING) \
+            or (attackers != [] and not defended)
+    finally:
+        board.pop()
+
+
+def isFork(board, move):
+    """
+    Checks if the moved piece attacks at least two pieces of the opponent afterwards, each of them the king, more
+    valuable than the moved piece or an undefended knight, bishop, rook or queen
+    :param board: position before the move
+    :param move: legal move
+    :return: bool
+    """
+    board.push(move)
+    try:
+        value = pieceValues[board.piece_type_at(move.to_square)]
+        targets = 0
+        for square in board.attacks(move.to_square):
+            target = board.piece_at(square)
+            if target is None or target.color != board.turn:
+                continue
+            if target.piece_type == chess.KING or pieceValues[target.piece_type] > value \
+                    or (pieceValues[target.piece_type] >= 3 and not board.is_attacked_by(board.turn, square)):
+                targets += 1
+        return targets >= 2
+    finally:
+        board.pop()
+
+
+def mainLine(game):
+    """
+    :param game: instance of chess.pgn.Game
+    :return: list of the moves of the main line
+    """
+    moves = []
+    node = game
+    while node.variations != []:
+        node = node.variations[0]
+        moves.append(node.move)
+    return moves
+
+
+def analyse(board, depth):
+    """
+    Searches the two best moves with the engine of the worker process
+    :return: (main line, gap in centipawns or unknownGap, score value of the best move (see scoreValue) or None)
+    """
+    engine.ucinewgame()
+    engine.position(board)
+    engine.go(depth=depth)
+    with engine.info_handlers[0] as info:
+        scores = info.get("score", {})
+        values = [scoreValue(scores[number].cp, scores[number].mate) for number in sorted(scores)]
+        line = info.get("pv", {}).get(1, [])
+    if values == []:
+        return (line, unknownGap, None)
+    if len(values) == 1:
+        return (line, maxGap if board.legal_moves.count() == 1 else unknownGap, values[0])
+    return (line, max(0, min(maxGap, values[0]-values[1])), values[0])
+
+
+def difficultyOf(length, gap, tags):
+    """
+    A heuristic rating in [0, maxDifficulty]: every move of the user adds 100, a quiet first move (no check, capture
+    or promotion) 100 and a sacrifice 150. If the best move is much better than all others (a single solution which
+    has to be found), up to 100 are added.
+    :param length: plies of the solution
+    :param gap: see analyse
+    :param tags: bits, see tagBits
+    :return: int
+    """
+    difficulty = 100*((length+1)//2)
+    if tags & tagBits["quiet"]:
+        difficulty += 100
+    if tags & tagBits["sacrifice"]:
+        difficulty += 150
+    if gap != unknownGap:
+        difficulty += min(gap, 500)//5
+    return min(difficulty, maxDifficulty)
+
+
+def ratePuzzle(arguments):
+    """
+    Computes the rating of a puzzle
+    :param arguments: (line, depth), line is the json string of the puzzle
+    :return: (checksum, length, gap, material, tags, difficulty), see PuzzleRatings
+    """
+    (line, depth) = arguments
+    puzzle = ChessPuzzle(line)
+    board = chess.Board(puzzle.FEN)
+    (engineLine, gap, bestValue) = ([], unknownGap, None)
+    tags = 0
+    if engine is not None:
+        tags |= engineBit
+        if not board.is_game_over():
+            (engineLine, gap, bestValue) = analyse(board, depth)
+    moves = mainLine(puzzle.game) if puzzle.game is not None else engineLine
+    material = max(-128, min(127, materialBalance(board)))
+    for (ply, move) in enumerate(moves):
+        if ply == 0:
+            if board.is_capture(move):
+                tags |= tagBits["capture"]
+            if move.promotion is not None:
+                tags |= tagBits["promotion"]
+        if ply % 2 == 0: # a move of the user
+            if offersMaterial(board, move):
+                tags |= tagBits["sacrifice"]
+            if isFork(board, move):
+                tags |= tagBits["fork"]
+        board.push(move)
+        if ply == 0:
+            if board.is_check():
+                tags |= tagBits["check"]
+            if tags & (tagBits["check"] | tagBits["capture"] | tagBits["promotion"]) == 0:
+                tags |= tagBits["quiet"]
+    if board.is_checkmate() or (bestValue is not None and bestValue > mateValue//2):
+        tags |= tagBits["mate"]
+    length = min(255, len(moves))
+    return (puzzleChecksum(puzzle.FEN, puzzle.field('PGN')), length, gap, material, tags,
+            difficultyOf(length, gap, tags))
+
+
+class PuzzleRatings:
+    """
+    The ratings of the puzzles of a series file, one per line, stored column by column in arrays. The file
+    <series file>.ratings contains a header and the arrays one after another.
+    """
+    magic = b"PZR2"
+    header = struct.Struct("<4sI") # magic, number of puzzles
+    columns = [("checksums", 'I'), ("lengths", 'B'), ("gaps", 'h'), ("materials", 'b'), ("tags", 'H'),
+               ("difficulties", 'H')]
+    notRated = (0, 0, unknownGap, 0, 0, 0)
+
+    def __init__(self):
+        for (name, typecode) in self.columns:
+            setattr(self, name, array(typecode))
+        self.positions = None # checksum:position of the rating, built by the first find
+        self.duplicatePositions = None # checksum:positions, only for checksums of more than one rating
+
+    def __len__(self):
+        return len(self.checksums)
+
+    def append(self, rating):
+        """
+        :param rating: (checksum, length, gap, material, tags, difficulty)
+        :return:
+        """
+        for ((name, typecode), value) in zip(self.columns, rating):
+            getattr(self, name).append(value)
+        self.positions = None
+
+    def rating(self, position):
+        return tuple(getattr(self, name)[position] for (name, typecode) in self.columns)
+
+    def withoutSolution(self, position):
+        """
+        :return: True if the puzzle was rated without engine and has no PGN data, so its rating is meaningless
+        """
+        return self.lengths[position] == 0 and not self.tags[position] & engineBit
+
+    def __buildIndex(self):
+        self.positions = {}
+        self.duplicatePositions = {}
+        for (position, checksum) in enumerate(self.checksums):
+            if checksum == 0: # notRated
+                continue
+            if checksum not in self.positions:
+                self.positions[checksum] = position
+            else:
+                self.duplicatePositions.setdefault(checksum, [self.positions[checksum]]).append(position)
+
+    def find(self, index, checksum):
+        """
+        Looks for the rating of a puzzle by the checksum of its FEN and PGN data
+        :param index: line of the puzzle in the series file
+        :param checksum: see puzzleChecksum
+        :return: position of the rating or None if the puzzle isn't rated
+        """
+        if self.positions is None:
+            self.__buildIndex()
+        position = self.positions.get(checksum)
+        if position is None or checksum not in self.duplicatePositions:
+            return position
+        # the same puzzle several times: removing puzzles only moves the following lines up, so the rating of the
+        # line is the first one not before it
+        positions = self.duplicatePositions[checksum]
+        return positions[min(bisect.bisect_left(positions, index), len(positions)-1)]
+
+    @classmethod
+    def load(cls, filename):
+        """
+        :param filename: series file
+        :return: instance of PuzzleRatings, empty if there is no (valid) ratings file
+        """
+        ratings = cls()
+        try:
+            with open(filename+".ratings", 'rb') as ratingsFile:
+                (magic, length) = cls.header.unpack(ratingsFile.read(cls.header.size))
+                if magic != cls.magic:
+                    return ratings
+                for (name, typecode) in cls.columns:
+                    getattr(ratings, name).fromfile(ratingsFile, length)
+        except (OSError, EOFError, struct.error):
+            return cls()
+        return ratings
+
+    def save(self, filename):
+        """
+        :param filename: series file
+        :return:
+        """
+        temporaryFilename = filename+".ratings.tmp"
+        with open(temporaryFilename, 'wb') as ratingsFile:
+            ratingsFile.write(self.header.pack(self.magic, len(self)))
+            for (name, typecode) in self.columns:
+                getattr(self, name).tofile(ratingsFile)
+        os.replace(temporaryFilename, filename+".ratings")
+
+
+class NewPuzzleSelection:
+    """
+    Chooses and orders the new puzzles of a ScheduledPuzzleCollection by their ratings. The key of a puzzle in the
+    queue of new puzzles is its difficulty, so the next puzzle is taken from the queue as fast as without ratings.
+    Puzzles without rating (or rated without engine and without solution) come last.
+    """
+    orders = ["easy", "hard"]
+
+    def __init__(self, ratings, order=None, tags=()):
+        """
+        :param ratings: instance of PuzzleRatings
+        :param order: "easy" (easiest first), "hard" (hardest first) or None (random order)
+        :param tags: if not empty, only puzzles with at least one of these tags are presented
+        :return:-
+        """
+        self.ratings = ratings
+        self.order = order
+        self.tagMask = 0
+        for tag in tags:
+            self.tagMask |= tagBits[tag]
+
+    @classmethod
+    def fromSpecification(cls, filename, specification):
+        """
+        :param filename: series file, its ratings are loaded
+        :param specification: comma separated order and tags, e.g. "hard,fork,mate"
+        :return: instance of NewPuzzleSelection
+        """
+        words = [word.strip() for word in specification.split(",") if word.strip() != ""]
+        unknownWords = [word for word in words if word not in cls.orders and word not in tagBits]
+        if unknownWords != []:
+            raise ValueError("Unknown order or tag "+", ".join(unknownWords)+" (known: "
+                             + ", ".join(cls.orders+tagNames)+")")
+        order = ([word for word in words if word in cls.orders] or [None])[-1]
+        return cls(PuzzleRatings.load(filename), order, [word for word in words if word in tagBits])
+
+    def key(self, index, checksum):
+        """
+        :param index: line of a new puzzle
+        :param checksum: checksum of its FEN and PGN data, see puzzleChecksum
+        :return: key in the queue of new puzzles (smaller keys first) or None if the puzzle is not presented
+        """
+        position = self.ratings.find(index, checksum)
+        if position is None or self.ratings.withoutSolution(position):
+            return None if self.tagMask else maxDifficulty+1 if self.order is not None else 0
+        if self.tagMask and not self.ratings.tags[position] & self.tagMask:
+            return None
+        if self.order == "easy":
+            return self.ratings.difficulties[position]
+        if self.order == "hard":
+            return maxDifficulty-self.ratings.difficulties[position]
+        return 0
+
+
+def ratePuzzles(filename, depth=12, processes=None, enginePath=None, useEngine=True):
+    """
+    Rates all puzzles of a series file which are not rated yet and writes the ratings file. With engine, the puzzles
+    rated by a previous run without engine are analysed again.
+    :param filename: series file
+    :param depth: search depth
+    :param processes: number of processes, default: number of cores
+    :param enginePath: default see EngineService
+    :param useEngine: without engine, the gap is unknown and puzzles without PGN data have no solution
+    :return: (instance of PuzzleRatings, number of analysed puzzles)
+    """
+    enginePath = enginePath or os.environ.get("CHESS_ENGINE", EngineService.defaultEnginePath)
+    previousRatings = PuzzleRatings.load(filename)
+    puzzleFile = IndexedPuzzleFile(filename)
+    ratings = [None]*len(puzzleFile)
+    work = []
+    for index in range(len(puzzleFile)):
+        line = puzzleFile.readLine(index)
+        puzzleDict = json.loads(line)
+        position = previousRatings.find(index, puzzleChecksum(puzzleDict['FEN'], puzzleDict.get('PGN')))
+        if position is not None and (not useEngine or previousRatings.tags[position] & engineBit):
+            ratings[index] = previousRatings.rating(position)
+        else:
+            work.append((index, line))
+    puzzleFile.close()
+    if len(work) < len(ratings):
+        print(str(len(ratings)-len(work))+" puzzles are rated already")
+
+    analysed = 0
+    start = time.time()
+    pool = None
+    try:
+        if work != []:
+            pool = multiprocessing.Pool(min(processes or os.cpu_count(), len(work)), startWorker,
+                                        (enginePath if useEngine else None,))
+            results = pool.imap(ratePuzzle, ((line, depth) for (index, line) in work), chunksize=16)
+            for ((index, line), rating) in zip(work, results):
+                ratings[index] = rating
+                analysed += 1
+                if analysed % 1000 == 0:
+                    print(str(analysed)+" puzzles, "+"%.1f" % (analysed/(time.time()-start))+" puzzles per second")
+    finally:
+        if pool is not None:
+            pool.terminate()
+        # the ratings computed so far are kept if the program is interrupted
+        newRatings = PuzzleRatings()
+        for rating in ratings:
+            newRatings.append(rating or PuzzleRatings.notRated)
+        newRatings.save(filename)
+    seconds = time.time()-start
+    print(str(analysed)+" puzzles rated in "+"%.1f" % seconds+" seconds ("+
+          "%.1f" % (analysed/seconds if seconds > 0 else 0.0)+" puzzles per second)")
+    return (newRatings, analysed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rates the difficulty of the puzzles of a series file")
+    parser.add_argument("collection", help="series file")
+    parser.add_argument("--depth", type=int, default=12, help="search depth of the engine")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--no-engine", dest="useEngine", action="store_false",
+                        help="only analyse the PGN solutions, without engine")
+    options = parser.parse_args()
+
+    (ratings, analysed) = ratePuzzles(options.collection, options.depth, options.processes,
+                                      useEngine=options.useEngine)
+    rated = [position for position in range(len(ratings)) if ratings.checksums[position] != 0]
+    for (name, bit) in tagBits.items():
+        print("%-10s %8d" % (name, sum(1 for position in rated if ratings.tags[position] & bit)))
+    if rated != []:
+        difficulties = sorted(ratings.difficulties[position] for position in rated)
+        print("difficulty median %d, 90th percentile %d" % (difficulties[len(difficulties)//2],
+                                                            difficulties[len(difficulties)*9//10]))
@@ -0,0 +1,84 @@
+import heapq
+import random
+from array import array
+
+
+class CalendarQueue:
+    """
+    Priority queue of puzzles (lines in the series file) keyed by their due date. There is one bucket of puzzles per
+    day and a heap containing the days of the non-empty buckets. Within a bucket the puzzles are kept in random order.
+    A bucket is shuffled when it is reached for the first time, so filling the queue with many puzzles is fast.
+    """
+    def __init__(self):
+        self.buckets = {} # day (date ordinal):array of lines
+        self.days = [] # heap of the days with a non-empty bucket
+        self.unshuffledDays = set() # days whose buckets are still in the order of the pushes
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def push(self, day, index):
+        """
+        Inserts a puzzle
+        :param day: due date as ordinal (see datetime.date.toordinal)
+        :param index: line of the puzzle
+        :return:
+        """
+        bucket = self.buckets.get(day)
+        if bucket is None:
+            bucket = self.buckets[day] = array('I')
+            heapq.heappush(self.days, day)
+            self.unshuffledDays.add(day)
+        bucket.append(index)
+        if day not in self.unshuffledDays:
+            # swap the new puzzle to a random position, so the bucket stays shuffled
+            j = random.randrange(len(bucket))
+            bucket[-1], bucket[j] = bucket[j], bucket[-1]
+        self.length += 1
+
+    def __shuffle(self, day):
+        if day in self.unshuffledDays:
+            random.shuffle(self.buckets[day])
+            self.unshuffledDays.discard(day)
+
+    def peek(self, today):
+        """
+        Returns the puzzle which would be returned by popDue without removing it
+        :param today: date ordinal
+        :return: line of the puzzle or None if no puzzle is due
+        """
+        if self.days == [] or self.days[0] > today:
+            return None
+        self.__shuffle(self.days[0])
+        return self.buckets[self.days[0]][-1]
+
+    def popDue(self, today):
+        """
+        Removes and returns a puzzle of the earliest due date, if it is due
+        :param today: date ordinal
+        :return: line of the puzzle or None if no puzzle is due
+        """
+        index = self.peek(today)
+        if index is None:
+            return None
+        day = self.days[0]
+        bucket = self.buckets[day]
+        bucket.pop()
+        if len(bucket) == 0:
+            heapq.heappop(self.days)
+            del self.buckets[day]
+            self.unshuffledDays.discard(day)
+        self.length -= 1
+        return index
+
+    def due(self, today):
+        """
+        Lists the due puzzles in the order in which popDue returns them, without removing them
+        :param today: date ordinal
+        :return: list of lines
+        """
+        days = sorted(day for day in self.days if day <= today)
+        for day in days:
+            self.__shuffle(day)
+        return [index for day in days for index in reversed(self.buckets[day])]
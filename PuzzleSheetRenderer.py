@@ -0,0 +1,167 @@
+"""
+Renders the puzzles of a series file as diagrams for offline study. Usage:
+
+    python3 PuzzleSheetRenderer.py <series file> <output folder> [options]
+
+By default every puzzle is written into its own PNG file (<output folder>/puzzle-<line>.png). With --sheet the boards
+are arranged on printable pages (contact sheets, --columns times --rows boards per page) with the line of the puzzle
+and its description below each board. With --due only the puzzles due for review today are rendered, in the order
+of the trainer. The boards are drawn by MyChessBoard.renderBoard without a window, in parallel by a pool of
+processes. Every process loads the images of the figures once. The number of boards per second is reported.
+
+Example: today's reviews on pages of 3x4 boards
+
+    python3 PuzzleSheetRenderer.py series/series1 sheets --due --sheet
+"""
+import os
+import time
+import argparse
+import multiprocessing
+import chess
+import pygame
+from MyChessBoard import MyChessBoard
+from PuzzleCollection import PuzzleCollection, ScheduledPuzzleCollection
+
+renderer = None # board without screen of a worker process
+font = None # font of the captions of a worker process
+
+
+def startWorker(boardSize):
+    """
+    Initializer of the worker processes. An empty position is rendered once, so the scaled images of the figures
+    and the empty board are cached for all following boards.
+    :param boardSize: in pixels
+    :return:
+    """
+    global renderer, font
+    pygame.font.init()
+    renderer = MyChessBoard(boardSize, chess.Board(), None)
+    renderer.renderBoard(chess.Board())
+    font = pygame.font.Font(None, max(12, boardSize//12))
+
+
+def renderDiagrams(task):
+    """
+    Writes one PNG file per puzzle
+    :param task: list of (filename, FEN)
+    :return: number of rendered boards
+    """
+    for (filename, fen) in task:
+        pygame.image.save(renderer.renderBoard(chess.Board(fen)), filename)
+    return len(task)
+
+
+def renderSheet(task):
+    """
+    Writes a page with a grid of boards, each with a caption below
+    :param task: (filename, columns, rows, list of (FEN, caption))
+    :return: number of rendered boards
+    """
+    (filename, columns, rows, puzzles) = task
+    boardSize = renderer.sizeX
+    margin = boardSize//10
+    captionHeight = font.get_linesize()+margin//2
+    sheet = pygame.Surface((columns*boardSize+(columns+1)*margin,
+                            rows*(boardSize+captionHeight)+(rows+1)*margin))
+    sheet.fill((255, 255, 255))
+    for (i, (fen, caption)) in enumerate(puzzles):
+        left = margin+(i % columns)*(boardSize+margin)
+        top = margin+(i//columns)*(boardSize+captionHeight+margin)
+        sheet.blit(renderer.renderBoard(chess.Board(fen)), (left, top))
+        pygame.draw.rect(sheet, (0, 0, 0), pygame.Rect(left-1, top-1, boardSize+2, boardSize+2), 1)
+        text = font.render(caption, True, (0, 0, 0))
+        # long captions are cut at the width of the board
+        sheet.blit(text, (left, top+boardSize+margin//4), pygame.Rect(0, 0, boardSize, captionHeight))
+    pygame.image.save(sheet, filename)
+    return len(puzzles)
+
+
+def caption(index, puzzleDict):
+    """
+    :return: line and description of a puzzle, or the side to move if it has no description
+    """
+    description = puzzleDict.get('description', "")
+    if description == "":
+        description = ("White" if puzzleDict['FEN'].split()[1] == "w" else "Black")+" to move"
+    return "#"+str(index)+"  "+description
+
+
+def renderPuzzles(filename, folder, due=False, sheet=False, boardSize=240, columns=3, rows=4, processes=None,
+                  limit=None):
+    """
+    Renders the puzzles of a series file
+    :param filename: series file
+    :param folder: output folder, created if necessary
+    :param due: only the puzzles due for review today (see ScheduledPuzzleCollection.duePuzzles)
+    :param sheet: pages with columns*rows boards instead of one file per puzzle
+    :param boardSize: in pixels
+    :param processes: number of processes, default: number of cores
+    :param limit: maximal number of puzzles
+    :return: (number of boards, seconds)
+    """
+    puzzleCollection = ScheduledPuzzleCollection(filename) if due else PuzzleCollection(filename)
+    if due:
+        indices = puzzleCollection.duePuzzles()
+    else:
+        indices = [index for index in range(len(puzzleCollection.puzzleFile))
+                   if index not in puzzleCollection.removedPuzzles]
+    puzzles = []
+    for index in indices[:limit]:
+        puzzleDict = puzzleCollection.getPuzzleDict(index)
+        puzzles.append((index, puzzleDict['FEN'], caption(index, puzzleDict)))
+    puzzleCollection.journal.close()
+    puzzleCollection.puzzleFile.close()
+
+    os.makedirs(folder, exist_ok=True)
+    if sheet:
+        perPage = columns*rows
+        tasks = [(os.path.join(folder, "sheet-%04d.png" % (page+1)), columns, rows,
+                  [(fen, text) for (index, fen, text) in puzzles[page*perPage:(page+1)*perPage]])
+                 for page in range((len(puzzles)+perPage-1)//perPage)]
+        function = renderSheet
+    else:
+        chunkSize = 50 # boards per task, fewer messages between the processes
+        tasks = [[(os.path.join(folder, "puzzle-"+str(index)+".png"), fen)
+                  for (index, fen, text) in puzzles[start:start+chunkSize]]
+                 for start in range(0, len(puzzles), chunkSize)]
+        function = renderDiagrams
+
+    start = time.time()
+    processes = min(processes or os.cpu_count(), max(1, len(tasks)))
+    if processes == 1:
+        startWorker(boardSize)
+        results = map(function, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, startWorker, (boardSize,))
+        results = pool.imap_unordered(function, tasks)
+    rendered = 0
+    try:
+        for boards in results:
+            if (rendered+boards)//1000 > rendered//1000:
+                print(str(rendered+boards)+" boards, "+"%.1f" % ((rendered+boards)/(time.time()-start))
+                      +" boards per second")
+            rendered += boards
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return (rendered, time.time()-start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the puzzles of a series file as PNG diagrams or sheets")
+    parser.add_argument("collection", help="series file")
+    parser.add_argument("folder", help="output folder")
+    parser.add_argument("--due", action="store_true", help="only the puzzles due for review today")
+    parser.add_argument("--sheet", action="store_true", help="pages with several boards")
+    parser.add_argument("--size", type=int, default=240, help="size of a board in pixels")
+    parser.add_argument("--columns", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=None, help="maximal number of puzzles")
+    options = parser.parse_args()
+
+    (boards, seconds) = renderPuzzles(options.collection, options.folder, options.due, options.sheet, options.size,
+                                      options.columns, options.rows, options.processes, options.limit)
+    print(str(boards)+" boards rendered in "+"%.1f" % seconds+" seconds ("+
+          "%.1f" % (boards/seconds if seconds > 0 else 0.0)+" boards per second)")
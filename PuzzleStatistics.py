@@ -0,0 +1,315 @@
+"""
+Statistics about the solving history of a series file or a puzzle database. Usage:
+
+    python3 PuzzleStatistics.py <series file|database.sqlite> [text|csv] [user]
+
+The report contains the retention per level, the distribution of the solving times, the daily workload and the
+puzzles whose solving times keep crossing the treshold of the schedule. The CSV output has one table per section,
+the first column names the section. Requires numpy.
+"""
+import gc
+import re
+import sys
+import csv
+import json
+import sqlite3
+import datetime
+import contextlib
+import numpy
+from PuzzleCollection import ReviewSchedule, parseDay
+from PuzzleStore import IndexedPuzzleFile
+from ResultJournal import ResultJournal
+
+historyKey = re.compile(rb'"previousSolvingTimes"\s*:\s*')
+jsonDecoder = json.JSONDecoder()
+
+
+def readHistories(puzzleFile):
+    """
+    Reads only the histories of the puzzles of a series file. The file is searched for the field
+    "previousSolvingTimes" at once, the rest of the json strings isn't parsed.
+    :param puzzleFile: instance of IndexedPuzzleFile
+    :return: dictionary line:list of [date, solving time or "not solved"]
+    """
+    data = puzzleFile.data
+    starts = numpy.array([match.end() for match in historyKey.finditer(data)], dtype=numpy.uint64)
+    if len(starts) == 0:
+        return {}
+    # the index contains the start of every line and the end of the last one
+    lineStarts = numpy.frombuffer(puzzleFile.index, dtype=numpy.uint64, offset=puzzleFile.header.size)
+    lines = numpy.searchsorted(lineStarts, starts, side='right')-1
+    return dict((line, jsonDecoder.raw_decode(data[start:end].decode("utf-8"))[0])
+                for (line, start, end) in zip(lines.tolist(), starts.tolist(), lineStarts[lines+1].tolist()))
+
+
+@contextlib.contextmanager
+def garbageCollectionPaused():
+    """
+    Millions of small lists without cycles are created, the collector would only scan them again and again
+    """
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if wasEnabled:
+            gc.enable()
+
+
+def nextLevels(schedule, levels, positions, solvingTimes):
+    """
+    Vectorized version of ReviewSchedule.getNextLevel: the levels of many puzzles after one more result
+    :param schedule: instance of ReviewSchedule, its treshold is used
+    :param levels: array of the levels before the results
+    :param positions: array of the positions of the results in the histories
+    :param solvingTimes: array of solving times, NaN if the puzzle was not solved
+    :return: array of the new levels
+    """
+    solved = ~numpy.isnan(solvingTimes)
+    slow = solved & (solvingTimes >= schedule.treshold)
+    fast = solved & (solvingTimes <= schedule.treshold)
+    decrease = (positions > 1) & slow & (levels > 1)
+    increase = ~decrease & (fast | (slow & (levels == 0)))
+    return numpy.where(~solved, 0, levels-decrease+increase)
+
+
+class SolvingHistory:
+    """
+    All results of a collection as columns, one row per result, ordered by puzzle and date:
+    - puzzles: line in the series file or id in the database
+    - days: date ordinal (see datetime.date.toordinal)
+    - solvingTimes: seconds, NaN if the puzzle was not solved
+    - positions: position of the result in the history of the puzzle
+    - levels: level of the puzzle before the result
+    numberOfPuzzles also counts the puzzles which were never presented.
+    """
+    def __init__(self, puzzles, days, solvingTimes, schedule=None, numberOfPuzzles=None):
+        self.schedule = schedule or ReviewSchedule()
+        self.puzzles = numpy.asarray(puzzles, dtype=numpy.int64)
+        self.days = numpy.asarray(days, dtype=numpy.int64)
+        self.solvingTimes = numpy.asarray(solvingTimes, dtype=numpy.float64)
+        starts = numpy.flatnonzero(numpy.r_[True, self.puzzles[1:] != self.puzzles[:-1]]) if len(self.puzzles) > 0 \
+            else numpy.zeros(0, dtype=numpy.int64)
+        lengths = numpy.diff(numpy.r_[starts, len(self.puzzles)])
+        self.positions = numpy.arange(len(self.puzzles))-numpy.repeat(starts, lengths)
+        self.levels = self.__replayLevels(starts, lengths)
+        self.historyStarts = starts
+        self.historyLengths = lengths
+        self.numberOfPuzzles = numberOfPuzzles if numberOfPuzzles is not None else len(starts)
+
+    def __replayLevels(self, starts, lengths):
+        """
+        Folds the histories of all puzzles at once, one step per position in the histories
+        :return: array of the levels before each result
+        """
+        levels = numpy.empty(len(self.puzzles), dtype=numpy.int64)
+        current = numpy.ones(len(starts), dtype=numpy.int64) # level of each puzzle
+        for position in range(lengths.max() if len(lengths) > 0 else 0):
+            active = lengths > position
+            rows = starts[active]+position
+            levels[rows] = current[active]
+            current[active] = nextLevels(self.schedule, current[active], numpy.full(len(rows), position),
+                                         self.solvingTimes[rows])
+        self.finalLevels = current
+        return levels
+
+    @classmethod
+    def fromSeriesFile(cls, filename):
+        """
+        Reads the histories of all puzzles of a series file, including the results in its journal. Nothing is
+        written, except the index of the series file if it is outdated.
+        :param filename: series file
+        :return: instance of SolvingHistory
+        """
+        puzzleFile = IndexedPuzzleFile(filename)
+        journal = ResultJournal(filename, readOnly=True)
+        removedPuzzles = set()
+        journalResults = {} # line:results of the journal
+        for record in journal.records():
+            index = record["line"]
+            if index >= len(puzzleFile) or index in removedPuzzles:
+                continue
+            if record.get("removed", False):
+                removedPuzzles.add(index)
+                journalResults.pop(index, None)
+            else:
+                journalResults.setdefault(index, []).append(record["result"])
+        with garbageCollectionPaused():
+            histories = readHistories(puzzleFile)
+            for (index, results) in journalResults.items():
+                histories[index] = histories.get(index, [])+results
+            numberOfPuzzles = len(puzzleFile)-len(removedPuzzles)
+            puzzleFile.close()
+            indices = [index for index in sorted(histories) if index not in removedPuzzles]
+            puzzles = numpy.repeat(numpy.array(indices, dtype=numpy.int64),
+                                   [len(histories[index]) for index in indices])
+            dates = [date for index in indices for (date, solved) in histories[index]]
+            ordinals = dict((date, parseDay(date)) for date in set(dates)) # there are far fewer days than results
+            days = numpy.fromiter(map(ordinals.__getitem__, dates), numpy.int64, len(dates))
+            solvingTimes = numpy.array([solved for index in indices for (date, solved) in histories[index]],
+                                       dtype=object)
+            solvingTimes[solvingTimes == "not solved"] = numpy.nan
+            solvingTimes = solvingTimes.astype(numpy.float64)
+        return cls(puzzles, days, solvingTimes, numberOfPuzzles=numberOfPuzzles)
+
+    @classmethod
+    def fromDatabase(cls, filename, user=""):
+        """
+        Reads the histories of a user from a puzzle database (see SqlitePuzzleCollection)
+        :param filename: name of the database
+        :param user: owner of the results
+        :return: instance of SolvingHistory
+        """
+        database = sqlite3.connect(filename)
+        rows = database.execute("SELECT reviews.puzzle, reviews.date, reviews.solvingTime FROM reviews JOIN schedule "
+                                "ON schedule.user = reviews.user AND schedule.puzzle = reviews.puzzle WHERE "
+                                "reviews.user = ? AND schedule.removed = 0 ORDER BY reviews.puzzle, reviews.rowid",
+                                (user,)).fetchall()
+        numberOfPuzzles = database.execute("SELECT COUNT(*) FROM schedule WHERE user = ? AND removed = 0",
+                                           (user,)).fetchone()[0]
+        database.close()
+        if rows == []:
+            return cls([], [], [], numberOfPuzzles=numberOfPuzzles)
+        (puzzles, dates, solvingTimes) = zip(*rows)
+        return cls(puzzles, [parseDay(date) for date in dates],
+                   numpy.array([numpy.nan if solved is None else solved for solved in solvingTimes]),
+                   numberOfPuzzles=numberOfPuzzles)
+
+    def currentState(self):
+        """
+        The state of the puzzles which were presented before
+        :return: (levels, date ordinals of the last reviews, numbers of results), one entry per puzzle
+        """
+        lastRows = self.historyStarts+self.historyLengths-1
+        return (self.finalLevels, self.days[lastRows], self.historyLengths)
+
+    def __len__(self):
+        return len(self.puzzles)
+
+    def retentionPerLevel(self):
+        """
+        How well the puzzles are remembered at each level. First attempts are not counted, they measure how hard
+        the puzzles are and not how well they are remembered.
+        :return: list of (level, reviews, solved fraction, fraction solved within the treshold, median solving time)
+        """
+        repeated = self.positions > 0
+        levels = self.levels[repeated]
+        solvingTimes = self.solvingTimes[repeated]
+        table = []
+        for level in numpy.unique(levels):
+            times = solvingTimes[levels == level]
+            solvedTimes = times[~numpy.isnan(times)]
+            table.append((int(level), len(times), len(solvedTimes)/len(times),
+                          numpy.count_nonzero(solvedTimes <= self.schedule.treshold)/len(times),
+                          float(numpy.median(solvedTimes)) if len(solvedTimes) > 0 else numpy.nan))
+        return table
+
+    def solvingTimeDistribution(self, bounds=(10, 30, 60, 120, 300)):
+        """
+        :param bounds: upper bounds of the buckets in seconds
+        :return: (list of (percentile, seconds), list of (bucket, number of results)), the last bucket contains the
+        results which were not solved
+        """
+        solvedTimes = self.solvingTimes[~numpy.isnan(self.solvingTimes)]
+        percentiles = (10, 25, 50, 75, 90, 99)
+        values = numpy.percentile(solvedTimes, percentiles) if len(solvedTimes) > 0 else [numpy.nan]*len(percentiles)
+        counts = numpy.bincount(numpy.searchsorted(bounds, solvedTimes, side='left'), minlength=len(bounds)+1)
+        names = ["<="+str(bounds[0])+"s"]+[str(low)+"-"+str(high)+"s" for (low, high) in zip(bounds, bounds[1:])] + \
+                [">"+str(bounds[-1])+"s", "not solved"]
+        return (list(zip(percentiles, map(float, values))),
+                list(zip(names, list(map(int, counts)) + [len(self.solvingTimes)-len(solvedTimes)])))
+
+    def dailyWorkload(self):
+        """
+        :return: list of (date, results, solved, seconds spent on solved puzzles)
+        """
+        (days, inverse) = numpy.unique(self.days, return_inverse=True)
+        solved = ~numpy.isnan(self.solvingTimes)
+        reviews = numpy.bincount(inverse, minlength=len(days))
+        solvedReviews = numpy.bincount(inverse, weights=solved, minlength=len(days))
+        seconds = numpy.bincount(inverse, weights=numpy.where(solved, self.solvingTimes, 0.0), minlength=len(days))
+        return [(datetime.date.fromordinal(int(day)), int(count), int(solvedCount), float(spent))
+                for (day, count, solvedCount, spent) in zip(days, reviews, solvedReviews, seconds)]
+
+    def tresholdCrossings(self, minimalCrossings=2):
+        """
+        Puzzles whose solving times alternate between below and above the treshold, i.e. which are not really learnt
+        :param minimalCrossings: minimal number of changes
+        :return: list of (puzzle, crossings, solved results, mean solving time), most crossings first
+        """
+        solved = ~numpy.isnan(self.solvingTimes)
+        puzzles = self.puzzles[solved]
+        solvingTimes = self.solvingTimes[solved]
+        (uniquePuzzles, inverse) = numpy.unique(puzzles, return_inverse=True)
+        slow = solvingTimes > self.schedule.treshold
+        crossing = (puzzles[1:] == puzzles[:-1]) & (slow[1:] != slow[:-1])
+        crossings = numpy.bincount(inverse[1:][crossing], minlength=len(uniquePuzzles))
+        results = numpy.bincount(inverse, minlength=len(uniquePuzzles))
+        seconds = numpy.bincount(inverse, weights=solvingTimes, minlength=len(uniquePuzzles))
+        selected = numpy.flatnonzero(crossings >= minimalCrossings)
+        selected = selected[numpy.argsort(-crossings[selected], kind='stable')]
+        return [(int(uniquePuzzles[i]), int(crossings[i]), int(results[i]), float(seconds[i]/results[i]))
+                for i in selected]
+
+
+def writeTextReport(history, output=sys.stdout, days=30, puzzles=20):
+    """
+    :param history: instance of SolvingHistory
+    :param output: file object
+    :param days: number of days of the workload shown
+    :param puzzles: number of puzzles crossing the treshold shown
+    :return:
+    """
+    output.write(str(len(history))+" results of "+str(len(numpy.unique(history.puzzles)))+" puzzles\n\n")
+    output.write("Retention per level (repetitions only)\n")
+    output.write("level  reviews  solved  within "+str(history.schedule.treshold)+"s  median time\n")
+    for (level, reviews, solved, fast, median) in history.retentionPerLevel():
+        output.write("%5d  %7d  %5.1f%%  %11.1f%%  %11s\n" % (level, reviews, 100*solved, 100*fast,
+                                                              "-" if numpy.isnan(median) else "%.1fs" % median))
+    (percentiles, buckets) = history.solvingTimeDistribution()
+    output.write("\nSolving times\n")
+    output.write("  ".join("p"+str(percentile)+": %.1fs" % seconds for (percentile, seconds) in percentiles)+"\n")
+    for (bucket, count) in buckets:
+        output.write("%10s  %d\n" % (bucket, count))
+    workload = history.dailyWorkload()
+    output.write("\nDaily workload (last "+str(days)+" training days of "+str(len(workload))+")\n")
+    for (day, reviews, solved, seconds) in workload[-days:]:
+        output.write("%s  %5d reviews  %5d solved  %7.0fs\n" % (day, reviews, solved, seconds))
+    crossings = history.tresholdCrossings()
+    output.write("\nPuzzles crossing the treshold repeatedly ("+str(len(crossings))+")\n")
+    for (puzzle, count, reviews, mean) in crossings[:puzzles]:
+        output.write("puzzle %d: %d crossings in %d solved results, mean time %.1fs\n" % (puzzle, count, reviews, mean))
+
+
+def writeCsvReport(history, output=sys.stdout):
+    writer = csv.writer(output)
+    writer.writerow(["retention", "level", "reviews", "solved", "solvedWithinTreshold", "medianSeconds"])
+    for row in history.retentionPerLevel():
+        writer.writerow(("retention",)+row)
+    (percentiles, buckets) = history.solvingTimeDistribution()
+    writer.writerow(["percentile", "percentile", "seconds"])
+    for row in percentiles:
+        writer.writerow(("percentile",)+row)
+    writer.writerow(["histogram", "bucket", "results"])
+    for row in buckets:
+        writer.writerow(("histogram",)+row)
+    writer.writerow(["workload", "date", "reviews", "solved", "seconds"])
+    for row in history.dailyWorkload():
+        writer.writerow(("workload",)+row)
+    writer.writerow(["crossings", "puzzle", "crossings", "solvedResults", "meanSeconds"])
+    for row in history.tresholdCrossings():
+        writer.writerow(("crossings",)+row)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or (len(sys.argv) > 2 and sys.argv[2] not in ["text", "csv"]):
+        print(__doc__)
+        raise SystemExit(1)
+    if sys.argv[1].endswith(".sqlite"):
+        history = SolvingHistory.fromDatabase(sys.argv[1], sys.argv[3] if len(sys.argv) > 3 else "")
+    else:
+        history = SolvingHistory.fromSeriesFile(sys.argv[1])
+    if len(sys.argv) > 2 and sys.argv[2] == "csv":
+        writeCsvReport(history)
+    else:
+        writeTextReport(history)
@@ -0,0 +1,126 @@
+import os
+import mmap
+import struct
+from array import array
+
+
+class IndexedPuzzleFile:
+    """
+    Random access to the puzzles of a series file (one json string per line). The byte offsets of the lines are
+    stored in a binary sidecar file (filename+".idx"). Both files are read through mmap, hence only the pages
+    containing the puzzles which are actually used are loaded into memory.
+    """
+    header = struct.Struct("<QQ") # size and modification time (ns) of the indexed series file
+    offset = struct.Struct("<Q") # start of a line in the series file
+
+    def __init__(self, filename):
+        """
+        Opens the series file. The index is (re)built if it is missing or outdated.
+        :param filename: series file
+        :return:-
+        """
+        self.filename = filename
+        self.indexFilename = filename+".idx"
+        self.open()
+
+    def open(self):
+        """
+        Maps the series file and its index into memory
+        :return:
+        """
+        self.file = open(self.filename, 'rb')
+        status = os.fstat(self.file.fileno())
+        self.fileHeader = self.header.pack(status.st_size, status.st_mtime_ns)
+        # mmap can't map empty files
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if status.st_size > 0 else b""
+        if not self.__indexIsCurrent():
+            self.__buildIndex()
+        self.indexFile = open(self.indexFilename, 'rb')
+        self.index = mmap.mmap(self.indexFile.fileno(), 0, access=mmap.ACCESS_READ)
+        # the index contains one offset per line and the end of the last line
+        self.length = (len(self.index)-self.header.size)//self.offset.size-1
+
+    def close(self):
+        """
+        Unmaps the files
+        :return:
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.index.close()
+        self.indexFile.close()
+        self.file.close()
+
+    def __indexIsCurrent(self):
+        """
+        Checks if the sidecar index belongs to the current version of the series file
+        :return: bool
+        """
+        try:
+            indexFile = open(self.indexFilename, 'rb')
+        except IOError:
+            return False
+        storedHeader = indexFile.read(self.header.size)
+        indexFile.close()
+        return storedHeader == self.fileHeader
+
+    def __buildIndex(self, chunkSize=65536):
+        """
+        Scans the series file once and writes the start of every non-empty line into the sidecar file.
+        The offsets are written in chunks, so the memory used doesn't depend on the size of the file.
+        :param chunkSize: number of offsets kept in memory
+        :return:
+        """
+        temporaryFilename = self.indexFilename+".tmp"
+        indexFile = open(temporaryFilename, 'wb')
+        indexFile.write(self.fileHeader)
+        offsets = array('Q')
+        position = 0
+        end = 0
+        size = len(self.data)
+        while position < size:
+            lineEnd = self.data.find(b"\n", position)
+            if lineEnd == -1:
+                lineEnd = size
+            if self.data[position:lineEnd].strip() != b"": # skip empty lines
+                offsets.append(position)
+                end = lineEnd
+            if len(offsets) >= chunkSize:
+                offsets.tofile(indexFile)
+                offsets = array('Q')
+            position = lineEnd+1
+        offsets.append(end)
+        offsets.tofile(indexFile)
+        indexFile.close()
+        os.replace(temporaryFilename, self.indexFilename)
+
+    def __len__(self):
+        return self.length
+
+    def __offset(self, i):
+        return self.offset.unpack_from(self.index, self.header.size+i*self.offset.size)[0]
+
+    def readLine(self, i):
+        """
+        Returns the i-th puzzle of the file
+        :param i: number of the puzzle
+        :return: json string
+        """
+        if i < 0 or i >= self.length:
+            raise IndexError("puzzle index out of range")
+        start = self.__offset(i)
+        end = self.__offset(i+1)
+        line = self.data[start:end]
+        # the end of a line is the start of the next one
+        lineEnd = line.find(b"\n")
+        if lineEnd != -1:
+            line = line[:lineEnd]
+        return line.decode("utf-8")
+
+    def __iter__(self):
+        """
+        Iterates over all puzzles in the order of the file
+        :return: json strings
+        """
+        for i in range(self.length):
+            yield self.readLine(i)
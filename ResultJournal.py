@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import hashlib
+
+
+def fileFingerprint(filename, size, window=4096):
+    """
+    Identifies the first 'size' bytes of a file by a digest of the bytes just before 'size'.
+    Appending to the file doesn't change the fingerprint, rewriting it does.
+    :param filename: name of the file
+    :param size: number of bytes belonging to the fingerprint
+    :param window: number of bytes which are hashed
+    :return: hex string
+    """
+    digest = hashlib.sha1()
+    fingerprintedFile = open(filename, 'rb')
+    fingerprintedFile.seek(max(0, size-window))
+    digest.update(fingerprintedFile.read(size-max(0, size-window)))
+    fingerprintedFile.close()
+    return digest.hexdigest()
+
+
+class ResultJournal:
+    """
+    Append-only log of all changes of a series file (the base file) made during training sessions.
+    Each line is a json record, e.g. {"line": 3, "result": ["2015-03-01", 12.5]} or {"line": 3, "removed": true}.
+    The first line identifies the version of the base file the records belong to. A journal which doesn't belong
+    to the current base file (e.g. after a crash during compaction) is ignored.
+    The records are flushed immediately, but written to disk (fsync) only in batches.
+    """
+    def __init__(self, baseFilename, syncEvery=10, syncInterval=5.0, readOnly=False):
+        """
+        Opens the journal of a base file. A new journal is started if there is none for the current base file.
+        :param baseFilename: series file
+        :param syncEvery: fsync after this number of records...
+        :param syncInterval: ...or if the last fsync is longer ago than this number of seconds
+        :param readOnly: only read the records, no file is created or changed (a journal which doesn't belong to the
+        base file has no records)
+        :return:-
+        """
+        self.baseFilename = baseFilename
+        self.filename = baseFilename+".journal"
+        self.syncEvery = syncEvery
+        self.syncInterval = syncInterval
+        self.unsyncedRecords = 0
+        self.lastSync = time.time()
+        self.numberOfRecords = 0
+        self.ignored = False # the journal doesn't belong to the base file (read-only mode)
+        if not self.__belongsToBaseFile():
+            if readOnly:
+                self.ignored = True
+            else:
+                self.reset()
+        else:
+            self.numberOfRecords = sum(1 for record in self.records())
+        self.file = None if readOnly else open(self.filename, 'a')
+
+    def __header(self):
+        size = os.path.getsize(self.baseFilename)
+        return {"baseSize": size, "baseDigest": fileFingerprint(self.baseFilename, size)}
+
+    def __belongsToBaseFile(self):
+        """
+        Checks if the journal was started for the current base file (or a version of it with appended puzzles)
+        :return: bool
+        """
+        try:
+            journalFile = open(self.filename)
+        except IOError:
+            return False
+        try:
+            header = json.loads(journalFile.readline())
+        except ValueError:
+            return False
+        finally:
+            journalFile.close()
+        if os.path.getsize(self.baseFilename) < header["baseSize"]:
+            return False
+        return fileFingerprint(self.baseFilename, header["baseSize"]) == header["baseDigest"]
+
+    def records(self):
+        """
+        Reads all records of the journal. An incomplete last record (e.g. due to a crash) is skipped.
+        :return: generator of dictionaries
+        """
+        if self.ignored:
+            return
+        journalFile = open(self.filename)
+        journalFile.readline() # header
+        for line in journalFile:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                break
+        journalFile.close()
+
+    def append(self, record):
+        """
+        Appends a record to the journal
+        :param record: dictionary
+        :return:
+        """
+        self.file.write(json.dumps(record)+"\n")
+        self.file.flush()
+        self.numberOfRecords += 1
+        self.unsyncedRecords += 1
+        if self.unsyncedRecords >= self.syncEvery or time.time()-self.lastSync >= self.syncInterval:
+            self.sync()
+
+    def sync(self):
+        """
+        Writes all records to disk
+        :return:
+        """
+        if self.unsyncedRecords > 0:
+            os.fsync(self.file.fileno())
+        self.unsyncedRecords = 0
+        self.lastSync = time.time()
+
+    def reset(self):
+        """
+        Replaces the journal by an empty journal for the current base file. Called after the records were folded
+        into the base file.
+        :return:
+        """
+        if getattr(self, "file", None) is not None:
+            self.file.close()
+        temporaryFilename = self.filename+".tmp"
+        journalFile = open(temporaryFilename, 'w')
+        journalFile.write(json.dumps(self.__header())+"\n")
+        journalFile.flush()
+        os.fsync(journalFile.fileno())
+        journalFile.close()
+        os.replace(temporaryFilename, self.filename)
+        self.numberOfRecords = 0
+        self.unsyncedRecords = 0
+        if getattr(self, "file", None) is not None:
+            self.file = open(self.filename, 'a')
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
@@ -0,0 +1,370 @@
+"""
+Puzzle collection stored in a SQLite database instead of a series file. Usage:
+
+    python3 SqlitePuzzleCollection.py migrate <series file> <database> [user]
+    python3 SqlitePuzzleCollection.py export <database> <series file> [user]
+
+"migrate" copies the puzzles of a series file (including the results in its journal) into the database and checks
+that every puzzle can be read back unchanged. "export" writes the puzzles of the database as a series file.
+The trainer uses the database if its name (ending with .sqlite) is entered instead of a folder.
+"""
+import sys
+import json
+import random
+import sqlite3
+import datetime
+import time
+from array import array
+import Instrumentation
+from PuzzleCollection import ChessPuzzle, ReviewSchedule, ScheduledPuzzleCollection
+
+# fields of the json data stored in their own columns or tables, all others are kept as json string
+ownFields = ['FEN', 'description', 'PGN', 'previousSolvingTimes', 'level', 'lastReview', 'tags']
+
+
+def openDatabase(filename):
+    """
+    Opens a puzzle database, the tables are created if necessary
+    :param filename: name of the database
+    :return: instance of sqlite3.Connection
+    """
+    database = sqlite3.connect(filename)
+    database.execute("PRAGMA journal_mode=WAL")
+    database.execute("PRAGMA foreign_keys=ON")
+    database.executescript("""
+        CREATE TABLE IF NOT EXISTS puzzles (id INTEGER PRIMARY KEY, FEN TEXT NOT NULL, description TEXT, PGN TEXT,
+            extra TEXT);
+        CREATE TABLE IF NOT EXISTS tags (puzzle INTEGER NOT NULL REFERENCES puzzles, tag TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS tagsTag ON tags (tag, puzzle);
+        CREATE INDEX IF NOT EXISTS tagsPuzzle ON tags (puzzle);
+        CREATE TABLE IF NOT EXISTS reviews (user TEXT NOT NULL, puzzle INTEGER NOT NULL REFERENCES puzzles,
+            date TEXT NOT NULL, solvingTime);
+        CREATE INDEX IF NOT EXISTS reviewsPuzzle ON reviews (user, puzzle);
+        CREATE TABLE IF NOT EXISTS schedule (user TEXT NOT NULL, puzzle INTEGER NOT NULL REFERENCES puzzles,
+            level INTEGER, lastReview TEXT, dueDate INTEGER NOT NULL, reviewed INTEGER NOT NULL,
+            rank INTEGER NOT NULL, removed INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user, puzzle));
+        CREATE INDEX IF NOT EXISTS scheduleDueDate ON schedule (user, reviewed, dueDate, rank) WHERE removed = 0;
+    """)
+    database.commit()
+    return database
+
+
+class SqlitePuzzleCollection(ReviewSchedule):
+    """
+    The same iterator as ScheduledPuzzleCollection for puzzles stored in a SQLite database:
+    - puzzles: FEN, description and PGN data, the other fields of the json data are kept as json string
+    - tags: any number of tags per puzzle
+    - reviews: the history of solving times (solvingTime NULL means not solved)
+    - schedule: level, date of the last review and due date (date ordinal) of every puzzle
+    The history and the schedule belong to a user, so several users can train with the same puzzles.
+    The next puzzle is found by one query on the index of the due dates. Within a day the puzzles are ordered by a
+    random rank, which is drawn again after every answer. Each answer is written in one transaction.
+    """
+    def __init__(self, filename, lazy=True, user="", tags=None):
+        """
+        :param filename: name of the database
+        :param lazy: parse the PGN strings of the puzzles only on demand
+        :param user: name of the user whose results are used
+        :param tags: if given, only puzzles with at least one of these tags are presented
+        :return:-
+        """
+        self.filename = filename
+        self.lazy = lazy
+        self.user = user
+        self.database = openDatabase(filename)
+        self.addNewPuzzles()
+        self.tagFilter = ""
+        self.tagArguments = ()
+        if tags is not None:
+            self.tagFilter = " AND puzzle IN (SELECT puzzle FROM tags WHERE tag IN ("+",".join("?"*len(tags))+"))"
+            self.tagArguments = tuple(tags)
+        # the presented puzzles are excluded from the queries until the next pass starts
+        self.database.execute("CREATE TEMP TABLE IF NOT EXISTS presented (puzzle INTEGER PRIMARY KEY)")
+        self.database.execute("DELETE FROM presented")
+        self.database.commit()
+        self.loadedPuzzles = {} # id:ChessPuzzle, contains the presented puzzles
+        self.secondPass = False
+        self.currentChessPuzzle = None
+
+    def addNewPuzzles(self):
+        """
+        Creates the schedule of the user for puzzles added to the database since the last session (or by another user)
+        :return: number of added puzzles
+        """
+        cursor = self.database.execute("INSERT INTO schedule (user, puzzle, dueDate, reviewed, rank) "
+                                       "SELECT ?, id, 0, 0, abs(random()) % 4294967296 FROM puzzles WHERE id NOT IN "
+                                       "(SELECT puzzle FROM schedule WHERE user = ?)", (self.user, self.user))
+        self.database.commit()
+        return cursor.rowcount
+
+    def __len__(self):
+        return self.database.execute("SELECT COUNT(*) FROM schedule WHERE user = ? AND removed = 0",
+                                     (self.user,)).fetchone()[0]
+
+    def getPuzzleDict(self, index):
+        """
+        Returns the json data of a puzzle, as it would be stored in a series file
+        :param index: id of the puzzle
+        :return: dictionary
+        """
+        if index in self.loadedPuzzles:
+            return self.loadedPuzzles[index].puzzleDict
+        (fen, description, pgn, extra) = self.database.execute("SELECT FEN, description, PGN, extra FROM puzzles "
+                                                               "WHERE id = ?", (index,)).fetchone()
+        puzzleDict = {'FEN': fen}
+        if description is not None:
+            puzzleDict['description'] = description
+        if pgn is not None:
+            puzzleDict['PGN'] = pgn
+        if extra is not None:
+            puzzleDict.update(json.loads(extra))
+        tags = [tag for (tag,) in self.database.execute("SELECT tag FROM tags WHERE puzzle = ? ORDER BY rowid",
+                                                        (index,))]
+        if tags != []:
+            puzzleDict['tags'] = tags
+        puzzleDict['previousSolvingTimes'] = [[date, "not solved" if solvingTime is None else solvingTime]
+                                              for (date, solvingTime) in self.database.execute(
+                "SELECT date, solvingTime FROM reviews WHERE user = ? AND puzzle = ? ORDER BY rowid",
+                (self.user, index))]
+        (level, lastReview) = self.database.execute("SELECT level, lastReview FROM schedule WHERE user = ? AND "
+                                                    "puzzle = ?", (self.user, index)).fetchone()
+        if level is not None:
+            puzzleDict['level'] = level
+            puzzleDict['lastReview'] = lastReview
+        return puzzleDict
+
+    def getPuzzle(self, index):
+        """
+        Returns a puzzle. It is read from the database on first access.
+        :param index: id of the puzzle
+        :return: instance of ChessPuzzle
+        """
+        puzzle = self.loadedPuzzles.get(index)
+        if puzzle is None:
+            with Instrumentation.span("puzzle load", puzzle=index):
+                puzzle = ChessPuzzle(json.dumps(self.getPuzzleDict(index)), self.lazy)
+            puzzle.index = index
+            puzzle.resultListener = self.puzzleAnswered
+            self.loadedPuzzles[index] = puzzle
+        return puzzle
+
+    def __iter__(self):
+        return self
+
+    def __dueReview(self, excludePresented=True):
+        query = "SELECT puzzle FROM schedule WHERE user = ? AND reviewed = 1 AND dueDate <= ? AND removed = 0"
+        if excludePresented:
+            query += " AND puzzle NOT IN (SELECT puzzle FROM presented)"
+        row = self.database.execute(query+self.tagFilter+" ORDER BY dueDate, rank LIMIT 1",
+                                    (self.user, datetime.date.today().toordinal())+self.tagArguments).fetchone()
+        return None if row is None else row[0]
+
+    def __newPuzzle(self, excludePresented=True):
+        query = "SELECT puzzle FROM schedule WHERE user = ? AND reviewed = 0 AND dueDate <= 0 AND removed = 0"
+        if excludePresented:
+            query += " AND puzzle NOT IN (SELECT puzzle FROM presented)"
+        row = self.database.execute(query+self.tagFilter+" ORDER BY dueDate, rank LIMIT 1",
+                                    (self.user,)+self.tagArguments).fetchone()
+        return None if row is None else row[0]
+
+    def __next__(self):
+        """
+        Iterate first over all problems which are due and solved before and then over all problems which are due
+        :return:
+        """
+        index = self.__dueReview()
+        if index is None and not self.secondPass:
+            self.secondPass = True
+            self.database.execute("DELETE FROM presented") # answered puzzles may be due again
+            self.database.commit()
+            print("You solved all previously presented puzzles.")
+            index = self.__dueReview()
+        if index is None and self.secondPass:
+            index = self.__newPuzzle()
+        if index is None:
+            self.closePuzzleCollection()
+            raise StopIteration
+        self.database.execute("INSERT OR IGNORE INTO presented VALUES (?)", (index,))
+        self.database.commit()
+        self.currentChessPuzzle = self.getPuzzle(index)
+        self.currentChessPuzzle.start_time = time.time()
+        return self.currentChessPuzzle
+
+    def peekNextIndex(self):
+        """
+        Returns the id of the puzzle which is returned by the next call of __next__, without changing the schedule
+        :return: id or None if there are no more puzzles
+        """
+        index = self.__dueReview()
+        if index is None and not self.secondPass:
+            index = self.__dueReview(excludePresented=False)
+            if index is None:
+                index = self.__newPuzzle(excludePresented=False)
+        elif index is None:
+            index = self.__newPuzzle()
+        return index
+
+    def puzzleAnswered(self, puzzle, result):
+        """
+        Stores the result, the new level and the new due date of the answered puzzle in one transaction
+        :param puzzle: instance of ChessPuzzle
+        :param result: [date, solving time or "not solved"]
+        :return:
+        """
+        self.updateLevel(puzzle.puzzleDict, result)
+        (date, solved) = result
+        with Instrumentation.span("save"), self.database:
+            self.database.execute("INSERT INTO reviews VALUES (?, ?, ?, ?)",
+                                  (self.user, puzzle.index, date, None if solved == "not solved" else solved))
+            self.database.execute("UPDATE schedule SET level = ?, lastReview = ?, dueDate = ?, reviewed = 1, "
+                                  "rank = ? WHERE user = ? AND puzzle = ?",
+                                  (puzzle.puzzleDict['level'], date, self.getDueDate(puzzle.puzzleDict),
+                                   random.getrandbits(32), self.user, puzzle.index))
+
+    def removeCurrentPuzzleFromCollection(self):
+        """
+        The current puzzle isn't presented to the user any more. It is kept in the database for other users.
+        :return:
+        """
+        with self.database:
+            self.database.execute("UPDATE schedule SET removed = 1 WHERE user = ? AND puzzle = ?",
+                                  (self.user, self.currentChessPuzzle.index))
+        del self.loadedPuzzles[self.currentChessPuzzle.index]
+        print("Puzzle removed")
+
+    def savePuzzlesIntoFile(self):
+        """
+        Nothing to do, every answer is committed immediately
+        :return:
+        """
+        self.database.commit()
+
+    def closePuzzleCollection(self):
+        """
+        Convenience method
+        """
+        print("No more puzzle_collection.")
+        self.savePuzzlesIntoFile()
+
+    def validateLevels(self):
+        """
+        Checks if the stored levels and review dates agree with the levels computed from the complete history
+        :return: list of ids with wrong values
+        """
+        wrongIds = []
+        for (index,) in self.database.execute("SELECT puzzle FROM schedule WHERE user = ? AND removed = 0 AND "
+                                              "reviewed = 1", (self.user,)).fetchall():
+            puzzleDict = self.getPuzzleDict(index)
+            previousSolvingTimes = puzzleDict['previousSolvingTimes']
+            if previousSolvingTimes == [] or puzzleDict.get('level') != self.getLevel(previousSolvingTimes) or \
+                    puzzleDict['lastReview'] != previousSolvingTimes[-1][0]:
+                wrongIds += [index]
+        return wrongIds
+
+    def close(self):
+        self.database.close()
+
+
+def insertPuzzle(database, puzzleDict, user=""):
+    """
+    Adds a puzzle to a database
+    :param database: instance of sqlite3.Connection, see openDatabase
+    :param puzzleDict: json data of the puzzle, as read from a series file. The fields 'level' and 'lastReview'
+    are added if they are missing. Values which the columns can't reproduce exactly (e.g. a description null or
+    the level of a puzzle without history) are kept with the other fields in 'extra'.
+    :param user: owner of the history of the puzzle
+    :return: id of the puzzle
+    """
+    schedule = ReviewSchedule()
+    schedule.completePuzzleDict(puzzleDict)
+    previousSolvingTimes = puzzleDict.get('previousSolvingTimes', [])
+    reviewed = previousSolvingTimes != []
+    extra = dict((key, value) for (key, value) in puzzleDict.items() if key not in ownFields
+                 or (key in ['description', 'PGN'] and not isinstance(value, str))
+                 or (key in ['level', 'lastReview'] and not reviewed))
+    tags = puzzleDict.get('tags')
+    if not (isinstance(tags, list) and tags != [] and all(isinstance(tag, str) for tag in tags)):
+        if 'tags' in puzzleDict:
+            extra['tags'] = tags
+        tags = []
+    index = database.execute("INSERT INTO puzzles (FEN, description, PGN, extra) VALUES (?, ?, ?, ?)",
+                             (puzzleDict['FEN'], puzzleDict.get('description') if 'description' not in extra else None,
+                              puzzleDict.get('PGN') if 'PGN' not in extra else None,
+                              json.dumps(extra) if extra != {} else None)).lastrowid
+    database.executemany("INSERT INTO tags VALUES (?, ?)", [(index, tag) for tag in tags])
+    database.executemany("INSERT INTO reviews VALUES (?, ?, ?, ?)",
+                         [(user, index, date, None if solved == "not solved" else solved)
+                          for (date, solved) in previousSolvingTimes])
+    database.execute("INSERT INTO schedule VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                     (user, index, puzzleDict['level'] if reviewed else None,
+                      puzzleDict['lastReview'] if reviewed else None,
+                      schedule.getDueDate(puzzleDict), int(reviewed), random.getrandbits(32)))
+    return index
+
+
+def migrateSeriesFile(seriesFilename, databaseFilename, user=""):
+    """
+    Copies the puzzles of a series file into a database and checks that they are read back unchanged
+    :param seriesFilename: series file, the results in its journal are included
+    :param databaseFilename: name of the database, created if necessary
+    :param user: owner of the results
+    :return: number of copied puzzles
+    """
+    puzzleCollection = ScheduledPuzzleCollection(seriesFilename)
+    lines = [index for index in range(len(puzzleCollection.puzzleFile))
+             if index not in puzzleCollection.removedPuzzles]
+    database = openDatabase(databaseFilename)
+    ids = array('q')
+    with database:
+        for index in lines:
+            puzzleDict = puzzleCollection.getPuzzleDict(index)
+            puzzleCollection.completePuzzleDict(puzzleDict)
+            ids.append(insertPuzzle(database, puzzleDict, user))
+    database.close()
+
+    sqliteCollection = SqlitePuzzleCollection(databaseFilename, user=user)
+    differences = 0
+    for (index, puzzleId) in zip(lines, ids):
+        puzzleDict = puzzleCollection.getPuzzleDict(index)
+        puzzleCollection.completePuzzleDict(puzzleDict)
+        puzzleDict.setdefault('previousSolvingTimes', []) # added by ChessPuzzle anyway
+        if sqliteCollection.getPuzzleDict(puzzleId) != puzzleDict:
+            print("Puzzle in line "+str(index+1)+" was changed by the migration")
+            differences += 1
+    sqliteCollection.close()
+    puzzleCollection.journal.close()
+    puzzleCollection.puzzleFile.close()
+    if differences > 0:
+        raise ValueError(str(differences)+" puzzles were changed by the migration")
+    return len(lines)
+
+
+def exportSeriesFile(databaseFilename, seriesFilename, user=""):
+    """
+    Writes the puzzles of a database as series file
+    :param databaseFilename: name of the database
+    :param seriesFilename: series file, it is overwritten
+    :param user: owner of the results
+    :return: number of written puzzles
+    """
+    sqliteCollection = SqlitePuzzleCollection(databaseFilename, user=user)
+    seriesFile = open(seriesFilename, 'w')
+    numberOfPuzzles = 0
+    for (index,) in sqliteCollection.database.execute("SELECT puzzle FROM schedule WHERE user = ? AND removed = 0 "
+                                                      "ORDER BY puzzle", (user,)).fetchall():
+        seriesFile.write(json.dumps(sqliteCollection.getPuzzleDict(index))+"\n")
+        numberOfPuzzles += 1
+    seriesFile.close()
+    sqliteCollection.close()
+    return numberOfPuzzles
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [4, 5] or sys.argv[1] not in ["migrate", "export"]:
+        print(__doc__)
+        raise SystemExit(1)
+    user = sys.argv[4] if len(sys.argv) == 5 else ""
+    if sys.argv[1] == "migrate":
+        print(str(migrateSeriesFile(sys.argv[2], sys.argv[3], user))+" puzzles migrated")
+    else:
+        print(str(exportSeriesFile(sys.argv[2], sys.argv[3], user))+" puzzles exported")
@@ -0,0 +1,304 @@
+"""
+Training server: many users train with the puzzles of one database at the same time, using a local HTTP/JSON API
+instead of the pygame window. Usage:
+
+    python3 TrainingServer.py <database.sqlite> [port] [engines]
+
+A series file is converted into a database with SqlitePuzzleCollection.py. Every user has their own history and
+schedule. Requests (all with a json body containing "user"):
+
+    POST /next    {"user": "anna"}                    next puzzle: {"puzzle", "FEN", "description"} or {"done": true}
+    POST /move    {"user": "anna", "move": "e2e4"}    {"correct", "played": [uci moves], "FEN", "solved"}
+    POST /result  {"user": "anna", "solved": true}    marks the current puzzle: {"level", "dueDate"}
+    GET  /status                                      number of sessions and requests
+
+As in the trainer, a wrong move is answered with the expected move, a correct move with the reply of the opponent.
+Moves are validated by MyChessBoard against the PGN solution or, if there is none, by a pool of engines (default 2).
+All variations of the PGN solution and all engine moves about as good as the best one are accepted.
+The database is accessed by one thread of its own, so opening the schedule of a user or committing an answer
+doesn't delay the other sessions. Sessions without requests for 30 minutes are closed (at most 1000 sessions).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import datetime
+import concurrent.futures
+import chess
+from MyChessBoard import MyChessBoard
+from EngineService import EnginePool
+from AnalysisCache import AnalysisCache
+from SqlitePuzzleCollection import SqlitePuzzleCollection
+
+
+class RequestError(Exception):
+    """
+    A request which can't be answered, reported to the client with HTTP status 400
+    """
+    pass
+
+
+class TrainingSession:
+    """
+    The state of one user: the schedule (see SqlitePuzzleCollection), the current puzzle and its board.
+    The collection is only used by the thread of the database executor.
+    """
+    def __init__(self, databaseFilename, user, engineService, database):
+        """
+        :param databaseFilename: name of the puzzle database
+        :param user: name of the user
+        :param engineService: shared instance of EngineService or EnginePool
+        :param database: executor with one thread, which runs all calls of the collection
+        :return:-
+        """
+        self.databaseFilename = databaseFilename
+        self.user = user
+        self.database = database
+        self.collection = None # opened by the first request
+        self.engineService = engineService
+        self.puzzle = None
+        self.board = None # headless MyChessBoard, created with the first puzzle
+        self.lock = asyncio.Lock() # the requests of a user are answered one after another
+        self.pendingRequests = 0 # requests which got the session and aren't answered yet
+        self.lastRequest = time.monotonic()
+
+    async def __inDatabase(self, function, *arguments):
+        return await asyncio.get_running_loop().run_in_executor(self.database, function, *arguments)
+
+    async def open(self):
+        if self.collection is None:
+            self.collection = await self.__inDatabase(
+                lambda: SqlitePuzzleCollection(self.databaseFilename, user=self.user))
+
+    def __next(self):
+        try:
+            return next(self.collection)
+        except StopIteration: # can't be passed through a future
+            return None
+
+    async def nextPuzzle(self):
+        self.puzzle = await self.__inDatabase(self.__next)
+        if self.puzzle is None:
+            return {"done": True}
+        board = chess.Board(self.puzzle.FEN)
+        if self.board is None:
+            self.board = MyChessBoard(400, board, None, game=self.puzzle.game, engineService=self.engineService,
+                                      replyDelay=0)
+        else:
+            self.board.loadNewPosition(board, self.puzzle.game)
+        return {"puzzle": self.puzzle.index, "FEN": self.puzzle.FEN,
+                "description": self.puzzle.puzzleDict.get('description', "")}
+
+    @staticmethod
+    async def __suggestion(board):
+        """
+        Waits for the move expected by the board without blocking the other sessions
+        :return:
+        """
+        try:
+            await asyncio.wrap_future(board.requestSuggestion())
+        except Exception: # e.g. cancelled or engine error, see MyChessBoard.suggestMove
+            pass
+
+    async def submitMove(self, uci):
+        if self.puzzle is None:
+            raise RequestError("no current puzzle")
+        try:
+            move = chess.Move.from_uci(str(uci))
+        except ValueError:
+            raise RequestError("invalid move "+str(uci))
+        board = self.board
+        numberOfMoves = len(board.moveList)
+        board.submitMove(move)
+        await self.__suggestion(board)
+        board.update() # plays the move if it is the expected one
+        correct = len(board.moveList) > numberOfMoves
+        await self.__suggestion(board)
+        board.update() # the reply of the opponent or the expected move
+        return {"correct": correct, "played": [move.uci() for move in board.moveList[numberOfMoves:]],
+                "FEN": board.board.fen(), "solved": correct and board.game is not None and board.game.is_end()}
+
+    def __mark(self, puzzle, solved):
+        """
+        Stores the answer in the database
+        :return: (level, due date ordinal)
+        """
+        if solved:
+            puzzle.markPuzzleAsSolvedCorrectly()
+        else:
+            puzzle.markPuzzleAsSolvedIncorrectly()
+        puzzleDict = puzzle.puzzleDict
+        return (puzzleDict['level'], self.collection.getDueDate(puzzleDict))
+
+    async def markResult(self, solved):
+        if self.puzzle is None:
+            raise RequestError("no current puzzle")
+        (puzzle, self.puzzle) = (self.puzzle, None)
+        (level, dueDate) = await self.__inDatabase(self.__mark, puzzle, solved)
+        return {"level": level, "dueDate": str(datetime.date.fromordinal(dueDate))}
+
+    def close(self):
+        """
+        Closes the collection in the thread of the database, without waiting
+        :return:
+        """
+        if self.collection is not None:
+            self.database.submit(self.collection.close)
+            self.collection = None
+
+
+class TrainingServer:
+    """
+    Serves the requests of all users from one event loop. Each connection may send several requests (keep-alive).
+    """
+    def __init__(self, databaseFilename, engineService, maxSessions=1000, idleSeconds=1800):
+        """
+        :param databaseFilename: name of the puzzle database
+        :param engineService: shared instance of EngineService or EnginePool
+        :param maxSessions: if reached, the session idle for the longest time is closed for a new user
+        :param idleSeconds: sessions without requests for this time are closed
+        :return:-
+        """
+        self.databaseFilename = databaseFilename
+        self.engineService = engineService
+        self.maxSessions = maxSessions
+        self.idleSeconds = idleSeconds
+        self.database = concurrent.futures.ThreadPoolExecutor(1) # sqlite connections belong to their thread
+        self.sessions = {} # user:TrainingSession, the least recently used first
+        self.numberOfRequests = 0
+
+    def __evictSessions(self):
+        """
+        Closes the idle sessions and, if there are still too many, the least recently used ones without requests
+        :return:
+        """
+        now = time.monotonic()
+        for (user, session) in list(self.sessions.items()):
+            if now-session.lastRequest <= self.idleSeconds and len(self.sessions) < self.maxSessions:
+                break # the following sessions were used later
+            if session.pendingRequests == 0:
+                del self.sessions[user]
+                session.close()
+
+    def session(self, user):
+        """
+        Returns the session of a user, which counts as busy until finishRequest is called
+        :param user: name of the user
+        :return: instance of TrainingSession
+        """
+        if not isinstance(user, str) or user == "":
+            raise RequestError("missing user")
+        session = self.sessions.pop(user, None)
+        self.__evictSessions()
+        if session is None:
+            if len(self.sessions) >= self.maxSessions:
+                raise RequestError("too many sessions")
+            session = TrainingSession(self.databaseFilename, user, self.engineService, self.database)
+        self.sessions[user] = session # moved to the end, the order of the last requests
+        session.pendingRequests += 1
+        session.lastRequest = time.monotonic()
+        return session
+
+    @staticmethod
+    def finishRequest(session):
+        session.pendingRequests -= 1
+        session.lastRequest = time.monotonic()
+
+    async def dispatch(self, method, path, body):
+        """
+        Answers a request
+        :return: (HTTP status, json data)
+        """
+        if method == "GET" and path == "/status":
+            return (200, {"sessions": len(self.sessions), "requests": self.numberOfRequests})
+        if method != "POST" or path not in ["/next", "/move", "/result"]:
+            return (404, {"error": "unknown request "+method+" "+path})
+        try:
+            request = json.loads(body.decode("utf-8") or "{}")
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            return (400, {"error": "invalid json"})
+        try:
+            session = self.session(request.get("user"))
+        except RequestError as error:
+            return (400, {"error": str(error)})
+        try:
+            async with session.lock:
+                await session.open()
+                if path == "/next":
+                    return (200, await session.nextPuzzle())
+                if path == "/move":
+                    return (200, await session.submitMove(request.get("move")))
+                return (200, await session.markResult(bool(request.get("solved"))))
+        except RequestError as error:
+            return (400, {"error": str(error)})
+        finally:
+            self.finishRequest(session)
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if requestLine == b"":
+                    break
+                (method, path, version) = requestLine.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b"\r\n", b"\n", b""]:
+                        break
+                    (name, value) = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                self.numberOfRequests += 1
+                (status, response) = await self.dispatch(method, path, body)
+                data = json.dumps(response).encode("utf-8")
+                keepAlive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(("HTTP/1.1 "+str(status)+(" OK" if status == 200 else " Error")+"\r\n"
+                              "Content-Type: application/json\r\nContent-Length: "+str(len(data))+"\r\n"
+                              "Connection: "+("keep-alive" if keepAlive else "close")+"\r\n\r\n").encode("latin-1")
+                             + data)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass # broken or malformed request, drop the connection
+        finally:
+            writer.close()
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions = {}
+        self.database.shutdown(wait=True)
+
+
+async def serve(server, port):
+    listener = await asyncio.start_server(server.handleConnection, "127.0.0.1", port)
+    print("Training server listening on http://127.0.0.1:"+str(port))
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not sys.argv[1].endswith(".sqlite"):
+        print(__doc__)
+        raise SystemExit(1)
+    if not os.path.exists(sys.argv[1]):
+        print("No puzzle database "+sys.argv[1])
+        raise SystemExit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    analysisCache = AnalysisCache()
+    engineService = EnginePool(int(sys.argv[3]) if len(sys.argv) > 3 else 2, cache=analysisCache, multiPV=3)
+    server = TrainingServer(sys.argv[1], engineService)
+    try:
+        asyncio.run(serve(server, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        engineService.quit()
+        print(analysisCache)
+        analysisCache.close()
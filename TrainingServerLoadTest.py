@@ -0,0 +1,100 @@
+"""
+Load test of the training server with simulated users. Usage:
+
+    python3 TrainingServerLoadTest.py [url] [clients] [seconds]
+
+Defaults: http://127.0.0.1:8080, 50 clients, 10 seconds. Every client trains as its own user ("loadtest1", ...):
+it asks for the next puzzle, plays a random legal move and marks the puzzle as solved or not solved. The number of
+requests per second and the latencies (median, 99th percentile) are reported.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import urllib.parse
+import chess
+
+
+class Client:
+    """
+    One user with a keep-alive connection to the server
+    """
+    def __init__(self, host, port, user):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.latencies = {} # path:list of seconds
+        self.errors = 0
+
+    async def request(self, reader, writer, path, data):
+        body = json.dumps(dict(data, user=self.user)).encode("utf-8")
+        start = time.perf_counter()
+        writer.write(("POST "+path+" HTTP/1.1\r\nHost: "+self.host+"\r\nContent-Type: application/json\r\n"
+                      "Content-Length: "+str(len(body))+"\r\n\r\n").encode("latin-1")+body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in [b"\r\n", b"\n", b""]:
+                break
+            (name, value) = line.decode("latin-1").split(":", 1)
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        response = json.loads((await reader.readexactly(length)).decode("utf-8"))
+        self.latencies.setdefault(path, []).append(time.perf_counter()-start)
+        if status != 200:
+            self.errors += 1
+        return response
+
+    async def run(self, deadline):
+        (reader, writer) = await asyncio.open_connection(self.host, self.port)
+        try:
+            while time.time() < deadline:
+                puzzle = await self.request(reader, writer, "/next", {})
+                if puzzle.get("done", False) or "FEN" not in puzzle:
+                    break
+                moves = list(chess.Board(puzzle["FEN"]).legal_moves)
+                if moves != []:
+                    await self.request(reader, writer, "/move", {"move": random.choice(moves).uci()})
+                await self.request(reader, writer, "/result", {"solved": random.random() < 0.7})
+        finally:
+            writer.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values)-1, int(fraction*len(values)))] if values != [] else float("nan")
+
+
+async def loadTest(url, numberOfClients, seconds):
+    """
+    Runs the simulated clients concurrently
+    :return: list of Client
+    """
+    address = urllib.parse.urlparse(url)
+    clients = [Client(address.hostname, address.port or 80, "loadtest"+str(i+1)) for i in range(numberOfClients)]
+    deadline = time.time()+seconds
+    await asyncio.gather(*[client.run(deadline) for client in clients])
+    return clients
+
+
+if __name__ == "__main__":
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8080"
+    numberOfClients = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    start = time.time()
+    clients = asyncio.run(loadTest(url, numberOfClients, seconds))
+    elapsed = time.time()-start
+    latencies = {}
+    for client in clients:
+        for (path, values) in client.latencies.items():
+            latencies.setdefault(path, []).extend(values)
+    allLatencies = [value for values in latencies.values() for value in values]
+    print(str(len(allLatencies))+" requests of "+str(numberOfClients)+" clients in "+"%.1f" % elapsed+" seconds: "+
+          "%.0f" % (len(allLatencies)/elapsed)+" requests per second, "+str(sum(client.errors for client in clients))+
+          " errors")
+    for (path, values) in sorted(latencies.items())+[("all", allLatencies)]:
+        print("%-8s %7d requests  p50 %7.1f ms  p99 %7.1f ms" % (path, len(values), 1000*percentile(values, 0.5),
+                                                                  1000*percentile(values, 0.99)))
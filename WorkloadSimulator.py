@@ -0,0 +1,194 @@
+"""
+Forecasts the number of reviews per day for a collection and a schedule. Usage:
+
+    python3 WorkloadSimulator.py <series file|database.sqlite> [options]
+
+Starting from the current levels and review dates of the puzzles, the training of the next days is simulated with
+the rules of the schedule (see ReviewSchedule): every day the due puzzles are reviewed, puzzles which were not solved
+are presented again in the second pass, and a number of new puzzles is started. Whether a puzzle is solved and how
+long it takes is drawn from a simple model (success rate per level, log-normal solving times). Many Monte Carlo
+runs are simulated at once, in batches distributed over several processes. Requires numpy.
+
+Example: compare the default schedule with longer intervals
+
+    python3 WorkloadSimulator.py series/series1 --days 180 --schedule 1:1,2:3,3:14,4:45,5:120,6:365
+"""
+import os
+import sys
+import argparse
+import datetime
+import multiprocessing
+import numpy
+from PuzzleCollection import ReviewSchedule
+from PuzzleStatistics import SolvingHistory, nextLevels
+
+
+class TrainingModel:
+    """
+    How the user solves the puzzles
+    """
+    def __init__(self, successRates=(0.6, 0.85, 0.9, 0.92, 0.94, 0.95, 0.96), medianSeconds=60.0, sigma=0.8,
+                 newPerDay=10):
+        """
+        :param successRates: probability to solve a puzzle, by level (level 0 first, the last one is used for all
+        higher levels). The rate of level 1 is used for new puzzles.
+        :param medianSeconds: median solving time
+        :param sigma: spread of the solving times (standard deviation of their logarithm)
+        :param newPerDay: number of new puzzles started per day
+        :return:-
+        """
+        self.successRates = numpy.asarray(successRates, dtype=numpy.float64)
+        self.medianSeconds = medianSeconds
+        self.sigma = sigma
+        self.newPerDay = newPerDay
+
+
+def intervalsOf(schedule):
+    """
+    :param schedule: instance of ReviewSchedule
+    :return: array of the days until the next review, indexed by min(level, highest level)
+    """
+    highestLevel = max(schedule.schedule)
+    return numpy.array([0]+[schedule.schedule.get(level, schedule.schedule[highestLevel])
+                            for level in range(1, highestLevel+1)], dtype=numpy.int64)
+
+
+def simulateBatch(arguments):
+    """
+    Simulates several runs at once. The state of all puzzles of all runs is kept in arrays of shape
+    (runs, puzzles), the puzzles reviewed on one day are updated together.
+    :param arguments: (schedule, model, levels, lastReviews, numberOfResults, numberOfNewPuzzles, firstDay, days,
+    runs, seed)
+    :return: (reviews, seconds), arrays of shape (runs, days)
+    """
+    (schedule, model, levels, lastReviews, numberOfResults, numberOfNewPuzzles, firstDay, days, runs, seed) = \
+        arguments
+    random = numpy.random.default_rng(seed)
+    intervals = intervalsOf(schedule)
+    numberOfPuzzles = len(levels)+numberOfNewPuzzles
+    level = numpy.tile(numpy.r_[levels, numpy.ones(numberOfNewPuzzles, dtype=numpy.int64)], runs)
+    count = numpy.tile(numpy.r_[numberOfResults, numpy.zeros(numberOfNewPuzzles, dtype=numpy.int64)], runs)
+    dueDay = numpy.tile(numpy.r_[lastReviews+intervals[numpy.minimum(levels, len(intervals)-1)],
+                                 numpy.zeros(numberOfNewPuzzles, dtype=numpy.int64)], runs)
+    reviewed = numpy.tile(numpy.r_[numpy.ones(len(levels), dtype=bool), numpy.zeros(numberOfNewPuzzles, dtype=bool)],
+                          runs)
+    reviews = numpy.zeros((runs, days), dtype=numpy.int64)
+    seconds = numpy.zeros((runs, days), dtype=numpy.float64)
+    newOffsets = numpy.arange(runs)*numberOfPuzzles+len(levels) # first new puzzle of each run
+
+    def review(rows, day, dayIndex):
+        rates = model.successRates[numpy.minimum(level[rows], len(model.successRates)-1)]
+        solvingTimes = random.lognormal(numpy.log(model.medianSeconds), model.sigma, len(rows))
+        solved = random.random(len(rows)) < rates
+        level[rows] = nextLevels(schedule, level[rows], count[rows], numpy.where(solved, solvingTimes, numpy.nan))
+        count[rows] += 1
+        dueDay[rows] = day+intervals[numpy.minimum(level[rows], len(intervals)-1)]
+        runsOfRows = rows//numberOfPuzzles
+        reviews[:, dayIndex] += numpy.bincount(runsOfRows, minlength=runs)
+        seconds[:, dayIndex] += numpy.bincount(runsOfRows, weights=solvingTimes, minlength=runs)
+
+    for dayIndex in range(days):
+        day = firstDay+dayIndex
+        due = numpy.flatnonzero(reviewed & (dueDay <= day))
+        review(due, day, dayIndex)
+        # second pass: the puzzles which were not solved, then the new puzzles
+        review(due[level[due] == 0], day, dayIndex)
+        started = min(model.newPerDay, numberOfNewPuzzles-min(dayIndex*model.newPerDay, numberOfNewPuzzles))
+        if started > 0:
+            new = (newOffsets[:, None]+dayIndex*model.newPerDay+numpy.arange(started)).ravel()
+            reviewed[new] = True
+            review(new, day, dayIndex)
+    return (reviews, seconds)
+
+
+def forecast(history, schedule=None, model=None, days=90, runs=100, processes=None, batchElements=4000000, seed=None):
+    """
+    Simulates the training of the next days
+    :param history: instance of PuzzleStatistics.SolvingHistory
+    :param schedule: instance of ReviewSchedule, default: the current schedule
+    :param model: instance of TrainingModel, default: TrainingModel()
+    :param days: number of simulated days, starting today
+    :param runs: number of Monte Carlo runs
+    :param processes: number of processes, default: number of cores
+    :param batchElements: maximal number of puzzles times runs simulated by one process at once (memory)
+    :param seed: seed of the random numbers
+    :return: (reviews, seconds), arrays of shape (runs, days)
+    """
+    schedule = schedule or ReviewSchedule()
+    model = model or TrainingModel()
+    (levels, lastReviews, numberOfResults) = history.currentState()
+    numberOfNewPuzzles = history.numberOfPuzzles-len(levels)
+    runsPerBatch = max(1, min(runs, batchElements//max(1, history.numberOfPuzzles)))
+    batches = [min(runsPerBatch, runs-start) for start in range(0, runs, runsPerBatch)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(batches))
+    today = datetime.date.today().toordinal()
+    tasks = [(schedule, model, levels, lastReviews, numberOfResults, numberOfNewPuzzles, today, days, batchRuns,
+              batchSeed) for (batchRuns, batchSeed) in zip(batches, seeds)]
+    if len(tasks) == 1:
+        results = [simulateBatch(tasks[0])]
+    else:
+        pool = multiprocessing.Pool(min(processes or os.cpu_count(), len(tasks)))
+        results = pool.map(simulateBatch, tasks)
+        pool.close()
+        pool.join()
+    return (numpy.concatenate([reviews for (reviews, seconds) in results]),
+            numpy.concatenate([seconds for (reviews, seconds) in results]))
+
+
+def writeForecast(reviews, seconds, output=sys.stdout, csvFormat=False):
+    """
+    Writes mean and 10%/90% quantiles of the daily reviews and the mean training time per day
+    :return:
+    """
+    today = datetime.date.today().toordinal()
+    (low, high) = numpy.percentile(reviews, [10, 90], axis=0)
+    mean = reviews.mean(axis=0)
+    minutes = seconds.mean(axis=0)/60
+    if csvFormat:
+        output.write("date,meanReviews,p10Reviews,p90Reviews,meanMinutes\n")
+    else:
+        output.write(str(reviews.shape[0])+" runs\n      date    reviews       p10-p90      minutes\n")
+    for dayIndex in range(reviews.shape[1]):
+        date = datetime.date.fromordinal(today+dayIndex)
+        if csvFormat:
+            output.write("%s,%.1f,%d,%d,%.1f\n" % (date, mean[dayIndex], low[dayIndex], high[dayIndex],
+                                                   minutes[dayIndex]))
+        else:
+            output.write("%s  %9.1f  %7d-%-7d  %9.1f\n" % (date, mean[dayIndex], low[dayIndex], high[dayIndex],
+                                                           minutes[dayIndex]))
+    if not csvFormat:
+        output.write("mean per day: %.1f reviews, %.1f minutes\n" % (mean.mean(), minutes.mean()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecasts the number of reviews per day")
+    parser.add_argument("collection", help="series file or .sqlite database")
+    parser.add_argument("--user", default="", help="user of the database")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--schedule", default=None, help="level:days,..., e.g. 1:1,2:2,3:10,4:30,5:90,6:300")
+    parser.add_argument("--treshold", type=float, default=None, help="seconds")
+    parser.add_argument("--success", default=None, help="success rates by level, starting with level 0")
+    parser.add_argument("--median", type=float, default=60.0, help="median solving time in seconds")
+    parser.add_argument("--sigma", type=float, default=0.8, help="spread of the solving times")
+    parser.add_argument("--new", type=int, default=10, help="new puzzles per day")
+    parser.add_argument("--csv", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args()
+
+    schedule = ReviewSchedule()
+    if options.schedule is not None:
+        schedule.schedule = dict(tuple(map(int, pair.split(":"))) for pair in options.schedule.split(","))
+    if options.treshold is not None:
+        schedule.treshold = options.treshold
+    model = TrainingModel(medianSeconds=options.median, sigma=options.sigma, newPerDay=options.new)
+    if options.success is not None:
+        model.successRates = numpy.array([float(rate) for rate in options.success.split(",")])
+    if options.collection.endswith(".sqlite"):
+        history = SolvingHistory.fromDatabase(options.collection, options.user)
+    else:
+        history = SolvingHistory.fromSeriesFile(options.collection)
+    (reviews, seconds) = forecast(history, schedule, model, options.days, options.runs, options.processes,
+                                  seed=options.seed)
+    writeForecast(reviews, seconds, csvFormat=options.csv)
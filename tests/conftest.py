@@ -0,0 +1,56 @@
+"""
+Shared fixtures of the tests. Run them from the repository folder with:
+
+    python3 -m pytest tests
+"""
+import os
+import sys
+import json
+import pytest
+
+repositoryFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repositoryFolder)
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+fakeEngine = os.path.join(repositoryFolder, "FakeUciEngine.py")
+
+# back rank mate in one
+mateInOne = {"FEN": "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", "description": "White to move", "PGN": "1. Rd8#"}
+
+
+def rookPositions(number):
+    """
+    Different legal positions for series files: a rook on the files a, b, ... of the first rank
+    :param number: number of positions, at most 6
+    :return: list of FEN strings
+    """
+    return ["6k1/5ppp/8/8/8/8/5PPP/"+("%dR%dK1" % (file, 5-file)).replace("0", "")+" w - - 0 1"
+            for file in range(number)]
+
+
+def puzzleLine(fen, pgn="", **fields):
+    """
+    :param fen: position of the puzzle
+    :param pgn: solution
+    :param fields: further json fields, e.g. previousSolvingTimes
+    :return: json string of a puzzle
+    """
+    puzzleDict = {"FEN": fen, "description": "White to move" if " w " in fen else "Black to move", "PGN": pgn}
+    puzzleDict.update(fields)
+    return json.dumps(puzzleDict)
+
+
+@pytest.fixture
+def writeSeries(tmp_path):
+    """
+    Writes series files into a temporary folder
+    :return: function (list of json strings or dictionaries, file name) -> name of the written file
+    """
+    def write(puzzles, name="series1"):
+        filename = str(tmp_path/name)
+        with open(filename, 'w') as seriesFile:
+            for puzzle in puzzles:
+                seriesFile.write((puzzle if isinstance(puzzle, str) else json.dumps(puzzle))+"\n")
+        return filename
+    return write
@@ -0,0 +1,80 @@
+import chess
+import chess.pgn
+from io import StringIO
+from conftest import fakeEngine, mateInOne
+from AcceptedMoves import AcceptedMoves, withinMargin, scoreValue, mateValue
+from EngineService import EngineService
+from MyChessBoard import MyChessBoard
+
+# two moves win the queen, Ra1+ doesn't
+queenCaptures = "k7/8/8/3q4/8/8/8/3RK2B w - - 0 1"
+
+
+def readGame(fen, pgn):
+    return chess.pgn.read_game(StringIO("[FEN \""+fen+"\"]\n"+pgn))
+
+
+def testScoresWithinTheMarginAreAccepted():
+    assert scoreValue(None, 1) > scoreValue(None, 3) > scoreValue(900, None) > scoreValue(None, None) == 0 > \
+        scoreValue(None, -3) > scoreValue(None, -1) == -mateValue+1
+    assert withinMargin((100, None), (50, None)) and not withinMargin((100, None), (49, None))
+    assert withinMargin((100, None), (0, None), margin=100)
+    assert withinMargin((None, 1), (None, 4)) and not withinMargin((None, 1), (5000, None))
+    assert withinMargin((5000, None), (None, 2)) and withinMargin((None, -2), (-200, None))
+
+
+def testVariationsAndTranspositionsAreAccepted():
+    game = readGame(chess.STARTING_FEN, "1. e4 (1. Nf3 Nc6 2. e4 e5) 1... e5 (1... c5) 2. Nf3 Nc6 3. Bb5")
+    acceptedMoves = AcceptedMoves.fromGame(game)
+    board = chess.Board()
+    assert acceptedMoves.accepts(board, chess.Move.from_uci("e2e4"))
+    assert acceptedMoves.accepts(board, chess.Move.from_uci("g1f3"))
+    assert not acceptedMoves.accepts(board, chess.Move.from_uci("d2d4"))
+    assert acceptedMoves.expectedMove(board) == chess.Move.from_uci("e2e4")
+    board.push_uci("e2e4")
+    assert acceptedMoves.accepts(board, chess.Move.from_uci("c7c5"))
+    # the side line reaches the position of the main line after the second move of black
+    for move in ["g1f3", "b8c6", "e2e4", "e7e5"]:
+        board = chess.Board() if move == "g1f3" else board
+        board.push_uci(move)
+    assert acceptedMoves.expectedMove(board) == chess.Move.from_uci("f1b5")
+    assert acceptedMoves.gameNode(board).variations[0].move == chess.Move.from_uci("f1b5")
+    assert acceptedMoves.accepts(chess.Board(queenCaptures), chess.Move.from_uci("d1d5")) is None
+    assert AcceptedMoves.fromGame(None).positions == {}
+
+
+def testAnalysisDoesNotReplaceTheSolution():
+    board = chess.Board(mateInOne["FEN"])
+    acceptedMoves = AcceptedMoves.fromGame(readGame(mateInOne["FEN"], mateInOne["PGN"]))
+    acceptedMoves.addAnalysis(board, [(chess.Move.from_uci("d1d7"), 0, None)])
+    assert acceptedMoves.accepts(board, chess.Move.from_uci("d1d8"))
+    assert not acceptedMoves.accepts(board, chess.Move.from_uci("d1d7"))
+    board = chess.Board(queenCaptures)
+    lines = [(chess.Move.from_uci("d1d5"), 900, None), (chess.Move.from_uci("h1d5"), 860, None),
+             (chess.Move.from_uci("d1a1"), 0, None)]
+    acceptedMoves.addAnalysis(board, lines)
+    assert [acceptedMoves.accepts(board, chess.Move.from_uci(move)) for move in ["d1d5", "h1d5", "d1a1"]] == \
+        [True, True, False]
+    assert acceptedMoves.expectedMove(board) == chess.Move.from_uci("d1d5")
+
+
+def testBoardAcceptsEveryGoodEngineMove():
+    engineService = EngineService(fakeEngine, depth=2, multiPV=3)
+    try:
+        for (move, accepted) in [("h1d5", True), ("d1d5", True), ("d1a1", False)]:
+            chessBoard = MyChessBoard(400, chess.Board(queenCaptures), None, engineService=engineService)
+            chessBoard.move_figure(chess.Move.from_uci(move))
+            assert chessBoard.moveList == ([chess.Move.from_uci(move)] if accepted else [])
+    finally:
+        engineService.quit()
+
+
+def testBoardFollowsTheSolutionIntoAVariation():
+    game = readGame("6k1/5ppp/8/8/8/8/5PPP/R2R2K1 w - - 0 1", "1. Rd8# (1. Ra8#)")
+    chessBoard = MyChessBoard(400, game.board(), None, game=game)
+    chessBoard.move_figure(chess.Move.from_uci("d1d7"))
+    assert chessBoard.moveList == []
+    chessBoard.move_figure(chess.Move.from_uci("a1a8"))
+    assert chessBoard.moveList == [chess.Move.from_uci("a1a8")]
+    assert chessBoard.game is game.variations[1] and chessBoard.board.is_checkmate()
+    assert chessBoard.suggestMove() is None
@@ -0,0 +1,90 @@
+import chess
+from conftest import fakeEngine, mateInOne
+from AnalysisCache import AnalysisCache
+from EngineService import EngineService
+
+
+def positions(number):
+    """
+    Positions after one move of white
+    """
+    boards = []
+    for move in list(chess.Board().legal_moves)[:number]:
+        board = chess.Board()
+        board.push(move)
+        boards.append(board)
+    return boards
+
+
+def testAnalysisIsFoundAfterReopening(tmp_path):
+    filename = str(tmp_path/"analysis.sqlite")
+    analysisCache = AnalysisCache(filename)
+    board = chess.Board(mateInOne["FEN"])
+    lines = [(chess.Move.from_uci("d1d8"), None, 1), (chess.Move.from_uci("h2h3"), 0, None)]
+    analysisCache.store(board, chess.Move.from_uci("d1d8"), None, None, 1, 12, lines)
+    analysisCache.close()
+
+    analysisCache = AnalysisCache(filename)
+    board.halfmove_clock = 30 # the move counters are not part of the key
+    analysis = analysisCache.lookup(board, depth=10)
+    assert (analysis.bestmove.uci(), analysis.ponder, analysis.scoreCp, analysis.scoreMate, analysis.depth) == \
+        ("d1d8", None, None, 1, 12)
+    assert analysis.lines == lines
+    assert analysis.toBestMove().lines == lines
+    assert analysisCache.lookup(board, depth=13) is None # not deep enough
+    assert analysisCache.lookup(chess.Board()) is None
+    assert (analysisCache.hits, analysisCache.misses) == (1, 2)
+    analysisCache.close()
+
+
+def testIllegalMoveIsTreatedAsCollision(tmp_path):
+    analysisCache = AnalysisCache(str(tmp_path/"analysis.sqlite"))
+    board = chess.Board()
+    analysisCache.store(board, chess.Move.from_uci("e2e5"), depth=5)
+    assert analysisCache.lookup(board) is None
+    analysisCache.close()
+
+
+def testLeastRecentlyUsedEntriesAreEvicted(tmp_path):
+    filename = str(tmp_path/"analysis.sqlite")
+    analysisCache = AnalysisCache(filename, maxEntries=10, maxEntriesInMemory=2)
+    boards = positions(15)
+    for board in boards[:10]:
+        analysisCache.store(board, next(iter(board.legal_moves)), depth=5)
+    for board in boards[:3]:
+        assert analysisCache.lookup(board) is not None
+    analysisCache.store(boards[10], next(iter(boards[10].legal_moves)), depth=5)
+    assert analysisCache.numberOfEntries == 9
+    analysisCache.close()
+    analysisCache = AnalysisCache(filename)
+    assert [analysisCache.lookup(board) is not None for board in boards[:11]] == [True]*3+[False]*2+[True]*6
+    analysisCache.close()
+
+
+def testEngineServiceUsesTheCache(tmp_path):
+    analysisCache = AnalysisCache(str(tmp_path/"analysis.sqlite"))
+    board = chess.Board(mateInOne["FEN"])
+    analysisCache.store(board, chess.Move.from_uci("d1d8"), None, None, 1, 15)
+    engineService = EngineService("/nonexistent/engine", depth=15, cache=analysisCache)
+    future = engineService.analyse(board)
+    assert future.done()
+    assert future.result().bestmove.uci() == "d1d8"
+    engineService.quit()
+    assert engineService.engine is None
+    analysisCache.close()
+
+
+def testSearchesAreStoredInTheCache(tmp_path):
+    filename = str(tmp_path/"analysis.sqlite")
+    analysisCache = AnalysisCache(filename)
+    engineService = EngineService(fakeEngine, depth=3, cache=analysisCache, multiPV=2)
+    board = chess.Board(mateInOne["FEN"])
+    assert engineService.analyse(board).result(timeout=30).bestmove.uci() == "d1d8"
+    engineService.quit()
+    analysisCache.close()
+    analysisCache = AnalysisCache(filename)
+    analysis = analysisCache.lookup(board, depth=3)
+    assert analysis.bestmove.uci() == "d1d8"
+    assert [move.uci() for (move, scoreCp, scoreMate) in analysis.lines][0] == "d1d8"
+    assert len(analysis.lines) == 2
+    analysisCache.close()
@@ -0,0 +1,79 @@
+import sys
+import os
+import json
+import subprocess
+import chess
+import chess.pgn
+from io import StringIO
+from Benchmarks import generateSyntheticSeries, runBenchmarks, compareResults
+from PuzzleCollection import ReviewSchedule
+
+
+def testSyntheticSeriesAreReproducible(tmp_path):
+    generateSyntheticSeries(str(tmp_path/"a"), 300, seed=1, numberOfPositions=50)
+    generateSyntheticSeries(str(tmp_path/"b"), 300, seed=1, numberOfPositions=50)
+    generateSyntheticSeries(str(tmp_path/"c"), 300, seed=2, numberOfPositions=50)
+    assert (tmp_path/"a").read_text() == (tmp_path/"b").read_text()
+    assert (tmp_path/"a").read_text() != (tmp_path/"c").read_text()
+    assert not os.path.exists(str(tmp_path/"a")+".tmp")
+
+
+def testSyntheticPuzzlesAreValid(tmp_path):
+    generateSyntheticSeries(str(tmp_path/"series1"), 300, numberOfPositions=50)
+    puzzles = [json.loads(line) for line in (tmp_path/"series1").read_text().splitlines()]
+    assert len(puzzles) == 300
+    assert len(set(puzzle["FEN"] for puzzle in puzzles)) <= 50
+    schedule = ReviewSchedule()
+    for puzzle in puzzles:
+        board = chess.Board(puzzle["FEN"])
+        assert board.is_valid()
+        if puzzle["PGN"] != "":
+            game = chess.pgn.read_game(StringIO("[FEN \""+puzzle["FEN"]+"\"]\n"+puzzle["PGN"]))
+            assert game.variations and game.errors == []
+        if "previousSolvingTimes" in puzzle:
+            assert puzzle["level"] == schedule.getLevel(puzzle["previousSolvingTimes"])
+            assert puzzle["lastReview"] == puzzle["previousSolvingTimes"][-1][0]
+    assert 0.5 < sum("previousSolvingTimes" in puzzle for puzzle in puzzles)/len(puzzles) < 0.9
+
+
+def testRunReportsEveryCaseAndSize(tmp_path):
+    results = runBenchmarks([200, 100], ["load", "schedule", "level", "save", "memory"], str(tmp_path), 1)
+    assert sorted(name for name in os.listdir(str(tmp_path)) if "." not in name) == ["synthetic100", "synthetic200"]
+    assert set((result["case"], result["puzzles"]) for result in results["results"]) == \
+        set((case, size) for case in ["load", "schedule", "level", "save", "memory"] for size in [100, 200])
+    assert all(result.get("seconds", result.get("bytes")) >= 0 for result in results["results"])
+    schedule = [(result["variant"], result["puzzles"], result["operations"]) for result in results["results"]
+                if result["case"] == "schedule"]
+    assert [(variant, puzzles) for (variant, puzzles, operations) in schedule] == \
+        [("queues", 100), ("pass", 100), ("queues", 200), ("pass", 200)]
+    assert schedule[0][2] == 100 and 0 < schedule[1][2] <= 100 # puzzles which aren't due are skipped
+    # the generated collections are reused and left unchanged
+    before = (tmp_path/"synthetic100").read_text()
+    runBenchmarks([100], ["save"], str(tmp_path), 1)
+    assert (tmp_path/"synthetic100").read_text() == before
+    assert not os.path.exists(str(tmp_path/"synthetic100.save"))
+
+
+def testComparisonCountsTheRegressions(capsys):
+    def run(load, memory):
+        return {"commit": None, "results": [
+            {"case": "load", "variant": "lazy", "puzzles": 100, "seconds": load, "operations": 1},
+            {"case": "memory", "variant": "json dict", "puzzles": 100, "bytes": memory, "operations": 10}]}
+    assert compareResults(run(1.0, 1000), run(1.05, 1000)) == 0
+    assert compareResults(run(1.0, 1000), run(1.2, 1000)) == 1
+    assert compareResults(run(1.0, 1000), run(1.2, 2000)) == 2
+    assert compareResults(run(1.0, 1000), run(1.2, 2000), tolerance=2) == 0
+    assert "worse" in capsys.readouterr().out
+
+
+def testCompareCommandFailsOnRegressions(tmp_path):
+    benchmarks = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Benchmarks.py")
+    for (name, seconds) in [("old", 1.0), ("new", 2.0)]:
+        (tmp_path/(name+".json")).write_text(json.dumps({"results": [
+            {"case": "level", "variant": "getLevel", "puzzles": 10, "seconds": seconds, "operations": 10}]}))
+    process = subprocess.run([sys.executable, benchmarks, "compare", str(tmp_path/"old.json"),
+                              str(tmp_path/"new.json")], stdout=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 1 and "worse" in process.stdout
+    process = subprocess.run([sys.executable, benchmarks, "compare", str(tmp_path/"new.json"),
+                              str(tmp_path/"old.json")], stdout=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0
@@ -0,0 +1,89 @@
+import time
+import concurrent.futures
+import chess
+import pytest
+from conftest import fakeEngine, mateInOne
+from EngineService import EngineService, EnginePool
+
+
+@pytest.fixture
+def engineService():
+    engineService = EngineService(fakeEngine, depth=3, multiPV=3)
+    yield engineService
+    engineService.quit()
+
+
+@pytest.fixture
+def slowEngineService(monkeypatch):
+    monkeypatch.setenv("FAKE_UCI_ENGINE_DELAY", "0.3")
+    engineService = EngineService(fakeEngine, depth=3)
+    yield engineService
+    engineService.quit()
+
+
+def testSearchFindsTheMate(engineService):
+    board = chess.Board(mateInOne["FEN"])
+    result = engineService.analyse(board).result(timeout=30)
+    assert result.bestmove == chess.Move.from_uci("d1d8")
+    assert result.lines[0][0] == result.bestmove
+    assert len(result.lines) == 3
+    assert board.fen() == mateInOne["FEN"]
+
+
+def testSearchesRunInTheOrderOfTheirRequests(engineService):
+    boards = [chess.Board(), chess.Board(mateInOne["FEN"]), chess.Board("4k3/8/8/8/8/8/3q4/4K3 w - - 0 1")]
+    futures = [engineService.analyse(board) for board in boards]
+    assert [future.result(timeout=30).bestmove.uci() for future in futures[1:]] == ["d1d8", "e1d2"]
+
+
+def testQueuedAndRunningSearchesCanBeCancelled(slowEngineService):
+    running = slowEngineService.analyse(chess.Board())
+    queued = slowEngineService.analyse(chess.Board(mateInOne["FEN"]))
+    time.sleep(0.1)
+    slowEngineService.cancel(queued)
+    assert queued.cancelled()
+    while not running.running():
+        time.sleep(0.01)
+    slowEngineService.cancel(running)
+    with pytest.raises(concurrent.futures.CancelledError):
+        running.result(timeout=30)
+    assert slowEngineService.analyse(chess.Board(mateInOne["FEN"])).result(timeout=30).bestmove.uci() == "d1d8"
+
+
+def testBackgroundSearchWaitsForTheOtherSearches(slowEngineService):
+    background = slowEngineService.analyse(chess.Board(), background=True)
+    time.sleep(0.1) # the background search is running now
+    foreground = slowEngineService.analyse(chess.Board(mateInOne["FEN"]))
+    assert foreground.result(timeout=30).bestmove.uci() == "d1d8"
+    assert not background.done()
+    assert background.result(timeout=30).bestmove is not None
+
+
+def testMissingEngineFailsTheSearch():
+    engineService = EngineService("/nonexistent/engine")
+    with pytest.raises(Exception):
+        engineService.analyse(chess.Board()).result(timeout=30)
+    engineService.quit()
+
+
+def testPoolSpreadsTheSearches():
+    enginePool = EnginePool(2, fakeEngine, depth=3)
+    futures = [enginePool.analyse(chess.Board(mateInOne["FEN"])) for i in range(6)]
+    assert all(future.result(timeout=30).bestmove.uci() == "d1d8" for future in futures)
+    assert all(service.engine is not None for service in enginePool.services)
+    enginePool.quit()
+
+
+def testSearchesCanBeCancelledRightAfterTheirStart(engineService):
+    board = chess.Board(mateInOne["FEN"])
+    engineService.analyse(board).result(timeout=30) # the engine is running
+    for i in range(100):
+        future = engineService.analyse(board)
+        while engineService.engine.idle and not future.done(): # the go command is queued
+            pass
+        engineService.cancel(future)
+        try:
+            assert future.result(timeout=30).bestmove.uci() == "d1d8"
+        except concurrent.futures.CancelledError:
+            pass
+    assert engineService.analyse(board).result(timeout=30).bestmove.uci() == "d1d8"
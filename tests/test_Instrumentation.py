@@ -0,0 +1,71 @@
+import json
+import time
+import threading
+import chess
+import pytest
+from conftest import fakeEngine, mateInOne
+import Instrumentation
+from Instrumentation import Tracer, percentile
+from EngineService import EngineService
+
+
+def testSpansAreOnlyRecordedWhenTracing(tmp_path):
+    tracer = Tracer()
+    assert tracer.span("board render") is Instrumentation.nullSpan
+    with tracer.span("board render"):
+        pass
+    tracer.record("engine search", time.perf_counter(), 0.5)
+    assert tracer.spans == [] and tracer.finish() is None
+    tracer.start(str(tmp_path))
+    with tracer.span("board render", frame=1):
+        time.sleep(0.01)
+    [(name, start, duration, thread, args)] = tracer.spans
+    assert (name, thread, args) == ("board render", threading.get_ident(), {"frame": 1})
+    assert 0.01 <= duration < 1
+
+
+def testSummaryUsesNearestRankPercentiles():
+    assert [percentile([1, 2, 3, 4], p) for p in [0, 25, 50, 95, 100]] == [1, 1, 2, 4, 4]
+    tracer = Tracer(maxSpans=20)
+    tracer.start("unused")
+    for duration in range(1, 26):
+        tracer.record("pgn parse", 0, duration/1000)
+    assert tracer.droppedSpans == 5
+    assert tracer.summary() == {"pgn parse": {"count": 20, "total": pytest.approx(0.21), "p50": 0.01, "p95": 0.019,
+                                              "max": 0.02}}
+
+
+def testChromeTraceOfSeveralThreads(tmp_path):
+    tracer = Tracer()
+    tracer.start(str(tmp_path/"traces"))
+    with tracer.span("frame"):
+        pass
+    worker = threading.Thread(target=lambda: tracer.record("engine search", tracer.origin+0.002, 0.001, depth=3),
+                              name="engine")
+    worker.start()
+    worker.join()
+    filename = tracer.finish()
+    assert filename.startswith(str(tmp_path/"traces"/"trace-")) and filename.endswith(".json")
+    with open(filename) as traceFile:
+        trace = json.load(traceFile)
+    names = {event["tid"]: event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"}
+    assert sorted(names.values()) == ["MainThread", "engine"]
+    [search] = [event for event in trace["traceEvents"] if event["name"] == "engine search"]
+    assert (search["ph"], search["ts"], search["dur"], search["args"]) == ("X", 2000, 1000, {"depth": 3})
+    assert names[search["tid"]] == "engine"
+    assert set(trace["otherData"]["summary"]) == {"frame", "engine search"}
+
+
+def testEngineSearchesAreTraced(monkeypatch):
+    tracer = Tracer()
+    tracer.start("unused")
+    monkeypatch.setattr(Instrumentation, "tracer", tracer)
+    monkeypatch.setattr(Instrumentation, "record", tracer.record)
+    engineService = EngineService(fakeEngine, depth=2)
+    try:
+        engineService.analyse(chess.Board(mateInOne["FEN"])).result(timeout=30)
+    finally:
+        engineService.quit()
+    [(name, start, duration, thread, args)] = tracer.spans
+    assert name == "engine search" and duration >= args["search"] >= 0
+    assert (args["requestedDepth"], args["background"]) == (2, False)
@@ -0,0 +1,55 @@
+import chess
+import pygame
+import pytest
+from MyChessBoard import MyChessBoard
+
+
+@pytest.fixture(autouse=True)
+def display():
+    pygame.display.init() # the dummy video driver, see conftest.py
+    yield
+    pygame.display.quit()
+
+
+def pixels(surface):
+    return pygame.image.tostring(surface, "RGB")
+
+
+def drawnBoard(board, sizeX=403):
+    screen = pygame.display.set_mode((sizeX, sizeX))
+    chessBoard = MyChessBoard(sizeX, board, screen)
+    chessBoard.updateDisplay()
+    return (chessBoard, screen)
+
+
+def testOnlyChangedSquaresAreRedrawn():
+    (chessBoard, screen) = drawnBoard(chess.Board())
+    assert pixels(screen) == pixels(chessBoard.renderBoard(chess.Board()))
+    for (move, changedSquares) in [("e2e4", 2), ("e7e5", 2), ("g1f3", 2), ("b8c6", 2), ("f1c4", 2), ("g8f6", 2),
+                                   ("e1g1", 4), ("f6e4", 2)]:
+        chessBoard.board.push_uci(move)
+        chessBoard.draw_board()
+        assert len(chessBoard.dirtyRects) == changedSquares
+        chessBoard.updateDisplay()
+        assert pixels(screen) == pixels(chessBoard.renderBoard(chessBoard.board))
+    chessBoard.draw_board()
+    assert chessBoard.dirtyRects == []
+
+
+def testInvalidatedBoardIsRedrawnCompletely():
+    (chessBoard, screen) = drawnBoard(chess.Board())
+    screen.fill((1, 2, 3))
+    chessBoard.invalidate()
+    chessBoard.draw_board()
+    assert pixels(screen) == pixels(chessBoard.renderBoard(chess.Board()))
+
+
+def testPrerenderedPositionIsShownWithoutDrawing():
+    (chessBoard, screen) = drawnBoard(chess.Board())
+    board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+    surface = chessBoard.renderBoard(board)
+    chessBoard.loadNewPosition(board, surface=surface)
+    assert pixels(screen) == pixels(surface)
+    chessBoard.updateDisplay()
+    chessBoard.draw_board()
+    assert chessBoard.dirtyRects == []
@@ -0,0 +1,67 @@
+import os
+import json
+import chess
+import chess.pgn
+from io import StringIO
+from conftest import fakeEngine, mateInOne, puzzleLine, rookPositions
+from PrecomputeSolutions import movesToPGN, precomputeSolutions
+from PuzzleCollection import PuzzleCollection
+from ResultJournal import fileFingerprint
+
+
+def readSeries(filename):
+    with open(filename) as seriesFile:
+        return [json.loads(line) for line in seriesFile]
+
+
+def firstMove(puzzleDict):
+    game = chess.pgn.read_game(StringIO("[FEN \""+puzzleDict['FEN']+"\"]\n"+puzzleDict['PGN']))
+    return game.variations[0].move.uci()
+
+
+def testMovesToPGNWritesAlternativesAsVariations():
+    board = chess.Board(mateInOne["FEN"])
+    lines = [[chess.Move.from_uci(move) for move in line.split()] for line in ["d1d8", "d1d7 h7h6 d7a7", "d1d8"]]
+    assert movesToPGN(board, lines, 7) == "1. Rd8# ( 1. Rd7 h6 2. Ra7 )"
+    assert movesToPGN(board, lines[1:2], 2) == "1. Rd7 h6"
+
+
+def testPuzzlesWithoutSolutionAreSolved(writeSeries):
+    lines = [puzzleLine(mateInOne["FEN"]), puzzleLine(rookPositions(1)[0], "1. Ra8#"), puzzleLine(mateInOne["FEN"])]
+    filename = writeSeries(lines*3)
+    puzzleCollection = PuzzleCollection(filename)
+    puzzleCollection.getPuzzle(3).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.savePuzzlesIntoFile()
+    assert precomputeSolutions(filename, depth=2, multiPV=3, processes=2, enginePath=fakeEngine) == 6
+    puzzleDicts = readSeries(filename)
+    assert [firstMove(puzzleDict) for puzzleDict in puzzleDicts] == ["d1d8", "a1a8", "d1d8"]*3
+    # the fake engine scores the quiet moves equally, so the alternatives are accepted, too
+    assert puzzleDicts[0]['PGN'].count("(") == 2
+    assert puzzleDicts[1] == json.loads(lines[1])
+    assert len(puzzleDicts[3]['previousSolvingTimes']) == 1 # the journal was folded into the file first
+    assert not os.path.exists(filename+".precomputed")
+    assert precomputeSolutions(filename, depth=2, processes=1, enginePath=fakeEngine) == 0
+
+
+def testInterruptedRunIsContinued(writeSeries):
+    lines = [puzzleLine(fen) for fen in rookPositions(5)]
+    filename = writeSeries(lines)
+    size = os.path.getsize(filename)
+    with open(filename+".precomputed", 'w') as progressFile:
+        progressFile.write(json.dumps({"seriesSize": size, "seriesDigest": fileFingerprint(filename, size)})+"\n")
+        # two puzzles were solved before the interruption, the third one was written partially
+        progressFile.write(puzzleLine(rookPositions(5)[0], "1. Ra8#")+"\n"+puzzleLine(rookPositions(5)[1], "1. Rb8#")+
+                           "\n"+lines[2][:10])
+    assert precomputeSolutions(filename, depth=2, multiPV=1, processes=1, enginePath=fakeEngine) == 3
+    puzzleDicts = readSeries(filename)
+    assert [puzzleDict['FEN'] for puzzleDict in puzzleDicts] == rookPositions(5)
+    assert [puzzleDict['PGN'] for puzzleDict in puzzleDicts[:2]] == ["1. Ra8#", "1. Rb8#"]
+    assert all(puzzleDict['PGN'] != "" for puzzleDict in puzzleDicts)
+
+
+def testProgressOfAnotherVersionIsDiscarded(writeSeries):
+    filename = writeSeries([puzzleLine(fen) for fen in rookPositions(3)])
+    with open(filename+".precomputed", 'w') as progressFile:
+        progressFile.write(json.dumps({"seriesSize": 1, "seriesDigest": "0"})+"\n"+puzzleLine(mateInOne["FEN"])+"\n")
+    assert precomputeSolutions(filename, depth=2, multiPV=1, processes=1, enginePath=fakeEngine) == 3
+    assert [puzzleDict['FEN'] for puzzleDict in readSeries(filename)] == rookPositions(3)
@@ -0,0 +1,217 @@
+import os
+import json
+import random
+import datetime
+import chess.pgn
+import pytest
+from conftest import mateInOne, puzzleLine, rookPositions
+from PuzzleCollection import ChessPuzzle, PuzzleCollection, ReviewSchedule, ScheduledPuzzleCollection
+
+
+def countParsedGames(monkeypatch):
+    calls = []
+    readGame = chess.pgn.read_game
+    monkeypatch.setattr(chess.pgn, "read_game", lambda *args, **kwargs: calls.append(1) or readGame(*args, **kwargs))
+    return calls
+
+
+def testGameIsParsedOnFirstAccessOnly(monkeypatch):
+    calls = countParsedGames(monkeypatch)
+    puzzle = ChessPuzzle(puzzleLine(mateInOne["FEN"], mateInOne["PGN"]))
+    assert calls == []
+    game = puzzle.game
+    assert puzzle.game is game
+    assert len(calls) == 1
+
+
+def testLazyGameEqualsEagerGame():
+    line = puzzleLine("r1bq1rk1/p4ppp/2p5/2b1p3/4P1n1/2NB1Q2/PPP3PP/R1B2R1K b - - 0 1",
+                      "1... Nxh2 2. Kxh2 (2. Kg1 Qh4) Qh4+")
+    (lazyGame, eagerGame) = (ChessPuzzle(line).game, ChessPuzzle(line, lazy=False).game)
+    assert str(lazyGame) == str(eagerGame)
+    assert [move.uci() for move in lazyGame.main_line()] == ["g4h2", "h1h2", "d8h4"]
+
+
+def testPuzzleWithoutSolutionHasNoGame():
+    assert ChessPuzzle(puzzleLine(mateInOne["FEN"])).game is None
+
+
+def testCollectionLoadsWithoutParsingGames(monkeypatch, writeSeries):
+    filename = writeSeries([puzzleLine(mateInOne["FEN"], mateInOne["PGN"])]*20)
+    calls = countParsedGames(monkeypatch)
+    puzzleCollection = PuzzleCollection(filename)
+    puzzles = [puzzleCollection.getPuzzle(index) for index in range(len(puzzleCollection))]
+    assert calls == []
+    assert puzzles[3].game.variations[0].move == chess.Move.from_uci("d1d8")
+    assert len(calls) == 1
+    puzzleCollection.closePuzzleCollection()
+
+
+def daysAgo(days):
+    return str(datetime.date.today()-datetime.timedelta(days=days))
+
+
+def scheduledSeries(writeSeries):
+    """
+    Lines 0 and 3 are due reviews, line 1 is solved but not due, lines 2 and 4 are new
+    """
+    fens = rookPositions(5)
+    return writeSeries([puzzleLine(fens[0], previousSolvingTimes=[[daysAgo(5), 10.0]]),
+                        puzzleLine(fens[1], previousSolvingTimes=[[daysAgo(1), 10.0]]),
+                        puzzleLine(fens[2]),
+                        puzzleLine(fens[3], previousSolvingTimes=[[daysAgo(3), 10.0], [daysAgo(2), "not solved"]]),
+                        puzzleLine(fens[4])])
+
+
+def testDueReviewsArePresentedBeforeNewPuzzles(writeSeries):
+    puzzleCollection = ScheduledPuzzleCollection(scheduledSeries(writeSeries))
+    assert sorted(puzzleCollection.duePuzzles()) == [0, 3]
+    presented = []
+    for puzzle in puzzleCollection:
+        presented.append(puzzle.index)
+        if puzzle.index == 3:
+            puzzle.markPuzzleAsSolvedIncorrectly()
+        else:
+            puzzle.markPuzzleAsSolvedCorrectly()
+    # puzzle 3 is due again after it was not solved, but only in the second pass
+    assert sorted(presented[:2]) == [0, 3]
+    assert presented[2] == 3
+    assert sorted(presented[3:]) == [2, 4]
+
+
+def testScheduleSidecarAfterCompactionEqualsARebuild(writeSeries):
+    filename = scheduledSeries(writeSeries)
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    puzzleCollection.getPuzzle(2).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.getPuzzle(0).markPuzzleAsSolvedIncorrectly()
+    puzzleCollection.currentChessPuzzle = puzzleCollection.getPuzzle(1)
+    puzzleCollection.removeCurrentPuzzleFromCollection()
+    puzzleCollection.compact()
+    assert sorted(puzzleCollection.duePuzzles()+puzzleCollection.answeredPuzzles) == [0, 2]
+    with open(filename+".schedule", 'rb') as scheduleFile:
+        compactedSchedule = scheduleFile.read()
+    os.remove(filename+".schedule")
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    with open(filename+".schedule", 'rb') as scheduleFile:
+        assert scheduleFile.read() == compactedSchedule
+    assert sorted(puzzleCollection.duePuzzles()) == [0, 2]
+    assert puzzleCollection.newQueue.due(0) == [3]
+
+
+def testOutdatedScheduleSidecarIsRebuilt(writeSeries):
+    filename = scheduledSeries(writeSeries)
+    ScheduledPuzzleCollection(filename)
+    writeSeries([puzzleLine(mateInOne["FEN"], previousSolvingTimes=[[daysAgo(9), 10.0]]), puzzleLine(mateInOne["FEN"])])
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    assert puzzleCollection.duePuzzles() == [0]
+    assert puzzleCollection.newQueue.due(0) == [1]
+
+
+def testResultsOfTheJournalAreScheduled(writeSeries):
+    filename = scheduledSeries(writeSeries)
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    puzzleCollection.getPuzzle(4).markPuzzleAsSolvedIncorrectly()
+    puzzleCollection.getPuzzle(0).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.savePuzzlesIntoFile()
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    assert sorted(puzzleCollection.duePuzzles()) == [3, 4]
+    assert puzzleCollection.newQueue.due(0) == [2]
+
+
+def testQueuesAreBuiltWithoutReadingThePuzzles(monkeypatch, writeSeries):
+    filename = scheduledSeries(writeSeries)
+    ScheduledPuzzleCollection(filename)
+    decodedLines = []
+    loads = json.loads
+    monkeypatch.setattr(json, "loads", lambda line: decodedLines.append(line) or loads(line))
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    assert [line for line in decodedLines if "FEN" in line] == []
+    assert sorted(puzzleCollection.duePuzzles()) == [0, 3]
+
+
+def testIncrementalLevelsEqualTheReplayedHistory():
+    random.seed(5)
+    reviewSchedule = ReviewSchedule()
+    for puzzleNumber in range(200):
+        puzzleDict = {'previousSolvingTimes': []}
+        for day in range(random.randrange(1, 12)):
+            result = [daysAgo(20-day), random.choice(["not solved", 5.0, 60.0, 120.0, 300.0])]
+            puzzleDict['previousSolvingTimes'].append(result)
+            reviewSchedule.updateLevel(puzzleDict, result)
+            assert puzzleDict['level'] == reviewSchedule.getLevel(puzzleDict['previousSolvingTimes'])
+            assert puzzleDict['lastReview'] == result[0]
+
+
+def testLevelsAreMigratedAndValidated(writeSeries):
+    history = [[daysAgo(9), 10.0], [daysAgo(7), 10.0], [daysAgo(5), "not solved"], [daysAgo(4), 200.0]]
+    filename = writeSeries([puzzleLine(mateInOne["FEN"], previousSolvingTimes=history),
+                            puzzleLine(mateInOne["FEN"], previousSolvingTimes=history, level=5, lastReview=daysAgo(4)),
+                            puzzleLine(mateInOne["FEN"])])
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    assert puzzleCollection.validateLevels() == [1]
+    puzzleCollection.getPuzzle(2).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.getPuzzle(0).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.migrateLevels()
+    with open(filename) as seriesFile:
+        puzzleDicts = [json.loads(line) for line in seriesFile]
+    assert [puzzleDict.get('level') for puzzleDict in puzzleDicts] == [2, 5, 2]
+    assert puzzleDicts[0]['lastReview'] == str(datetime.date.today())
+    assert ScheduledPuzzleCollection(filename).validateLevels() == [1]
+
+
+def testLevelWithoutHistoryIsIgnored(writeSeries):
+    filename = writeSeries([puzzleLine(mateInOne["FEN"], level=4), puzzleLine(mateInOne["FEN"], level=4)])
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    assert puzzleCollection.newQueue.due(0) != [] and puzzleCollection.duePuzzles() == []
+    puzzleCollection.getPuzzle(0).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.getPuzzle(1).markPuzzleAsSolvedIncorrectly()
+    assert [puzzleCollection.getPuzzle(index).field('level') for index in range(2)] == [2, 0]
+    assert puzzleCollection.validateLevels() == []
+
+
+def testPackedPuzzleReproducesItsJsonLine():
+    lines = [json.dumps({"level": 2, "FEN": mateInOne["FEN"], "PGN": mateInOne["PGN"], "description": "White to move",
+                         "previousSolvingTimes": [["2017-03-01", 12.5], ["2017-03-03", "not solved"]],
+                         "lastReview": "2017-03-03", "rating": 1500}),
+             # histories and dates which can't be packed are kept as they are
+             json.dumps({"FEN": mateInOne["FEN"], "PGN": "", "previousSolvingTimes": [["2017-3-1", 12], ["x"]],
+                         "lastReview": "2017-3-1", "level": "2", "description": None}),
+             json.dumps({"previousSolvingTimes": [], "PGN": mateInOne["PGN"], "FEN": mateInOne["FEN"]})]
+    for line in lines:
+        puzzle = ChessPuzzle(line)
+        assert str(puzzle) == line
+        assert dict(puzzle.puzzleDict) == json.loads(line)
+    assert ChessPuzzle(lines[0]).fields is ChessPuzzle(lines[0]).fields
+    assert ChessPuzzle(lines[0]).reviewDays is not None and ChessPuzzle(lines[1]).reviewDays is None
+
+
+def testResultsAreAppendedToThePackedHistory():
+    for history in [[], [["2017-03-01", 12.5]], [["2017-3-1", 12]]]:
+        puzzle = ChessPuzzle(puzzleLine(mateInOne["FEN"], previousSolvingTimes=history))
+        puzzle.markPuzzleAsSolvedIncorrectly()
+        puzzle.appendResult(["2018-01-02", 3.25])
+        assert puzzle.previousSolvingTimes == history+[[str(datetime.date.today()), "not solved"],
+                                                       ["2018-01-02", 3.25]]
+        assert json.loads(str(puzzle))["previousSolvingTimes"] == puzzle.previousSolvingTimes
+
+
+def testPuzzleDictViewWritesIntoThePuzzle():
+    puzzle = ChessPuzzle(puzzleLine(mateInOne["FEN"], mateInOne["PGN"]))
+    puzzleDict = puzzle.puzzleDict
+    assert puzzle.game is not None
+    puzzleDict['previousSolvingTimes'].append(["2017-03-01", 1.5]) # a copy
+    assert puzzle.previousSolvingTimes == []
+    puzzleDict['previousSolvingTimes'] = [["2017-03-01", 1.5]]
+    puzzleDict['level'] = 3
+    puzzleDict['tags'] = ["mate"]
+    del puzzleDict['PGN']
+    assert puzzle.game is None
+    assert list(puzzleDict) == ["FEN", "description", "previousSolvingTimes", "level", "tags"]
+    assert json.loads(str(puzzle)) == {"FEN": mateInOne["FEN"], "description": "White to move", "level": 3,
+                                       "previousSolvingTimes": [["2017-03-01", 1.5]], "tags": ["mate"]}
+    puzzleDict['PGN'] = mateInOne["PGN"]
+    assert puzzle.game.variations[0].move.uci() == "d1d8"
+    assert "PGN" in puzzleDict and "rating" not in puzzleDict and len(puzzleDict) == 6
+    with pytest.raises(KeyError):
+        puzzleDict['rating']
+    assert puzzleDict.get('rating') is None
@@ -0,0 +1,78 @@
+import os
+import json
+import pytest
+from conftest import mateInOne, puzzleLine, rookPositions
+from PuzzleCollection import PuzzleCollection
+from PuzzleDeduplication import PositionIndex, flagDuplicates, mergeDuplicates, seriesFiles
+
+
+@pytest.fixture
+def folder(tmp_path):
+    """
+    series1: positions 0-3, series2: position 3 (with other move counters), 4 and 0
+    """
+    folder = tmp_path/"series"
+    folder.mkdir()
+    fens = rookPositions(5)
+    with open(str(folder/"series1"), 'w') as seriesFile:
+        for fen in fens[:3]:
+            seriesFile.write(puzzleLine(fen)+"\n")
+        seriesFile.write(puzzleLine(fens[3], "1. Rd8#", previousSolvingTimes=[["2020-01-01", 10.0]])+"\n")
+    with open(str(folder/"series2"), 'w') as seriesFile:
+        seriesFile.write(puzzleLine(fens[3].replace(" 0 1", " 5 40"), "1. Rd7 h6",
+                                    previousSolvingTimes=[["2019-12-01", "not solved"]])+"\n")
+        seriesFile.write(puzzleLine(fens[4])+"\n")
+        seriesFile.write(puzzleLine(fens[0])+"\n")
+    return str(folder)
+
+
+def readSeries(filename):
+    with open(filename) as seriesFile:
+        return [json.loads(line) for line in seriesFile]
+
+
+def testSeriesFilesAreOrderedByNumber(folder):
+    open(os.path.join(folder, "series10"), 'w').close()
+    open(os.path.join(folder, "series2.idx"), 'w').close()
+    assert [os.path.basename(filename) for filename in seriesFiles(folder)] == ["series1", "series2", "series10"]
+
+
+def testDuplicatesAreFlagged(folder):
+    assert flagDuplicates(folder) == 2
+    positionIndex = PositionIndex(folder)
+    groups = sorted((os.path.basename(name), line) for group in positionIndex.duplicates() for (name, line) in group)
+    assert groups == [("series1", 0), ("series1", 3), ("series2", 0), ("series2", 2)]
+    positionIndex.close()
+
+
+def testIndexIsUpdatedIncrementally(folder):
+    positionIndex = PositionIndex(folder)
+    assert positionIndex.update() == 7
+    assert positionIndex.update() == 0
+    with open(os.path.join(folder, "series2"), 'a') as seriesFile:
+        seriesFile.write(puzzleLine(mateInOne["FEN"])+"\n")
+    assert positionIndex.update() == 1
+    assert len(list(positionIndex.duplicates())) == 2
+    with open(os.path.join(folder, "series2"), 'w') as seriesFile:
+        seriesFile.write(puzzleLine(rookPositions(6)[5])+"\n")
+    assert positionIndex.update() == 1
+    assert list(positionIndex.duplicates()) == []
+    positionIndex.close()
+
+
+def testDuplicatesAreMerged(folder):
+    puzzleCollection = PuzzleCollection(os.path.join(folder, "series2"))
+    puzzleCollection.getPuzzle(2).markPuzzleAsSolvedCorrectly() # only in the journal
+    puzzleCollection.savePuzzlesIntoFile()
+    assert mergeDuplicates(folder) == 2
+    (series1, series2) = (readSeries(os.path.join(folder, "series1")), readSeries(os.path.join(folder, "series2")))
+    assert [puzzleDict["FEN"] for puzzleDict in series1] == rookPositions(4)
+    assert [puzzleDict["FEN"] for puzzleDict in series2] == rookPositions(5)[4:]
+    # the solutions and histories of the duplicates were added
+    assert series1[3]["PGN"] == "1. Rd8# ( 1. Rd7 h6 )"
+    assert [result[0] for result in series1[3]["previousSolvingTimes"]] == ["2019-12-01", "2020-01-01"]
+    assert (series1[3]["level"], series1[3]["lastReview"]) == (1, "2020-01-01")
+    # neither puzzle has a solution, "*" would be an empty solution
+    assert series1[0]["PGN"] == ""
+    assert len(series1[0]["previousSolvingTimes"]) == 1
+    assert flagDuplicates(folder) == 0
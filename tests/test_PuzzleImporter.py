@@ -0,0 +1,77 @@
+import bz2
+import gzip
+import json
+from io import StringIO
+from conftest import mateInOne, puzzleLine
+from PuzzleCollection import PuzzleCollection
+from PuzzleImporter import convertCsvPuzzle, convertPgnGame, importPuzzles, readCsvPuzzles, readPgnGames
+
+lichessRow = "00sHx,q3k1nr/1pp1nQpp/3p4/1P2p3/4P3/B1PP1b2/B5PP/5K2 b k - 0 17,e8d7 a2e6 d7d8 f7f8,1760,80,83,72," \
+             "mate mateIn2 middlegame short,https://lichess.org/yyznGmXs/black#34"
+pgnGames = """[Event "mate"]
+[FEN "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"]
+
+1. Rd8# (1. Rd7 h6) 1-0
+
+[Event "no moves"]
+[FEN "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"]
+
+*
+
+[Event "illegal move"]
+
+1. e4 e4 *
+
+[Event "from the initial position"]
+
+1. f3 e5 2. g4 Qh4# 0-1
+"""
+
+
+def testPgnGamesAreConverted():
+    games = list(readPgnGames(StringIO(pgnGames)))
+    assert len(games) == 4
+    puzzles = [convertPgnGame(game) for game in games]
+    assert json.loads(puzzles[0]) == {"FEN": mateInOne["FEN"], "description": "White to move",
+                                      "PGN": "1. Rd8# ( 1. Rd7 h6 )"}
+    assert puzzles[1:3] == [None, None]
+    assert json.loads(puzzles[3])["PGN"] == "1. f3 e5 2. g4 Qh4#"
+    assert json.loads(puzzles[3])["FEN"] == "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def testCsvPuzzleStartsAfterTheMoveOfTheOpponent():
+    puzzle = json.loads(convertCsvPuzzle(next(readCsvPuzzles(StringIO(lichessRow)))))
+    assert puzzle == {"FEN": "q5nr/1ppknQpp/3p4/1P2p3/4P3/B1PP1b2/B5PP/5K2 w - - 1 18",
+                      "description": "White to move (rating 1760, mate mateIn2 middlegame short)",
+                      "PGN": "18. Be6+ Kd8 19. Qf8#"}
+    for row in [(None, None, None, None), ("no fen", "e2e4 e7e5", "", ""), ("8/8/8/8/8/8/8/8 w - - 0 1", "", "", ""),
+                (mateInOne["FEN"], "d1d8", "", ""),
+                (mateInOne["FEN"], "d1d8 g8h8", "", ""), (mateInOne["FEN"], "h2h3 a7a6 d1d8", "", "")]:
+        assert convertCsvPuzzle(row) is None
+
+
+def testCsvHeaderChoosesTheColumns():
+    rows = list(readCsvPuzzles(StringIO("Moves,Id,FEN\nd1d8 g8h8,1,"+mateInOne["FEN"]+"\nshort\n")))
+    assert rows == [(mateInOne["FEN"], "d1d8 g8h8", "", ""), (None, None, None, None)]
+
+
+def testPuzzlesAreAppendedToTheSeriesFile(tmp_path):
+    seriesFilename = str(tmp_path/"series1")
+    with open(seriesFilename, 'w') as seriesFile:
+        seriesFile.write(puzzleLine(mateInOne["FEN"])) # without new line at the end
+    puzzleCollection = PuzzleCollection(seriesFilename)
+    puzzleCollection.getPuzzle(0).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.savePuzzlesIntoFile()
+    with gzip.open(str(tmp_path/"puzzles.csv.gz"), 'wt') as dumpFile:
+        dumpFile.write("PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,GameUrl\n")
+        dumpFile.write((lichessRow+"\n")*1200+"broken,row\n")
+    assert importPuzzles(str(tmp_path/"puzzles.csv.gz"), seriesFilename, processes=2) == (1200, 1)
+    with bz2.open(str(tmp_path/"games.pgn.bz2"), 'wt') as dumpFile:
+        dumpFile.write(pgnGames)
+    assert importPuzzles(str(tmp_path/"games.pgn.bz2"), seriesFilename, processes=1) == (2, 2)
+
+    puzzleCollection = PuzzleCollection(seriesFilename)
+    assert len(puzzleCollection) == 1203
+    assert len(puzzleCollection.getPuzzle(0).previousSolvingTimes) == 1 # the journal is still valid
+    assert puzzleCollection.getPuzzle(1200).field("PGN") == "18. Be6+ Kd8 19. Qf8#"
+    assert puzzleCollection.getPuzzle(1202).field("PGN") == "1. f3 e5 2. g4 Qh4#"
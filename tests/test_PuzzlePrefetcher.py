@@ -0,0 +1,83 @@
+import concurrent.futures
+import chess
+from conftest import mateInOne, puzzleLine, rookPositions
+from MyChessBoard import MyChessBoard
+from PuzzleCollection import PuzzleCollection, ScheduledPuzzleCollection
+from PuzzlePrefetcher import PuzzlePrefetcher
+
+
+class RecordingEngineService:
+    """
+    Answers every search at once and remembers the cancelled searches
+    """
+    def __init__(self):
+        self.searches = []
+        self.cancelled = []
+
+    def analyse(self, board, depth=None, background=False):
+        future = concurrent.futures.Future()
+        self.searches.append((board.fen(), background))
+        future.set_result(chess.uci.BestMove(next(iter(board.legal_moves)), None))
+        return future
+
+    def cancel(self, future):
+        self.cancelled.append(future)
+
+
+def seriesLines():
+    """
+    The puzzles in even lines have a solution, the others need the engine
+    """
+    return [puzzleLine(fen, "" if number % 2 else "1. R"+"abcde"[number]+"8#")
+            for (number, fen) in enumerate(rookPositions(5))]
+
+
+def testPrefetchedPuzzleIsTheNextPuzzle(writeSeries):
+    puzzleCollection = PuzzleCollection(writeSeries(seriesLines()))
+    engineService = RecordingEngineService()
+    prefetcher = PuzzlePrefetcher(puzzleCollection, MyChessBoard(400, chess.Board(), None), engineService)
+    for i in range(5):
+        prefetcher.prefetch()
+        prefetcher.prefetch() # nothing happens, the puzzle is already prepared
+        puzzle = next(puzzleCollection)
+        preparedPuzzle = prefetcher.take(puzzle)
+        assert preparedPuzzle.puzzle is puzzle
+        assert preparedPuzzle.board.fen() == puzzle.FEN
+        assert preparedPuzzle.surface.get_size() == (400, 400)
+        assert (preparedPuzzle.suggestion is None) == (puzzle.game is not None)
+    assert sorted(fen for (fen, background) in engineService.searches) == \
+        sorted(puzzleCollection.getPuzzle(index).FEN for index in [1, 3])
+    assert all(background for (fen, background) in engineService.searches)
+    assert engineService.cancelled == []
+    prefetcher.close()
+
+
+def testPreparationOfAnotherPuzzleIsDiscarded(writeSeries):
+    puzzleCollection = PuzzleCollection(writeSeries(seriesLines()))
+    engineService = RecordingEngineService()
+    prefetcher = PuzzlePrefetcher(puzzleCollection, MyChessBoard(400, chess.Board(), None), engineService)
+    while puzzleCollection.peekNextIndex() % 2 == 0:
+        next(puzzleCollection)
+    prefetcher.prefetch()
+    index = puzzleCollection.peekNextIndex()
+    assert prefetcher.take(puzzleCollection.getPuzzle((index+1) % 5)) is None
+    prefetcher.close()
+    assert len(engineService.cancelled) == 1
+    assert next(puzzleCollection).index == index
+
+
+def testPrefetchingDoesNotChangeTheSchedule(writeSeries):
+    lines = seriesLines()
+    lines[2] = puzzleLine(mateInOne["FEN"], previousSolvingTimes=[["2001-01-01", 10.0]])
+    puzzleCollection = ScheduledPuzzleCollection(writeSeries(lines))
+    prefetcher = PuzzlePrefetcher(puzzleCollection, MyChessBoard(400, chess.Board(), None))
+    prefetcher.prefetch()
+    assert prefetcher.prefetchedIndex == 2
+    assert prefetcher.take(next(puzzleCollection)).puzzle.index == 2
+    prefetcher.prefetch() # the new puzzles are only known after the first pass
+    assert prefetcher.preparation is None
+    puzzle = next(puzzleCollection)
+    assert puzzle.index != 2
+    prefetcher.prefetch()
+    assert prefetcher.take(next(puzzleCollection)).puzzle is puzzleCollection.currentChessPuzzle
+    prefetcher.close()
@@ -0,0 +1,80 @@
+import os
+import pytest
+from conftest import fakeEngine, mateInOne, puzzleLine, rookPositions
+from PuzzleCollection import ScheduledPuzzleCollection, puzzleChecksum
+from PuzzleRating import ratePuzzles, PuzzleRatings, NewPuzzleSelection, tagBits, engineBit, maxDifficulty
+
+quietMove = (rookPositions(1)[0], "1. Ra2")
+knightFork = ("r3k3/8/8/3N4/8/8/8/4K3 w - - 0 1", "1. Nc7+")
+
+
+def tags(ratings, position):
+    return sorted(name for (name, bit) in tagBits.items() if ratings.tags[position] & bit)
+
+
+@pytest.fixture
+def series(writeSeries):
+    return writeSeries([puzzleLine(mateInOne["FEN"], mateInOne["PGN"]), puzzleLine(*quietMove),
+                        puzzleLine(*knightFork), puzzleLine(rookPositions(1)[0])])
+
+
+def testPuzzlesAreRatedWithoutEngine(series):
+    (ratings, analysed) = ratePuzzles(series, processes=1, useEngine=False)
+    assert analysed == 4 and len(PuzzleRatings.load(series)) == 4
+    assert [tags(ratings, position) for position in range(3)] == [["check", "mate"], ["quiet"], ["check", "fork"]]
+    assert list(ratings.lengths) == [1, 1, 1, 0] and list(ratings.difficulties)[:3] == [100, 200, 100]
+    assert [ratings.withoutSolution(position) for position in range(4)] == [False]*3+[True]
+    assert ratings.checksums[0] == puzzleChecksum(mateInOne["FEN"], mateInOne["PGN"])
+    assert ratePuzzles(series, processes=1, useEngine=False)[1] == 0
+
+
+def testRatingsWithoutEngineAreAnalysedAgain(series):
+    ratePuzzles(series, processes=1, useEngine=False)
+    (ratings, analysed) = ratePuzzles(series, depth=2, processes=1, enginePath=fakeEngine)
+    assert analysed == 4 and all(tag & engineBit for tag in ratings.tags)
+    assert (ratings.lengths[3], tags(ratings, 3), ratings.gaps[3]) == (1, ["check", "mate"], 0)
+    assert not ratings.withoutSolution(3)
+    assert ratePuzzles(series, depth=2, processes=1, enginePath=fakeEngine)[1] == 0
+
+
+def testChangedSolutionIsRatedAgain(series, writeSeries):
+    ratePuzzles(series, processes=1, useEngine=False)
+    writeSeries([puzzleLine(mateInOne["FEN"], mateInOne["PGN"]), puzzleLine(quietMove[0], "1. Ra8#"),
+                 puzzleLine(*knightFork), puzzleLine(rookPositions(1)[0])])
+    (ratings, analysed) = ratePuzzles(series, processes=1, useEngine=False)
+    assert analysed == 1 and tags(ratings, 1) == ["check", "mate"]
+
+
+def testRatingsAreFoundAfterManyLinesWereRemoved(writeSeries):
+    puzzles = [puzzleLine(mateInOne["FEN"].replace(" 1", " "+str(move)), mateInOne["PGN"])
+               for move in range(1, 61)]
+    filename = writeSeries(puzzles+[puzzleLine(*knightFork)]*3)
+    ratePuzzles(filename, processes=1, useEngine=False)
+    writeSeries(puzzles[:5]+puzzles[45:]+[puzzleLine(*knightFork)]*2)
+    ratings = PuzzleRatings.load(filename)
+    positions = [ratings.find(index, puzzleChecksum(mateInOne["FEN"].replace(" 1", " "+str(move)), mateInOne["PGN"]))
+                 for (index, move) in enumerate(list(range(1, 6))+list(range(46, 61)))]
+    assert positions == list(range(5))+list(range(45, 60))
+    # identical puzzles: the first rating not before the line
+    checksum = puzzleChecksum(*knightFork)
+    assert [ratings.find(index, checksum) for index in [0, 20, 61, 62, 100]] == [60, 60, 61, 62, 62]
+    assert ratings.find(0, puzzleChecksum(mateInOne["FEN"], "")) is None
+
+
+def testNewPuzzlesAreOrderedAndFilteredByTheirRatings(series):
+    ratePuzzles(series, processes=1, useEngine=False)
+    # mate and fork have the same difficulty, the rating of the puzzle without solution is meaningless
+    for (specification, expected) in [("easy", [{0, 2}, {1}, {3}]), ("hard", [{1}, {0, 2}, {3}]), ("mate", [{0}]),
+                                      ("hard,fork,quiet", [{1}, {2}])]:
+        selection = NewPuzzleSelection.fromSpecification(series, specification)
+        order = [puzzle.index for puzzle in ScheduledPuzzleCollection(series, newPuzzleSelection=selection)]
+        groups = []
+        for group in expected:
+            groups.append(set(order[:len(group)]))
+            order = order[len(group):]
+        assert (groups, order) == (expected, [])
+    selection = NewPuzzleSelection.fromSpecification(series, "easy")
+    assert selection.key(3, puzzleChecksum(rookPositions(1)[0], "")) == maxDifficulty+1
+    assert selection.key(1, puzzleChecksum(*quietMove)) == 200
+    with pytest.raises(ValueError):
+        NewPuzzleSelection.fromSpecification(series, "easy,pin")
@@ -0,0 +1,52 @@
+import random
+from PuzzleScheduler import CalendarQueue
+
+
+def filledQueue():
+    random.seed(4)
+    calendarQueue = CalendarQueue()
+    for index in range(300):
+        calendarQueue.push(100+index % 7, index)
+    return calendarQueue
+
+
+def testPuzzlesArePoppedByDay():
+    calendarQueue = filledQueue()
+    assert len(calendarQueue) == 300
+    days = []
+    while True:
+        index = calendarQueue.popDue(103)
+        if index is None:
+            break
+        days.append(100+index % 7)
+    assert days == sorted(days)
+    assert len(days) == len([index for index in range(300) if index % 7 <= 3])
+    assert len(calendarQueue) == 300-len(days)
+    assert calendarQueue.peek(103) is None
+    assert calendarQueue.popDue(104) % 7 == 4
+
+
+def testPeekAndDueAgreeWithPopDue():
+    calendarQueue = filledQueue()
+    calendarQueue.push(101, 1000) # pushed into a bucket which is already shuffled
+    due = calendarQueue.due(102)
+    popped = []
+    while calendarQueue.peek(102) is not None:
+        index = calendarQueue.peek(102)
+        assert calendarQueue.popDue(102) == index
+        popped.append(index)
+        if len(popped) == 20:
+            calendarQueue.push(102, 2000)
+            due.append(2000)
+    assert sorted(popped) == sorted(due)
+    assert popped[:20] == due[:20]
+    assert 1000 in popped
+
+
+def testBucketsAreShuffled():
+    calendarQueue = CalendarQueue()
+    for index in range(100):
+        calendarQueue.push(5, index)
+    order = [calendarQueue.popDue(5) for index in range(100)]
+    assert sorted(order) == list(range(100))
+    assert order != list(range(100)) and order != list(reversed(range(100)))
@@ -0,0 +1,55 @@
+import os
+import datetime
+import chess
+import pygame
+from conftest import mateInOne, puzzleLine, rookPositions
+from MyChessBoard import MyChessBoard
+from PuzzleSheetRenderer import renderPuzzles, caption
+
+
+def pixels(surface):
+    return pygame.image.tostring(surface, "RGB")
+
+
+def testDiagramsShowThePositions(tmp_path, writeSeries):
+    positions = rookPositions(6)
+    filename = writeSeries([puzzleLine(fen) for fen in positions*10]+[puzzleLine(mateInOne["FEN"])])
+    renderer = MyChessBoard(80, chess.Board(), None)
+    for processes in [1, 2]:
+        folder = str(tmp_path/("diagrams"+str(processes)))
+        (boards, seconds) = renderPuzzles(filename, folder, boardSize=80, processes=processes)
+        assert boards == 61 and len(os.listdir(folder)) == 61
+        for index in [0, 5, 59, 60]:
+            image = pygame.image.load(os.path.join(folder, "puzzle-"+str(index)+".png"))
+            fen = mateInOne["FEN"] if index == 60 else positions[index % 6]
+            assert pixels(image) == pixels(renderer.renderBoard(chess.Board(fen)))
+
+
+def testSheetsHoldColumnsTimesRowsBoards(tmp_path, writeSeries):
+    filename = writeSeries([puzzleLine(fen) for fen in rookPositions(6)]+[puzzleLine(mateInOne["FEN"])])
+    folder = str(tmp_path/"sheets")
+    assert renderPuzzles(filename, folder, sheet=True, boardSize=100, columns=2, rows=2, processes=1)[0] == 7
+    assert sorted(os.listdir(folder)) == ["sheet-0001.png", "sheet-0002.png"]
+    captionHeight = pygame.font.Font(None, 12).get_linesize()+5
+    assert pygame.image.load(os.path.join(folder, "sheet-0001.png")).get_size() == \
+        (2*100+3*10, 2*(100+captionHeight)+3*10)
+
+
+def testOnlyDuePuzzlesAreRendered(tmp_path, writeSeries):
+    today = datetime.date.today()
+    reviewed = [[str(today-datetime.timedelta(days=1)), 10.0]]
+    puzzles = [puzzleLine(fen, previousSolvingTimes=reviewed, level=2, lastReview=reviewed[0][0])
+               for fen in rookPositions(2)]
+    puzzles += [puzzleLine(mateInOne["FEN"], previousSolvingTimes=[[str(today-datetime.timedelta(days=30)), 9.0]],
+                           level=1, lastReview=str(today-datetime.timedelta(days=30)))]
+    filename = writeSeries(puzzles)
+    folder = str(tmp_path/"due")
+    assert renderPuzzles(filename, folder, due=True, processes=1)[0] == 1
+    assert os.listdir(folder) == ["puzzle-2.png"]
+    assert renderPuzzles(filename, folder, due=True, processes=1, limit=0)[0] == 0
+
+
+def testCaptionNamesTheSideToMove():
+    assert caption(3, {"FEN": mateInOne["FEN"], "description": "Mate in one"}) == "#3  Mate in one"
+    assert caption(4, {"FEN": mateInOne["FEN"].replace(" w ", " b ")}) == "#4  Black to move"
+    assert caption(5, {"FEN": mateInOne["FEN"], "description": ""}) == "#5  White to move"
@@ -0,0 +1,110 @@
+import io
+import os
+import random
+import datetime
+import numpy
+from conftest import puzzleLine, rookPositions
+from PuzzleCollection import ReviewSchedule, ScheduledPuzzleCollection
+from PuzzleStatistics import SolvingHistory, writeCsvReport, writeTextReport
+from SqlitePuzzleCollection import migrateSeriesFile
+
+
+def randomHistories(number):
+    random.seed(14)
+    histories = []
+    for puzzle in range(number):
+        day = datetime.date(2020, 1, 1).toordinal()
+        history = []
+        for result in range(random.randrange(0, 9)):
+            day += random.randrange(1, 20)
+            history.append([str(datetime.date.fromordinal(day)),
+                            random.choice(["not solved", 5.0, 60.0, 120.0, 121.0, 400.0])])
+        histories.append(history)
+    return histories
+
+
+def testVectorizedLevelsEqualTheSchedule():
+    histories = randomHistories(300)
+    rows = [(puzzle, datetime.date.fromisoformat(date).toordinal(), numpy.nan if solved == "not solved" else solved)
+            for (puzzle, history) in enumerate(histories) for (date, solved) in history]
+    history = SolvingHistory(*zip(*rows))
+    reviewSchedule = ReviewSchedule()
+    presented = [puzzle for puzzle in range(300) if histories[puzzle] != []]
+    (levels, lastReviews, numbersOfResults) = history.currentState()
+    assert levels.tolist() == [reviewSchedule.getLevel(histories[puzzle]) for puzzle in presented]
+    assert numbersOfResults.tolist() == [len(histories[puzzle]) for puzzle in presented]
+    assert [str(datetime.date.fromordinal(day)) for day in lastReviews] == \
+        [histories[puzzle][-1][0] for puzzle in presented]
+    assert history.levels.tolist() == [reviewSchedule.getLevel(histories[puzzle][:position])
+                                       for puzzle in presented for position in range(len(histories[puzzle]))]
+
+
+def smallSeries(writeSeries):
+    """
+    The journal adds a result to line 0 and removes line 2, the dates are written in different formats
+    """
+    fens = rookPositions(4)
+    filename = writeSeries([puzzleLine(fens[0], previousSolvingTimes=[["2020-1-5", 10.0], ["2020-01-07", 200.0]]),
+                            puzzleLine(fens[1], previousSolvingTimes=[["2020-01-05", "not solved"]]),
+                            puzzleLine(fens[2], previousSolvingTimes=[["2020-01-06", 20.0]]),
+                            puzzleLine(fens[3])])
+    puzzleCollection = ScheduledPuzzleCollection(filename)
+    puzzleCollection.getPuzzle(0).markPuzzleAsSolvedIncorrectly()
+    puzzleCollection.currentChessPuzzle = puzzleCollection.getPuzzle(2)
+    puzzleCollection.removeCurrentPuzzleFromCollection()
+    puzzleCollection.savePuzzlesIntoFile()
+    return filename
+
+
+def testSeriesFileIsReadWithItsJournal(writeSeries):
+    filename = smallSeries(writeSeries)
+    files = dict((name, os.stat(os.path.join(os.path.dirname(filename), name)).st_mtime_ns)
+                 for name in os.listdir(os.path.dirname(filename)))
+    history = SolvingHistory.fromSeriesFile(filename)
+    assert dict((name, os.stat(os.path.join(os.path.dirname(filename), name)).st_mtime_ns)
+                for name in os.listdir(os.path.dirname(filename))) == files # nothing was written
+    assert history.numberOfPuzzles == 3
+    assert history.puzzles.tolist() == [0, 0, 0, 1]
+    assert history.days.tolist()[:2] == [737429, 737431]
+    assert history.days[2] == datetime.date.today().toordinal()
+    assert numpy.isnan(history.solvingTimes[[2, 3]]).all()
+    assert history.currentState()[0].tolist() == [0, 0]
+    assert history.dailyWorkload()[:2] == [(datetime.date(2020, 1, 5), 2, 1, 10.0),
+                                           (datetime.date(2020, 1, 7), 1, 1, 200.0)]
+
+
+def testNewSeriesFileIsNotTouched(writeSeries):
+    filename = writeSeries([puzzleLine(fen) for fen in rookPositions(3)])
+    history = SolvingHistory.fromSeriesFile(filename)
+    assert (len(history), history.numberOfPuzzles) == (0, 3)
+    assert sorted(os.listdir(os.path.dirname(filename))) == ["series1", "series1.idx"]
+    writeTextReport(history, io.StringIO())
+
+
+def testDatabaseGivesTheSameHistory(writeSeries, tmp_path):
+    filename = smallSeries(writeSeries)
+    migrateSeriesFile(filename, str(tmp_path/"puzzles.sqlite"))
+    (fromFile, fromDatabase) = (SolvingHistory.fromSeriesFile(filename),
+                                SolvingHistory.fromDatabase(str(tmp_path/"puzzles.sqlite")))
+    assert fromDatabase.numberOfPuzzles == fromFile.numberOfPuzzles
+    assert fromDatabase.days.tolist() == fromFile.days.tolist()
+    numpy.testing.assert_array_equal(fromDatabase.solvingTimes, fromFile.solvingTimes)
+    assert fromDatabase.levels.tolist() == fromFile.levels.tolist()
+
+
+def testReports():
+    rows = [(1, 100, 10.0), (1, 101, 200.0), (1, 103, 20.0), (1, 110, 300.0), (2, 100, numpy.nan), (2, 101, 50.0)]
+    history = SolvingHistory(*zip(*rows))
+    assert history.levels.tolist() == [1, 2, 2, 3, 1, 0]
+    assert history.retentionPerLevel() == [(0, 1, 1.0, 1.0, 50.0), (2, 2, 1.0, 0.5, 110.0), (3, 1, 1.0, 0.0, 300.0)]
+    assert history.tresholdCrossings() == [(1, 3, 4, 132.5)]
+    (percentiles, buckets) = history.solvingTimeDistribution()
+    assert dict(buckets) == {"<=10s": 1, "10-30s": 1, "30-60s": 1, "60-120s": 0, "120-300s": 2, ">300s": 0,
+                             "not solved": 1}
+    text = io.StringIO()
+    writeTextReport(history, text)
+    assert "puzzle 1: 3 crossings" in text.getvalue()
+    table = io.StringIO()
+    writeCsvReport(history, table)
+    assert table.getvalue().splitlines()[0].split(",")[0] == "retention"
+    assert [reviews for (day, reviews, solved, seconds) in history.dailyWorkload()] == [2, 2, 1, 1]
@@ -0,0 +1,58 @@
+import os
+import pytest
+from PuzzleStore import IndexedPuzzleFile
+
+
+def testLinesAreReadByNumber(tmp_path):
+    filename = str(tmp_path/"series1")
+    with open(filename, 'w') as seriesFile:
+        seriesFile.write('{"n": 0}\n\n  \n{"n": 1}\n{"n": "ä"}') # empty lines, no newline at the end
+    puzzleFile = IndexedPuzzleFile(filename)
+    assert len(puzzleFile) == 3
+    assert [puzzleFile.readLine(i) for i in [2, 0, 1]] == ['{"n": "ä"}', '{"n": 0}', '{"n": 1}']
+    assert list(puzzleFile) == ['{"n": 0}', '{"n": 1}', '{"n": "ä"}']
+    with pytest.raises(IndexError):
+        puzzleFile.readLine(3)
+    puzzleFile.close()
+
+
+def testEmptyFile(tmp_path):
+    filename = str(tmp_path/"series1")
+    open(filename, 'w').close()
+    puzzleFile = IndexedPuzzleFile(filename)
+    assert len(puzzleFile) == 0
+    assert list(puzzleFile) == []
+    puzzleFile.close()
+
+
+def testIndexIsKeptWhileTheFileIsUnchanged(writeSeries):
+    filename = writeSeries(['{"n": %d}' % i for i in range(5)])
+    IndexedPuzzleFile(filename).close()
+    indexTime = os.stat(filename+".idx").st_mtime_ns
+    os.utime(filename+".idx", ns=(indexTime-10**9, indexTime-10**9))
+    IndexedPuzzleFile(filename).close()
+    assert os.stat(filename+".idx").st_mtime_ns == indexTime-10**9
+
+
+def testIndexIsRebuiltAfterTheFileChanged(writeSeries):
+    filename = writeSeries(['{"n": %d}' % i for i in range(5)])
+    IndexedPuzzleFile(filename).close()
+    with open(filename, 'a') as seriesFile:
+        seriesFile.write('{"n": 5}\n')
+    puzzleFile = IndexedPuzzleFile(filename)
+    assert len(puzzleFile) == 6
+    assert puzzleFile.readLine(5) == '{"n": 5}'
+    puzzleFile.close()
+    writeSeries(['{"n": 7}'])
+    puzzleFile = IndexedPuzzleFile(filename)
+    assert list(puzzleFile) == ['{"n": 7}']
+    puzzleFile.close()
+
+
+def testMoreLinesThanOneChunk(writeSeries):
+    filename = writeSeries(['{"n": %d}' % i for i in range(70000)])
+    puzzleFile = IndexedPuzzleFile(filename)
+    assert len(puzzleFile) == 70000
+    assert puzzleFile.readLine(65535) == '{"n": 65535}'
+    assert puzzleFile.readLine(69999) == '{"n": 69999}'
+    puzzleFile.close()
@@ -0,0 +1,99 @@
+import os
+import json
+from conftest import puzzleLine, rookPositions
+from PuzzleCollection import PuzzleCollection
+from ResultJournal import ResultJournal
+
+positions = rookPositions(5)
+
+
+def seriesLines():
+    return [puzzleLine(fen) for fen in positions]
+
+
+def testResultsSurviveACrash(writeSeries):
+    filename = writeSeries(seriesLines())
+    puzzleCollection = PuzzleCollection(filename)
+    puzzleCollection.getPuzzle(1).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.getPuzzle(3).markPuzzleAsSolvedIncorrectly()
+    puzzleCollection.currentChessPuzzle = puzzleCollection.getPuzzle(2)
+    puzzleCollection.removeCurrentPuzzleFromCollection()
+    # no savePuzzlesIntoFile: the process dies here
+    with open(filename) as seriesFile:
+        assert seriesFile.read().splitlines() == seriesLines()
+
+    puzzleCollection = PuzzleCollection(filename)
+    assert len(puzzleCollection) == 4
+    assert puzzleCollection.removedPuzzles == {2}
+    assert 2 not in list(puzzleCollection.shuffledIndices())
+    assert len(puzzleCollection.getPuzzle(1).previousSolvingTimes) == 1
+    assert puzzleCollection.getPuzzle(3).previousSolvingTimes[0][1] == "not solved"
+    assert puzzleCollection.getPuzzle(0).previousSolvingTimes == []
+
+
+def testIncompleteLastRecordIsSkipped(writeSeries):
+    filename = writeSeries(seriesLines())
+    puzzleCollection = PuzzleCollection(filename)
+    puzzleCollection.getPuzzle(2).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.savePuzzlesIntoFile()
+    with open(filename+".journal", 'a') as journalFile:
+        journalFile.write('{"line": 4, "result": ["2020-01-0')
+    puzzleCollection = PuzzleCollection(filename)
+    assert puzzleCollection.journal.numberOfRecords == 1
+    assert len(puzzleCollection.getPuzzle(2).previousSolvingTimes) == 1
+    assert puzzleCollection.getPuzzle(4).previousSolvingTimes == []
+
+
+def testJournalOfAnotherVersionIsIgnored(writeSeries):
+    filename = writeSeries(seriesLines())
+    puzzleCollection = PuzzleCollection(filename)
+    puzzleCollection.getPuzzle(2).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.savePuzzlesIntoFile()
+    writeSeries(list(reversed(seriesLines())))
+    assert list(ResultJournal(filename, readOnly=True).records()) == []
+    puzzleCollection = PuzzleCollection(filename)
+    assert all(puzzleCollection.getPuzzle(index).previousSolvingTimes == [] for index in range(5))
+
+
+def testJournalStaysValidWhenPuzzlesAreAppended(writeSeries):
+    filename = writeSeries(seriesLines())
+    puzzleCollection = PuzzleCollection(filename)
+    puzzleCollection.getPuzzle(2).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.savePuzzlesIntoFile()
+    with open(filename, 'a') as seriesFile:
+        seriesFile.write(puzzleLine(rookPositions(6)[5])+"\n")
+    puzzleCollection = PuzzleCollection(filename)
+    assert len(puzzleCollection) == 6
+    assert len(puzzleCollection.getPuzzle(2).previousSolvingTimes) == 1
+
+
+def testCompactionFoldsTheJournalIntoTheSeriesFile(writeSeries):
+    filename = writeSeries(seriesLines())
+    puzzleCollection = PuzzleCollection(filename, compactAfter=3)
+    puzzleCollection.getPuzzle(0).markPuzzleAsSolvedCorrectly()
+    puzzleCollection.getPuzzle(4).markPuzzleAsSolvedIncorrectly()
+    puzzleCollection.savePuzzlesIntoFile()
+    assert puzzleCollection.journal.numberOfRecords == 2
+    puzzleCollection.currentChessPuzzle = puzzleCollection.getPuzzle(1)
+    puzzleCollection.removeCurrentPuzzleFromCollection()
+    puzzleCollection.savePuzzlesIntoFile()
+
+    assert puzzleCollection.journal.numberOfRecords == 0
+    with open(filename) as seriesFile:
+        puzzleDicts = [json.loads(line) for line in seriesFile]
+    assert [puzzleDict["FEN"] for puzzleDict in puzzleDicts] == positions[:1]+positions[2:]
+    assert len(puzzleDicts[0]["previousSolvingTimes"]) == 1
+    assert puzzleDicts[3]["previousSolvingTimes"][0][1] == "not solved"
+    assert puzzleDicts[1].get("previousSolvingTimes", []) == []
+    # the loaded puzzles got the lines of the compacted file
+    assert puzzleCollection.getPuzzle(3).FEN == positions[4]
+    assert list(ResultJournal(filename, readOnly=True).records()) == []
+    assert len(PuzzleCollection(filename)) == 4
+
+
+def testReadOnlyJournalCreatesNoFile(writeSeries):
+    filename = writeSeries(seriesLines())
+    journal = ResultJournal(filename, readOnly=True)
+    assert list(journal.records()) == []
+    journal.close()
+    assert not os.path.exists(filename+".journal")
@@ -0,0 +1,98 @@
+import json
+import datetime
+from conftest import mateInOne, puzzleLine, rookPositions
+from PuzzleCollection import ScheduledPuzzleCollection
+from SqlitePuzzleCollection import SqlitePuzzleCollection, exportSeriesFile, migrateSeriesFile
+
+
+def daysAgo(days):
+    return str(datetime.date.today()-datetime.timedelta(days=days))
+
+
+def seriesLines():
+    """
+    Lines 0 and 3 are due reviews, line 1 is solved but not due, lines 2 and 4 are new, line 5 is removed later
+    """
+    fens = rookPositions(6)
+    return [puzzleLine(fens[0], previousSolvingTimes=[[daysAgo(5), 10.0]], tags=["mate"], rating=1500),
+            puzzleLine(fens[1], previousSolvingTimes=[[daysAgo(1), 10.0]]),
+            json.dumps({"FEN": fens[2], "description": None, "level": 3, "tags": "mate"}), # unusual values
+            puzzleLine(fens[3], "1. Rd8#", previousSolvingTimes=[[daysAgo(3), 10.0], [daysAgo(2), "not solved"]]),
+            json.dumps({"FEN": fens[4], "PGN": "", "tags": ["fork", "pin"]}),
+            puzzleLine(fens[5])]
+
+
+def testMigrationKeepsEveryField(writeSeries, tmp_path):
+    seriesFilename = writeSeries(seriesLines())
+    puzzleCollection = ScheduledPuzzleCollection(seriesFilename)
+    puzzleCollection.getPuzzle(1).markPuzzleAsSolvedIncorrectly()
+    puzzleCollection.currentChessPuzzle = puzzleCollection.getPuzzle(5)
+    puzzleCollection.removeCurrentPuzzleFromCollection()
+    puzzleCollection.savePuzzlesIntoFile()
+    expected = [puzzleCollection.getPuzzleDict(index) for index in range(5)]
+    for puzzleDict in expected:
+        puzzleCollection.completePuzzleDict(puzzleDict)
+        puzzleDict.setdefault('previousSolvingTimes', [])
+
+    databaseFilename = str(tmp_path/"puzzles.sqlite")
+    assert migrateSeriesFile(seriesFilename, databaseFilename) == 5
+    assert exportSeriesFile(databaseFilename, str(tmp_path/"exported")) == 5
+    with open(str(tmp_path/"exported")) as exportedFile:
+        assert [json.loads(line) for line in exportedFile] == expected
+    assert expected[2]['description'] is None and expected[2]['level'] == 3
+
+
+def testDueReviewsArePresentedBeforeNewPuzzles(writeSeries, tmp_path):
+    databaseFilename = str(tmp_path/"puzzles.sqlite")
+    migrateSeriesFile(writeSeries(seriesLines()), databaseFilename)
+    sqliteCollection = SqlitePuzzleCollection(databaseFilename)
+    assert len(sqliteCollection) == 6
+    presented = []
+    for puzzle in sqliteCollection:
+        assert sqliteCollection.peekNextIndex() in [None]+[index for index in range(1, 7) if index not in presented]
+        presented.append(puzzle.index)
+        if puzzle.index == 4 and presented.count(4) == 1:
+            puzzle.markPuzzleAsSolvedIncorrectly()
+        else:
+            puzzle.markPuzzleAsSolvedCorrectly()
+    assert sorted(presented[:2]) == [1, 4]
+    assert presented[2] == 4 # not solved, so due again in the second pass
+    assert sorted(presented[3:]) == [3, 5, 6]
+    assert sqliteCollection.validateLevels() == []
+    sqliteCollection.close()
+
+    sqliteCollection = SqlitePuzzleCollection(databaseFilename)
+    assert [puzzle.index for puzzle in sqliteCollection] == []
+    assert len(sqliteCollection.getPuzzleDict(4)['previousSolvingTimes']) == 4
+    assert sqliteCollection.getPuzzleDict(4)['level'] == 1
+    sqliteCollection.close()
+
+
+def testUsersHaveTheirOwnHistory(writeSeries, tmp_path):
+    databaseFilename = str(tmp_path/"puzzles.sqlite")
+    migrateSeriesFile(writeSeries(seriesLines()), databaseFilename, user="anna")
+    sqliteCollection = SqlitePuzzleCollection(databaseFilename, user="ben")
+    assert sqliteCollection.getPuzzleDict(1)['previousSolvingTimes'] == []
+    puzzle = next(sqliteCollection)
+    puzzle.markPuzzleAsSolvedCorrectly()
+    sqliteCollection.currentChessPuzzle = sqliteCollection.getPuzzle(2)
+    sqliteCollection.removeCurrentPuzzleFromCollection()
+    assert len(sqliteCollection) == 5
+    sqliteCollection.close()
+    sqliteCollection = SqlitePuzzleCollection(databaseFilename, user="anna")
+    assert len(sqliteCollection) == 6
+    assert len(sqliteCollection.getPuzzleDict(puzzle.index)['previousSolvingTimes']) == \
+        len(json.loads(seriesLines()[puzzle.index-1]).get('previousSolvingTimes', []))
+    sqliteCollection.close()
+
+
+def testTagsSelectThePuzzles(writeSeries, tmp_path):
+    databaseFilename = str(tmp_path/"puzzles.sqlite")
+    migrateSeriesFile(writeSeries(seriesLines()), databaseFilename)
+    sqliteCollection = SqlitePuzzleCollection(databaseFilename, tags=["mate", "pin"])
+    presented = []
+    for puzzle in sqliteCollection:
+        presented.append(puzzle.index)
+        puzzle.markPuzzleAsSolvedCorrectly()
+    assert sorted(presented) == [1, 5] # the tags "mate" of line 2 are no list
+    sqliteCollection.close()
@@ -0,0 +1,29 @@
+import sys
+import os
+import subprocess
+from conftest import mateInOne, puzzleLine, rookPositions
+from Benchmarks import benchmarkStartup, startupScript
+
+trainer = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ChessPuzzleTrainer.py")
+
+
+def testFirstPuzzleIsShownWithoutDelay(writeSeries):
+    filename = writeSeries([puzzleLine(fen) for fen in rookPositions(6)]*20)
+    assert benchmarkStartup(filename, repetitions=1) < 5 # the trainer used to wait 10 seconds
+
+
+def testFirstPuzzleNeedsNeitherEngineNorAudio(tmp_path):
+    (tmp_path/"startup").mkdir()
+    (tmp_path/"startup"/"startup1").write_text(puzzleLine(mateInOne["FEN"], mateInOne["PGN"])+"\n")
+    # the state of the trainer is printed when the first puzzle is shown
+    script = startupScript.replace('flush=True)', 'flush=True)\n    import __main__, pygame.mixer\n'
+                                   '    print("engine", __main__.engineService.engine, "mixer",'
+                                   ' pygame.mixer.get_init(), "sqlite", "SqlitePuzzleCollection" in sys.modules,'
+                                   ' flush=True)')
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy",
+                       CHESS_ENGINE="/nonexistent/engine", CHESS_ANALYSIS_CACHE=str(tmp_path/"analysis.sqlite"))
+    environment.pop("CHESS_TRACE", None)
+    process = subprocess.run([sys.executable, "-c", script, trainer], input="startup\n", stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, cwd=str(tmp_path), env=environment, universal_newlines=True,
+                             timeout=60)
+    assert "engine None mixer None sqlite False" in process.stdout, process.stdout+process.stderr
@@ -0,0 +1,134 @@
+import json
+import asyncio
+import datetime
+import pytest
+from conftest import fakeEngine, mateInOne, puzzleLine, rookPositions
+from EngineService import EnginePool
+from SqlitePuzzleCollection import migrateSeriesFile
+from TrainingServer import TrainingServer
+
+
+@pytest.fixture
+def databaseFilename(writeSeries, tmp_path):
+    """
+    One puzzle with solution, one for the engine
+    """
+    filename = str(tmp_path/"puzzles.sqlite")
+    migrateSeriesFile(writeSeries([puzzleLine(mateInOne["FEN"], mateInOne["PGN"]), puzzleLine(rookPositions(1)[0])]),
+                      filename)
+    return filename
+
+
+@pytest.fixture
+def engineService():
+    engineService = EnginePool(2, fakeEngine, depth=2, multiPV=3)
+    yield engineService
+    engineService.quit()
+
+
+def request(server, path, **body):
+    return asyncio.run(server.dispatch("POST", path, json.dumps(body).encode("utf-8")))
+
+
+def testPuzzlesAreSolvedAndMarked(databaseFilename, engineService):
+    server = TrainingServer(databaseFilename, engineService)
+    today = datetime.date.today()
+    for i in range(2):
+        (status, puzzle) = request(server, "/next", user="anna")
+        assert status == 200
+        if puzzle["FEN"] == mateInOne["FEN"]: # a wrong move is answered with the expected one
+            assert request(server, "/move", user="anna", move="d1d7") == \
+                (200, {"correct": False, "played": ["d1d8"], "FEN": "3R2k1/5ppp/8/8/8/8/5PPP/6K1 b - - 1 1",
+                       "solved": False})
+            assert request(server, "/result", user="anna", solved=False) == (200, {"level": 0, "dueDate": str(today)})
+        else: # solved by the engine
+            answer = request(server, "/move", user="anna", move="a1a8")[1]
+            assert answer["correct"] and answer["played"][0] == "a1a8"
+            assert request(server, "/result", user="anna", solved=True) == \
+                (200, {"level": 2, "dueDate": str(today+datetime.timedelta(days=2))})
+    assert request(server, "/next", user="anna") == (200, {"done": True})
+
+    # other users have their own schedule
+    while request(server, "/next", user="ben")[1]["FEN"] != mateInOne["FEN"]:
+        request(server, "/result", user="ben", solved=True)
+    assert request(server, "/move", user="ben", move="d1d8") == \
+        (200, {"correct": True, "played": ["d1d8"], "FEN": "3R2k1/5ppp/8/8/8/8/5PPP/6K1 b - - 1 1", "solved": True})
+    server.close()
+
+
+def testInvalidRequests(databaseFilename, engineService):
+    server = TrainingServer(databaseFilename, engineService)
+    assert request(server, "/next")[0] == 400
+    assert request(server, "/move", user="anna", move="d1d8") == (400, {"error": "no current puzzle"})
+    assert request(server, "/result", user="anna", solved=True)[0] == 400
+    request(server, "/next", user="anna")
+    assert request(server, "/move", user="anna", move="nonsense") == (400, {"error": "invalid move nonsense"})
+    assert asyncio.run(server.dispatch("POST", "/next", b"[1]"))[0] == 400
+    assert asyncio.run(server.dispatch("GET", "/next", b""))[0] == 404
+    assert asyncio.run(server.dispatch("GET", "/status", b"")) == (200, {"sessions": 1, "requests": 0})
+    server.close()
+
+
+def testSessionsAreServedConcurrently(databaseFilename, engineService):
+    server = TrainingServer(databaseFilename, engineService)
+
+    async def train(user):
+        (status, puzzle) = await server.dispatch("POST", "/next", json.dumps({"user": user}).encode("utf-8"))
+        (status, answer) = await server.dispatch("POST", "/result",
+                                                 json.dumps({"user": user, "solved": False}).encode("utf-8"))
+        return answer["level"]
+
+    async def trainAll():
+        return await asyncio.gather(*[train("user"+str(i)) for i in range(20)])
+
+    assert asyncio.run(trainAll()) == [0]*20
+    assert len(server.sessions) == 20
+    assert all(session.pendingRequests == 0 for session in server.sessions.values())
+    server.close()
+
+
+def testIdleAndSurplusSessionsAreClosed(databaseFilename, engineService):
+    server = TrainingServer(databaseFilename, engineService, maxSessions=2)
+    for user in ["anna", "ben", "carl"]:
+        request(server, "/next", user=user)
+    assert list(server.sessions) == ["ben", "carl"]
+    request(server, "/next", user="ben")
+    request(server, "/next", user="dora")
+    assert list(server.sessions) == ["ben", "dora"]
+    server.idleSeconds = 0
+    request(server, "/next", user="anna") # anna's schedule is read from the database again
+    assert list(server.sessions) == ["anna"]
+    server.close()
+
+
+def testHttpConnectionIsKeptAlive(databaseFilename, engineService):
+    server = TrainingServer(databaseFilename, engineService)
+
+    async def exchange():
+        listener = await asyncio.start_server(server.handleConnection, "127.0.0.1", 0)
+        (reader, writer) = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+        responses = []
+        for (method, path, body) in [("POST", "/next", {"user": "anna"}), ("GET", "/status", None)]:
+            data = json.dumps(body).encode("utf-8") if body is not None else b""
+            writer.write((method+" "+path+" HTTP/1.1\r\nContent-Length: "+str(len(data))+"\r\n\r\n").encode("latin-1")
+                         + data)
+            statusLine = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line == b"\r\n":
+                    break
+                (name, value) = line.decode("latin-1").split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            responses.append((statusLine.split()[1], headers["connection"],
+                              json.loads(await reader.readexactly(int(headers["content-length"])))))
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return responses
+
+    ((nextStatus, nextConnection, puzzle), (statusStatus, statusConnection, status)) = asyncio.run(exchange())
+    assert (nextStatus, nextConnection, statusStatus, statusConnection) == (b"200", "keep-alive", b"200", "keep-alive")
+    assert "FEN" in puzzle
+    assert status == {"sessions": 1, "requests": 2}
+    server.close()
@@ -0,0 +1,48 @@
+import io
+import datetime
+import numpy
+from PuzzleCollection import ReviewSchedule
+from PuzzleStatistics import SolvingHistory
+from WorkloadSimulator import TrainingModel, forecast, intervalsOf, writeForecast
+
+alwaysSolved = TrainingModel(successRates=(1.0,), medianSeconds=10.0, sigma=1e-9, newPerDay=10)
+
+
+def testIntervalsOfTheSchedule():
+    reviewSchedule = ReviewSchedule()
+    reviewSchedule.schedule = {1: 1, 2: 3, 4: 20}
+    assert intervalsOf(reviewSchedule).tolist() == [0, 1, 3, 20, 20]
+
+
+def testNewPuzzlesAreScheduledLikeTheTrainer():
+    history = SolvingHistory([], [], [], numberOfPuzzles=30)
+    (reviews, seconds) = forecast(history, model=alwaysSolved, days=14, runs=3, seed=1)
+    # solved at once: level 2 (due after 2 days), then level 3 (due after 10 days)
+    assert reviews.tolist() == [[10, 10, 20, 10, 10, 0, 0, 0, 0, 0, 0, 0, 10, 10]]*3
+    numpy.testing.assert_allclose(seconds, 10.0*reviews)
+
+
+def testUnsolvedPuzzlesArePresentedAgainTheSameDay():
+    history = SolvingHistory([], [], [], numberOfPuzzles=10)
+    neverSolved = TrainingModel(successRates=(0.0,), newPerDay=10)
+    (reviews, seconds) = forecast(history, model=neverSolved, days=3, runs=2, seed=1)
+    assert reviews.tolist() == [[10, 20, 20]]*2
+
+
+def testForecastStartsFromTheHistory():
+    today = datetime.date.today().toordinal()
+    # puzzle 0 is due today (level 2, reviewed 2 days ago), puzzle 1 is due in 10 days (level 3)
+    history = SolvingHistory([0, 1, 1], [today-2, today-1, today], [10.0, 10.0, 10.0], numberOfPuzzles=2)
+    (reviews, seconds) = forecast(history, model=alwaysSolved, days=11, runs=1)
+    assert reviews.tolist() == [[1]+[0]*9+[2]]
+
+
+def testBatchesAreReproducible():
+    history = SolvingHistory([], [], [], numberOfPuzzles=50)
+    results = [forecast(history, days=30, runs=8, processes=2, batchElements=100, seed=7) for i in range(2)]
+    assert results[0][0].shape == (8, 30)
+    numpy.testing.assert_array_equal(results[0][0], results[1][0])
+    assert len(set(map(tuple, results[0][0].tolist()))) > 1 # the runs differ
+    output = io.StringIO()
+    writeForecast(*results[0], output=output, csvFormat=True)
+    assert len(output.getvalue().splitlines()) == 31